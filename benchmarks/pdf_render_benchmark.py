@@ -0,0 +1,93 @@
+# benchmarks/pdf_render_benchmark.py
+"""
+Compare PDFProcessor render modes: pages/sec and peak RSS
+
+Each mode runs in a fresh process so peak RSS is not shared between runs.
+
+Usage:
+    python benchmarks/pdf_render_benchmark.py path/to/deck.pdf
+    python benchmarks/pdf_render_benchmark.py --synthetic-pages 40
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pymupdf  # noqa: E402
+
+from services.pdf_processor import PDFProcessor  # noqa: E402
+
+
+def build_synthetic_deck(path: str, pages: int) -> None:
+    """Write a 16:9 deck with text and filled shapes on every page"""
+    doc = pymupdf.open()
+    for i in range(pages):
+        page = doc.new_page(width=960, height=540)
+        page.insert_text((60, 90), f"Slide {i + 1}: Problem, solution and market", fontsize=32)
+        for j in range(6):
+            rect = pymupdf.Rect(60 + j * 140, 180, 180 + j * 140, 420 - j * 20)
+            page.draw_rect(rect, color=(0, 0, 0), fill=(j / 6, 0.4, 1 - j / 6))
+        page.insert_text((60, 480), "Lorem ipsum dolor sit amet " * 4, fontsize=14)
+    doc.save(path)
+    doc.close()
+
+
+def run_mode(pdf_path: str, render_mode: str, parallel: bool, queue: multiprocessing.Queue) -> None:
+    """Render the deck once in the given mode and report timings"""
+    processor = PDFProcessor(render_mode=render_mode)
+    with tempfile.TemporaryDirectory() as output_dir:
+        start_time = time.perf_counter()
+        image_paths = processor.convert_pdf_to_images(pdf_path, output_dir, parallel=parallel)
+        elapsed = time.perf_counter() - start_time
+
+    # ru_maxrss is reported in kilobytes on Linux; children cover pool workers
+    peak_rss_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    queue.put({
+        "mode": render_mode,
+        "pages": len(image_paths),
+        "seconds": elapsed,
+        "pages_per_second": len(image_paths) / elapsed if elapsed > 0 else 0.0,
+        "peak_rss_mb": peak_rss_kb / 1024
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_path", nargs="?", help="PDF deck to render")
+    parser.add_argument("--synthetic-pages", type=int, default=40, help="Pages in the generated deck when no PDF is given")
+    parser.add_argument("--parallel", action="store_true", help="Render with the process pool")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = args.pdf_path
+        if not pdf_path:
+            pdf_path = str(Path(work_dir) / "synthetic.pdf")
+            build_synthetic_deck(pdf_path, args.synthetic_pages)
+
+        ctx = multiprocessing.get_context("spawn")
+        results = []
+        for render_mode in PDFProcessor.RENDER_MODES:
+            queue = ctx.Queue()
+            process = ctx.Process(target=run_mode, args=(pdf_path, render_mode, args.parallel, queue))
+            process.start()
+            results.append(queue.get())
+            process.join()
+
+    print(f"{'mode':<12} {'pages':>6} {'seconds':>9} {'pages/sec':>10} {'peak RSS (MB)':>14}")
+    for result in results:
+        print(
+            f"{result['mode']:<12} {result['pages']:>6} {result['seconds']:>9.2f} "
+            f"{result['pages_per_second']:>10.2f} {result['peak_rss_mb']:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
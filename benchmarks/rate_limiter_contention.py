@@ -0,0 +1,137 @@
+# benchmarks/rate_limiter_contention.py
+"""
+Hammer GeminiRateLimiter from many concurrent callers and check admissions
+
+Every caller shares one Redis server and calls try_acquire in a loop until the
+run ends. Request weights are drawn at random. The limiter must never admit
+more than max(burst, max_weight) + elapsed / interval weighted request units,
+where interval = window / max_requests, and must admit some requests heavier
+than one unit.
+
+Runs against an in-process fakeredis server by default (pip install
+"fakeredis[lua]"), or a real server with --redis-url.
+
+Usage:
+    python benchmarks/rate_limiter_contention.py
+    python benchmarks/rate_limiter_contention.py --callers 100 --max-requests 20 --window-seconds 2
+    python benchmarks/rate_limiter_contention.py --redis-url redis://localhost:6379/15
+"""
+import argparse
+import logging
+import math
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import redis  # noqa: E402
+
+from services.rate_limiter import GeminiRateLimiter  # noqa: E402
+
+
+def make_client_factory(redis_url):
+    """Return a callable producing one client per caller, all on the same server"""
+    if redis_url:
+        return lambda: redis.Redis.from_url(redis_url)
+
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit('fakeredis is required without --redis-url: pip install "fakeredis[lua]"')
+
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeRedis(server=server)
+
+
+def run(args):
+    client_factory = make_client_factory(args.redis_url)
+    identifier = f"contention-{random.getrandbits(32):08x}"
+    window_minutes = args.window_seconds / 60
+
+    # Each caller gets its own client and limiter, as separate workers would
+    limiters = [
+        GeminiRateLimiter(client_factory(), args.max_requests, window_minutes, burst=args.burst)
+        for _ in range(args.callers)
+    ]
+    interval = limiters[0].emission_interval
+
+    admitted = []
+    errors = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(args.callers + 1)
+    stop = threading.Event()
+
+    def caller(limiter):
+        start_barrier.wait()
+        while not stop.is_set():
+            weight = random.randint(1, args.max_weight)
+            result = limiter.try_acquire(identifier, weight)
+            if "error" in result:
+                with lock:
+                    errors.append(result["error"])
+                return
+            if result["allowed"]:
+                with lock:
+                    admitted.append(weight)
+
+    threads = [threading.Thread(target=caller, args=(limiter,)) for limiter in limiters]
+    for thread in threads:
+        thread.start()
+
+    start_barrier.wait()
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    limiters[0].redis.delete(limiters[0]._get_key(identifier))
+
+    units = sum(admitted)
+    weighted_calls = sum(1 for weight in admitted if weight > 1)
+    # Capacity available over the run: the initial burst (or one request of the
+    # largest weight, admitted on a drained bucket) plus one unit per interval
+    allowed_units = max(args.burst, args.max_weight) + math.floor(elapsed / interval)
+
+    print(f"callers:          {args.callers}")
+    print(f"limit:            {args.max_requests} per {args.window_seconds:g}s (burst {args.burst})")
+    print(f"run time:         {elapsed:.2f}s")
+    print(f"admitted calls:   {len(admitted)}")
+    print(f"admitted units:   {units} (upper bound {allowed_units})")
+    print(f"weighted calls:   {weighted_calls}")
+
+    if errors:
+        print(f"FAIL: limiter failed open: {errors[0]}")
+        return 1
+    if units > allowed_units:
+        print("FAIL: over-admission")
+        return 1
+    if args.max_weight > 1 and not weighted_calls:
+        print("FAIL: no request with weight > 1 was admitted")
+        return 1
+    print("OK: no over-admission, weighted requests admitted")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=100, help="Concurrent callers")
+    parser.add_argument("--max-requests", type=int, default=20, help="Requests allowed per window")
+    parser.add_argument("--window-seconds", type=float, default=2.0, help="Window length in seconds")
+    parser.add_argument("--burst", type=int, default=1, help="Burst tolerance in requests")
+    parser.add_argument("--max-weight", type=int, default=3, help="Largest request weight to draw")
+    parser.add_argument("--duration", type=float, default=5.0, help="Run time in seconds")
+    parser.add_argument("--redis-url", help="Use a real Redis server instead of fakeredis")
+    args = parser.parse_args()
+
+    # Rejections are expected here; keep the per-call warnings out of the report
+    logging.getLogger("services.rate_limiter").setLevel(logging.ERROR)
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
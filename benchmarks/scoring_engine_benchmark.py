@@ -0,0 +1,106 @@
+# benchmarks/scoring_engine_benchmark.py
+"""
+Re-score a whole domain: per-submission Python arithmetic vs the NumPy engine
+
+Generates N evaluations (criteria scores plus flow/completeness/consistency),
+then computes weighted totals, bonuses, penalties, normalized scores and
+ranks with:
+    per_submission: the dict arithmetic calculate_score_task ran once per
+        submission, followed by a sort for ranks
+    score_batch: services/scoring_engine.py in one vectorized pass
+and checks that both give the same final scores.
+
+Usage:
+    python benchmarks/scoring_engine_benchmark.py
+    python benchmarks/scoring_engine_benchmark.py --submissions 10000 --criteria 8
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.scoring_engine import score_batch  # noqa: E402
+
+
+def per_submission(evaluations, weights):
+    """Previous per-submission scoring, then ranks from a sort"""
+    final_scores = []
+    max_possible = 10.0 * sum(weights.values())
+    for breakdown, flow, completeness, consistency in evaluations:
+        weighted_breakdown = {criterion: score * weights.get(criterion, 0.0) for criterion, score in breakdown.items()}
+        weighted_total = sum(weighted_breakdown.values())
+        bonus = 0.0
+        if flow and flow >= 8:
+            bonus += 0.5
+        if completeness and completeness >= 8:
+            bonus += 0.3
+        bonus = min(bonus, 1.0)
+        penalty = 0.0
+        if consistency and consistency < 5:
+            penalty = 1.0
+        elif consistency and consistency < 7:
+            penalty = 0.5
+        final_score = weighted_total + bonus - penalty
+        final_scores.append((final_score, (final_score / max_possible) * 100))
+
+    order = sorted(range(len(final_scores)), key=lambda index: final_scores[index][0], reverse=True)
+    ranks = [0] * len(order)
+    percentiles = [0.0] * len(order)
+    for position, index in enumerate(order, 1):
+        ranks[index] = position
+        percentiles[index] = round(((len(order) - position + 1) / len(order)) * 100, 2)
+    return [score for score, _ in final_scores]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--submissions", type=int, default=10000, help="Evaluated submissions in the domain")
+    parser.add_argument("--criteria", type=int, default=6, help="Judging criteria in the domain")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per method (best is reported)")
+    args = parser.parse_args()
+
+    random.seed(11)
+    criteria = [f"criterion_{i}" for i in range(args.criteria)]
+    weights = {criterion: 1.0 / args.criteria for criterion in criteria}
+    quality = [None, 0, 4, 6, 7, 8, 9]
+    evaluations = [
+        (
+            {criterion: random.randint(1, 10) for criterion in criteria},
+            random.choice(quality), random.choice(quality), random.choice(quality)
+        )
+        for _ in range(args.submissions)
+    ]
+    breakdowns = [evaluation[0] for evaluation in evaluations]
+    flow = [evaluation[1] for evaluation in evaluations]
+    completeness = [evaluation[2] for evaluation in evaluations]
+    consistency = [evaluation[3] for evaluation in evaluations]
+
+    timings = {}
+    for name, method in (
+        ("per_submission", lambda: per_submission(evaluations, weights)),
+        ("score_batch", lambda: score_batch(breakdowns, weights, flow, completeness, consistency)["final_score"])
+    ):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            result = method()
+            best = min(best, time.perf_counter() - start_time)
+        timings[name] = (best, result)
+
+    print(f"{args.submissions} submissions x {args.criteria} criteria")
+    print(f"{'method':<16} {'ms':>9}")
+    for name, (seconds, _) in timings.items():
+        print(f"{name:<16} {seconds * 1000:>9.2f}")
+
+    expected = timings["per_submission"][1]
+    actual = timings["score_batch"][1].tolist()
+    if any(abs(a - b) > 1e-9 for a, b in zip(expected, actual)):
+        raise SystemExit("Final scores differ")
+    print("Final scores match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# benchmarks/slide_hash_benchmark.py
+"""
+Perceptual hash (dHash) throughput on large decks
+
+Renders a deck once, then measures:
+    in_memory: dHash of decoded slides, the cost added to rasterization
+    grayscale_first: the same hash converting the full-size slide to grayscale
+        before shrinking it (reference for the box-filter-first implementation)
+    from_files: open, decode and hash every slide (decks without recorded hashes)
+    from_manifest: read the hashes recorded at rasterization
+    collapse: find identical slides in the deck before a Gemini call
+
+Usage:
+    python benchmarks/slide_hash_benchmark.py --synthetic-pages 300 --repeat-every 4
+    python benchmarks/slide_hash_benchmark.py path/to/deck.pdf
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pymupdf  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from services.pdf_processor import PDFProcessor, MANIFEST_FILENAME  # noqa: E402
+from services.perceptual_hash import difference_hash  # noqa: E402
+from services.slide_budget import SlideBudgeter  # noqa: E402
+
+
+def build_synthetic_deck(path: str, pages: int, repeat_every: int) -> None:
+    """Write a 16:9 deck where every `repeat_every`-th page repeats the title slide"""
+    doc = pymupdf.open()
+    for i in range(pages):
+        page = doc.new_page(width=960, height=540)
+        if repeat_every and i > 0 and i % repeat_every == 0:
+            page.insert_text((60, 270), "Team Name - Hackathon 2026", fontsize=40)
+            continue
+        page.insert_text((60, 90), f"Slide {i + 1}: Problem, solution and market", fontsize=32)
+        for j in range(6):
+            rect = pymupdf.Rect(60 + j * 140, 180, 180 + j * 140, 420 - j * 20 - (i % 7) * 5)
+            page.draw_rect(rect, color=(0, 0, 0), fill=(j / 6, 0.4, 1 - j / 6))
+        page.insert_text((60, 480), "Lorem ipsum dolor sit amet " * 4, fontsize=14)
+    doc.save(path)
+    doc.close()
+
+
+def grayscale_first_hash(img: Image.Image, hash_size: int = 8) -> int:
+    """dHash converting the full-size image to grayscale before resizing"""
+    pixels = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR).tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (1 if pixels[offset + col] > pixels[offset + col + 1] else 0)
+    return value
+
+
+def timed(name: str, count: int, action) -> dict:
+    start_time = time.perf_counter()
+    result = action()
+    elapsed = time.perf_counter() - start_time
+    return {
+        "name": name,
+        "slides": count,
+        "seconds": elapsed,
+        "slides_per_second": count / elapsed if elapsed > 0 else float("inf"),
+        "result": result
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_path", nargs="?", help="PDF deck to hash")
+    parser.add_argument("--synthetic-pages", type=int, default=300, help="Pages in the generated deck when no PDF is given")
+    parser.add_argument("--repeat-every", type=int, default=4, help="Repeat the title slide every N pages of the generated deck")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = args.pdf_path
+        if not pdf_path:
+            pdf_path = str(Path(work_dir) / "synthetic.pdf")
+            build_synthetic_deck(pdf_path, args.synthetic_pages, args.repeat_every)
+
+        slides_dir = Path(work_dir) / "slides"
+        slides_dir.mkdir()
+        image_paths = PDFProcessor().convert_pdf_to_images(pdf_path, str(slides_dir))
+        count = len(image_paths)
+
+        images = []
+        for image_path in image_paths:
+            with Image.open(image_path) as img:
+                img.load()
+                images.append(img)
+        print(f"{count} slides of {images[0].width}x{images[0].height}")
+
+        results = [
+            timed("in_memory", count, lambda: [difference_hash(img) for img in images]),
+            timed("grayscale_first", count, lambda: [grayscale_first_hash(img) for img in images]),
+            timed("from_manifest", count, lambda: PDFProcessor.load_slide_dhashes(str(slides_dir)))
+        ]
+
+        manifest_path = slides_dir / MANIFEST_FILENAME
+        os.rename(manifest_path, slides_dir / "manifest.bak")
+        results.append(timed("from_files", count, lambda: PDFProcessor.load_slide_dhashes(str(slides_dir))))
+        os.rename(slides_dir / "manifest.bak", manifest_path)
+
+        slides = [
+            {"path": path, "sha256": sha256, "dhash": dhash, "number": number}
+            for number, (path, sha256, dhash) in enumerate(zip(
+                image_paths,
+                PDFProcessor.load_slide_hashes(str(slides_dir)),
+                PDFProcessor.load_slide_dhashes(str(slides_dir))
+            ), 1)
+        ]
+        collapse = timed("collapse", count, lambda: SlideBudgeter(collapse_identical=True).collapse(slides))
+        results.append(collapse)
+
+        print(f"{'stage':<16} {'slides':>7} {'seconds':>9} {'slides/s':>10}")
+        for result in results:
+            print(f"{result['name']:<16} {result['slides']:>7} {result['seconds']:>9.3f} {result['slides_per_second']:>10.1f}")
+
+        kept, collapsed = collapse["result"]
+        print(f"Identical slides collapsed: {len(collapsed)} of {count} ({len(kept)} would be sent)")
+
+
+if __name__ == "__main__":
+    main()
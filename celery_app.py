@@ -3,6 +3,7 @@ from celery import Celery
 import os
 import redis
 from kombu import Queue
+from celery.signals import celeryd_init
 import logging
 
 # Configure logging
@@ -14,6 +15,17 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", REDIS_URL)
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", REDIS_URL)
 
+# Default worker concurrency per queue. PDF rasterization is CPU-bound and
+# scales with cores, while evaluation is bound by the Gemini quota, so each
+# queue is meant to be served by its own worker (celery worker -Q <queue>).
+# Evaluation workers wait on the admission scheduler without holding quota, so
+# enough of them are needed to cover Gemini latency at the allowed rate
+QUEUE_CONCURRENCY = {
+    "processing": int(os.getenv("PROCESSING_CONCURRENCY", os.cpu_count() or 1)),
+    "evaluation": int(os.getenv("EVALUATION_CONCURRENCY", 8)),
+    "scoring": int(os.getenv("SCORING_CONCURRENCY", 2)),
+}
+
 # Create Celery app
 celery_app = Celery(
     "hackathon_evaluation",
@@ -35,8 +47,9 @@ celery_app.conf.update(
     worker_prefetch_multiplier=1,
     task_acks_late=True,
     
-    # Rate limiting
-    task_default_rate_limit="10/m",  # 10 tasks per minute
+    # Rate limiting: Gemini calls are paced by the admission scheduler
+    # (services/admission_scheduler.py), not by Celery task rate limits, so
+    # cache hits and waiting workers are never throttled by the broker
     
     # Retry settings
     task_default_retry_delay=60,
@@ -47,6 +60,7 @@ celery_app.conf.update(
         "celery_tasks.process_submission_task": {"queue": "processing"},
         "celery_tasks.calculate_rankings_task": {"queue": "scoring"},
         "celery_tasks.calculate_score_task": {"queue": "scoring"},
+        "celery_tasks.score_domain_task": {"queue": "scoring"},
     },
     
     # Define queues
@@ -59,4 +73,22 @@ celery_app.conf.update(
     # Monitoring
     worker_send_task_events=True,
     task_send_sent_event=True,
-)
\ No newline at end of file
+)
+
+
+@celeryd_init.connect
+def configure_queue_concurrency(sender=None, conf=None, options=None, **kwargs):
+    """
+    Apply the per-queue concurrency when a worker serves a single queue
+    and no explicit --concurrency was given
+    """
+    if options is None or options.get("concurrency"):
+        return
+    
+    queues = options.get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    
+    if len(queues) == 1 and queues[0] in QUEUE_CONCURRENCY:
+        conf.worker_concurrency = QUEUE_CONCURRENCY[queues[0]]
+        logger.info(f"Worker {sender} serving '{queues[0]}' with concurrency {conf.worker_concurrency}")
\ No newline at end of file
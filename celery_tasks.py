@@ -4,6 +4,7 @@ from celery import current_task
 from celery.exceptions import Retry
 from celery_app import celery_app
 from sqlalchemy.orm import Session
+import os
 import time
 import asyncio
 from pathlib import Path
@@ -17,6 +18,16 @@ from models import Submission, SubmissionEvaluation, SubmissionScore, Domain, Sy
 from services.pdf_processor import PDFProcessor
 from services.gemini_service import GeminiService
 from services.rate_limiter import GeminiRateLimiter
+from services.admission_scheduler import AdmissionScheduler, AdmissionTimeoutError
+from services.evaluation_queue import EvaluationJobQueue
+from services.slide_cache import SlideCache, hash_file
+from services.evaluation_cache import EvaluationResultCache
+from services.leaderboard import DomainLeaderboard, ranked_entries
+from services.scoring_engine import score_batch
+from services.ranking_writer import (
+    supports_window_updates, load_ranking_rows, write_rankings_window, write_rankings_bulk,
+    upsert_scores, complete_scored_submissions
+)
 import redis
 
 # Configure logging
@@ -27,7 +38,20 @@ logger = logging.getLogger(__name__)
 redis_client = redis.Redis(host='localhost', port=6379, db=0)
 rate_limiter = GeminiRateLimiter(redis_client)
 pdf_processor = PDFProcessor()
-gemini_service = GeminiService()
+gemini_service = GeminiService(redis_client)
+# Slots are granted at the per-key rate times the number of healthy keys
+admission_scheduler = AdmissionScheduler(redis_client, rate_limiter, capacity=gemini_service.key_pool.healthy_count)
+slide_cache = SlideCache(Path("storage") / "processed", redis_client)
+evaluation_cache = EvaluationResultCache(SessionLocal)
+
+# "celery" runs evaluations as Celery tasks; "async" hands them to
+# evaluation_worker.py, which keeps many evaluations in flight per process
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "celery")
+evaluation_queue = EvaluationJobQueue(redis_client)
+leaderboard = DomainLeaderboard(redis_client)
+
+# Per-process event loop, see run_async
+_event_loop = None
 
 @celery_app.task(bind=True, max_retries=3, default_retry_delay=60)
 def process_submission_task(self, submission_id: int):
@@ -55,8 +79,27 @@ def process_submission_task(self, submission_id: int):
 
         logger.info(f"Processing submission {submission_id}: {pdf_path}")
 
-        # Process PDF
-        image_paths = pdf_processor.convert_pdf_to_images(pdf_path, str(slides_dir))
+        # Reuse slides from an identical earlier upload, otherwise render the PDF
+        # using the domain's slide encoding profile
+        slide_encoding = submission.domain.slide_encoding
+        cache_key = slide_cache.cache_key(
+            submission.pdf_sha256 or hash_file(pdf_path), pdf_processor.render_settings(slide_encoding)
+        )
+        image_paths = slide_cache.fetch(cache_key, str(slides_dir))
+        
+        if not image_paths:
+            # Each slide arrives hashed and recorded in the manifest as soon as it renders
+            image_paths = []
+            for slide in pdf_processor.iter_slides(
+                pdf_path, str(slides_dir), encoding=slide_encoding, include_bytes=False
+            ):
+                image_paths.append(slide["path"])
+                logger.debug(
+                    f"Submission {submission_id}: slide {slide['slide']} rendered "
+                    f"({slide['bytes']} bytes, sha256 {slide['sha256'][:12]})"
+                )
+            if image_paths:
+                slide_cache.store(cache_key, str(slides_dir))
         
         if not image_paths:
             raise ValueError("No images generated from PDF")
@@ -66,7 +109,7 @@ def process_submission_task(self, submission_id: int):
         db.commit()
 
         # Queue for evaluation
-        evaluate_presentation_task.delay(submission_id)
+        queue_evaluation(submission_id)
 
         # Record processing time
         processing_time = time.time() - start_time
@@ -83,66 +126,86 @@ def process_submission_task(self, submission_id: int):
     except Exception as e:
         logger.error(f"Error processing submission {submission_id}: {str(e)}")
         
+        # Retry with exponential backoff; the submission stays "processing"
+        # until the retries run out, so batches don't count it as finished
+        if self.request.retries < self.max_retries:
+            retry_delay = 60 * (2 ** self.request.retries)
+            raise self.retry(countdown=retry_delay, exc=e)
+        
         # Update submission status
         if 'submission' in locals():
+            db.rollback()
             submission.status = "error"
             db.commit()
         
-        # Retry with exponential backoff
-        if self.request.retries < self.max_retries:
-            retry_delay = 60 * (2 ** self.request.retries)
-            raise self.retry(countdown=retry_delay, exc=e)
-        
         return {"status": "error", "message": str(e), "submission_id": submission_id}
     
     finally:
         db.close()
 
 
-@celery_app.task(bind=True, max_retries=5, default_retry_delay=120)
-def evaluate_presentation_task(self, submission_id: int):
+def run_async(coroutine):
     """
-    Comprehensive evaluation of a presentation using Gemini 2.5 Flash
-    Analyzes all slides together for narrative flow and coherence
+    Run a coroutine on this worker process's event loop
+    
+    The loop is created once per process and reused, so async clients bound to
+    it (the Gemini gRPC channels) survive from one task to the next.
     """
+    global _event_loop
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_event_loop)
+    return _event_loop.run_until_complete(coroutine)
+
+
+def queue_evaluation(submission_id: int, bypass_cache: bool = False):
+    """Send a submission to whichever evaluation worker mode is configured"""
+    if EVALUATION_MODE == "async":
+        evaluation_queue.push(submission_id, bypass_cache)
+    else:
+        evaluate_presentation_task.delay(submission_id, bypass_cache)
+
+
+def set_submission_status(submission_id: int, status: str):
+    """Update a submission's status in its own session"""
     db = SessionLocal()
-    start_time = time.time()
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    try:
+        db.query(Submission).filter(Submission.id == submission_id).update({"status": status})
+        db.commit()
+    except Exception as e:
+        logger.error(f"Error updating status of submission {submission_id}: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def load_evaluation_context(submission_id: int, bypass_cache: bool = False) -> Dict[str, Any]:
+    """
+    Load the slides, domain and any cached Gemini response for a submission
     
+    Returns:
+        Dictionary with the evaluation inputs, or with an "error" message
+    """
+    db = SessionLocal()
     try:
         # Get submission and domain
         submission = db.query(Submission).filter(Submission.id == submission_id).first()
         if not submission:
             logger.error(f"Submission {submission_id} not found")
-            return {"status": "error", "message": "Submission not found"}
+            return {"error": "Submission not found"}
 
         domain = db.query(Domain).filter(Domain.id == submission.domain_id).first()
         if not domain:
             logger.error(f"Domain {submission.domain_id} not found")
-            return {"status": "error", "message": "Domain not found"}
+            return {"error": "Domain not found"}
 
-        # Check rate limit using synchronous execution of async function
-        can_make_request = loop.run_until_complete(rate_limiter.can_make_request("gemini_api"))
-        if not can_make_request:
-            wait_time = loop.run_until_complete(rate_limiter.get_wait_time("gemini_api"))
-            logger.info(f"Rate limited. Retrying in {wait_time} seconds")
-            raise self.retry(countdown=wait_time)
-        
-        # Update submission status to evaluating
-        submission.status = "evaluating"
-        db.commit()
-
-        # Load all slide images
+        # Load all slide images in page order from the conversion manifest
         slides_dir = Path(submission.pdf_file_url).parent / "slides"
-        image_paths = list(slides_dir.glob("*.png"))
-        image_paths.sort()  # Ensure correct order
+        image_paths = pdf_processor.load_slide_paths(str(slides_dir))
 
         if not image_paths:
             raise ValueError("No slide images found for evaluation")
 
-        logger.info(f"Evaluating {len(image_paths)} slides for submission {submission_id}")
-
         # Create domain info dictionary
         domain_info = {
             "name": domain.name,
@@ -151,18 +214,46 @@ def evaluate_presentation_task(self, submission_id: int):
             "weight_distribution": domain.weight_distribution
         }
         
-        # Send to Gemini for comprehensive analysis using synchronous execution
-        gemini_response = loop.run_until_complete(gemini_service.analyze_complete_presentation(
-            image_paths=[str(path) for path in image_paths],
-            domain_info=domain_info
-        ))
+        # Reuse a stored evaluation of the same slides under the same prompt
+        slide_hashes = pdf_processor.load_slide_hashes(str(slides_dir))
+        cache_key = evaluation_cache.build_key(
+            slide_hashes,
+            gemini_service.evaluation_fingerprint(domain_info)
+        )
         
-        if not gemini_response:
-            raise ValueError("No response from Gemini service")
-            
+        gemini_response = None if bypass_cache else evaluation_cache.get(cache_key)
+        
+        return {
+            "domain_id": domain.id,
+            "image_paths": image_paths,
+            "slide_hashes": slide_hashes,
+            # Perceptual hashes are only needed when the slides are sent
+            "slide_dhashes": None if gemini_response else pdf_processor.load_slide_dhashes(str(slides_dir)),
+            "domain_info": domain_info,
+            "cache_key": cache_key,
+            "gemini_response": gemini_response
+        }
+    finally:
+        db.close()
+
+
+def store_evaluation(submission_id: int, gemini_response: Dict[str, Any], slide_count: int, start_time: float) -> int:
+    """
+    Save a Gemini evaluation, replacing any previous one, and mark the submission evaluated
+    
+    Returns:
+        ID of the new evaluation record
+    """
+    db = SessionLocal()
+    try:
         # Parse and validate response
         parsed_response = parse_gemini_response(gemini_response)
         
+        # Replace any previous evaluation (re-judging)
+        db.query(SubmissionEvaluation).filter(
+            SubmissionEvaluation.submission_id == submission_id
+        ).delete()
+        
         # Create evaluation record
         evaluation = SubmissionEvaluation(
             submission_id=submission_id,
@@ -172,7 +263,7 @@ def evaluate_presentation_task(self, submission_id: int):
             overall_feedback=parsed_response.get('detailed_feedback', {}).get('summary', ''),
             executive_summary=parsed_response.get('executive_summary', ''),
             processing_time_seconds=time.time() - start_time,
-            slide_count_analyzed=len(image_paths),
+            slide_count_analyzed=slide_count,
             presentation_flow_score=parsed_response.get('overall_analysis', {}).get('presentation_flow_score'),
             completeness_score=parsed_response.get('overall_analysis', {}).get('completeness_score'),
             consistency_score=parsed_response.get('overall_analysis', {}).get('consistency_score')
@@ -181,35 +272,140 @@ def evaluate_presentation_task(self, submission_id: int):
         db.add(evaluation)
         
         # Update submission status to evaluated (NOT completed yet)
-        submission.status = "evaluated"
+        db.query(Submission).filter(Submission.id == submission_id).update({"status": "evaluated"})
         db.commit()
         db.refresh(evaluation)
+        return evaluation.id
+    finally:
+        db.close()
+
+
+async def evaluate_submission(submission_id: int, bypass_cache: bool = False) -> Dict[str, Any]:
+    """
+    Comprehensive evaluation of a presentation using Gemini 2.5 Flash
+    Analyzes all slides together for narrative flow and coherence
+    
+    Shared by the Celery task and the asyncio evaluation worker. Database,
+    Redis and file work runs in threads so the event loop only ever waits on
+    Gemini, letting one process keep many evaluations in flight.
+    
+    Identical slides evaluated under an identical prompt are served from the
+    evaluation cache unless bypass_cache is set (forced re-judging).
+    
+    Raises:
+        AdmissionTimeoutError: No Gemini slot was granted in time (requeue, not a failure)
+    """
+    start_time = time.time()
+    
+    context = await asyncio.to_thread(load_evaluation_context, submission_id, bypass_cache)
+    if "error" in context:
+        return {"status": "error", "message": context["error"]}
+    
+    image_paths = context["image_paths"]
+    gemini_response = context["gemini_response"]
+    
+    if gemini_response:
+        logger.info(f"Using cached evaluation for submission {submission_id}")
+    else:
+        # Wait until the admission scheduler grants this submission a Gemini slot
+        # Map-reduce evaluations of large decks make several requests and weigh accordingly
+        lease = await asyncio.to_thread(
+            admission_scheduler.acquire, submission_id, context["domain_id"],
+            gemini_service.planned_requests(len(image_paths))
+        )
+        if not lease:
+            raise AdmissionTimeoutError(f"No Gemini slot granted to submission {submission_id}")
+    
+    # Update submission status to evaluating
+    await asyncio.to_thread(set_submission_status, submission_id, "evaluating")
+
+    logger.info(f"Evaluating {len(image_paths)} slides for submission {submission_id}")
+
+    if not gemini_response:
+        # Send to Gemini for comprehensive analysis. The lease already paid for
+        # the planned calls, so they do not wait on the per-key limiters again
+        with gemini_service.admitted_calls(lease["weight"]):
+            gemini_response = await gemini_service.analyze_complete_presentation(
+                image_paths=image_paths,
+                domain_info=context["domain_info"],
+                slide_hashes=context["slide_hashes"],
+                slide_dhashes=context["slide_dhashes"]
+            )
+        
+        if not gemini_response:
+            raise ValueError("No response from Gemini service")
+        
+        # Streaming timings of every Gemini call made for this evaluation
+        calls = gemini_response.get("metadata", {}).get("gemini_calls") or []
+        if calls:
+            call_metadata = {"submission_id": submission_id, "calls": len(calls)}
+            await asyncio.to_thread(
+                record_system_metric, "gemini_time_to_first_token",
+                sum(call["time_to_first_token_seconds"] for call in calls) / len(calls), "seconds", call_metadata
+            )
+            await asyncio.to_thread(
+                record_system_metric, "gemini_generation_time",
+                sum(call["generation_seconds"] for call in calls), "seconds", call_metadata
+            )
+        
+        await asyncio.to_thread(
+            evaluation_cache.put, context["cache_key"], gemini_response, gemini_service.model_name, len(image_paths)
+        )
+    
+    evaluation_id = await asyncio.to_thread(
+        store_evaluation, submission_id, gemini_response, len(image_paths), start_time
+    )
 
-        # Queue scoring calculation - THIS IS CRUCIAL
-        logger.info(f"Queueing score calculation for submission {submission_id}")
-        calculate_score_task.delay(submission_id)
+    # Queue scoring calculation - THIS IS CRUCIAL
+    logger.info(f"Queueing score calculation for submission {submission_id}")
+    await asyncio.to_thread(calculate_score_task.delay, submission_id)
 
-        logger.info(f"Evaluation completed for submission {submission_id}")
+    logger.info(f"Evaluation completed for submission {submission_id}")
 
-        # Record evaluation time
-        evaluation_time = time.time() - start_time
-        record_system_metric("evaluation_time", evaluation_time, "seconds",
-                           {"submission_id": submission_id, "slide_count": len(image_paths)})
+    # Record evaluation time
+    evaluation_time = time.time() - start_time
+    await asyncio.to_thread(
+        record_system_metric, "evaluation_time", evaluation_time, "seconds",
+        {"submission_id": submission_id, "slide_count": len(image_paths)}
+    )
 
-        return {
-            "status": "success",
-            "submission_id": submission_id,
-            "evaluation_id": evaluation.id,
-            "processing_time": evaluation_time
-        }
+    return {
+        "status": "success",
+        "submission_id": submission_id,
+        "evaluation_id": evaluation_id,
+        "processing_time": evaluation_time
+    }
 
+
+@celery_app.task(bind=True, max_retries=5, default_retry_delay=120)
+def evaluate_presentation_task(self, submission_id: int, bypass_cache: bool = False, admission_timeouts: int = 0):
+    """
+    Celery entry point for evaluate_submission
+    """
+    try:
+        return run_async(evaluate_submission(submission_id, bypass_cache))
+
+    except AdmissionTimeoutError as e:
+        # Waiting for a slot is not a failure, so it does not use up error retries,
+        # but a submission that keeps timing out is given up on
+        admission_timeouts += 1
+        requeue_delay = admission_scheduler.requeue_delay(admission_timeouts)
+        if requeue_delay is None:
+            logger.error(f"Error evaluating submission {submission_id}: {str(e)} ({admission_timeouts} times)")
+            set_submission_status(submission_id, "evaluation_error")
+            return {"status": "error", "message": str(e), "submission_id": submission_id}
+
+        logger.info(f"No Gemini slot for submission {submission_id}, requeueing in {requeue_delay} seconds")
+        raise self.retry(
+            countdown=requeue_delay,
+            max_retries=None,
+            kwargs={"submission_id": submission_id, "bypass_cache": bypass_cache, "admission_timeouts": admission_timeouts}
+        )
     except Exception as e:
         logger.error(f"Error evaluating submission {submission_id}: {str(e)}")
         
         # Update submission status
-        if 'submission' in locals():
-            submission.status = "evaluation_error"
-            db.commit()
+        set_submission_status(submission_id, "evaluation_error")
         
         # Retry with exponential backoff
         if self.request.retries < self.max_retries:
@@ -218,10 +414,6 @@ def evaluate_presentation_task(self, submission_id: int):
             raise self.retry(countdown=retry_delay, exc=e)
         
         return {"status": "error", "message": str(e), "submission_id": submission_id}
-    
-    finally:
-        db.close()
-        loop.close()
 
 
 @celery_app.task(bind=True, max_retries=3, default_retry_delay=30)
@@ -234,20 +426,23 @@ def calculate_score_task(self, submission_id: int):
     try:
         logger.info(f"Starting score calculation for submission {submission_id}")
         
-        # Get submission, evaluation, and domain
-        submission = db.query(Submission).filter(Submission.id == submission_id).first()
-        if not submission:
+        # Submission, evaluation, domain and any existing score in one query. The
+        # submission stays locked until commit, so score_domain_task waits for us
+        row = db.query(Submission, SubmissionEvaluation, Domain, SubmissionScore).outerjoin(
+            SubmissionEvaluation, SubmissionEvaluation.submission_id == Submission.id
+        ).outerjoin(
+            Domain, Domain.id == Submission.domain_id
+        ).outerjoin(
+            SubmissionScore, SubmissionScore.submission_id == Submission.id
+        ).filter(Submission.id == submission_id).with_for_update(of=Submission).first()
+        if not row:
             logger.error(f"Submission {submission_id} not found")
             return {"status": "error", "message": "Submission not found"}
 
-        evaluation = db.query(SubmissionEvaluation).filter(
-            SubmissionEvaluation.submission_id == submission_id
-        ).first()
+        submission, evaluation, domain, score_record = row
         if not evaluation:
             logger.error(f"Evaluation not found for submission {submission_id}")
             return {"status": "error", "message": "Evaluation not found"}
-
-        domain = db.query(Domain).filter(Domain.id == submission.domain_id).first()
         if not domain:
             logger.error(f"Domain {submission.domain_id} not found")
             return {"status": "error", "message": "Domain not found"}
@@ -257,38 +452,20 @@ def calculate_score_task(self, submission_id: int):
         if not criteria_scores:
             raise ValueError("No criteria scores found in evaluation")
 
+        # A batch of one, so single and domain-wide scoring agree exactly
+        scores = score_batch(
+            [criteria_scores], domain.weight_distribution,
+            [evaluation.presentation_flow_score], [evaluation.completeness_score], [evaluation.consistency_score]
+        )
+
         # Create or update score record
-        score_record = db.query(SubmissionScore).filter(
-            SubmissionScore.submission_id == submission_id
-        ).first()
-        
         if not score_record:
             score_record = SubmissionScore(submission_id=submission_id)
             db.add(score_record)
-
-        # Set basic scores
-        score_record.criteria_breakdown = criteria_scores
-        score_record.raw_total = sum(criteria_scores.values())
-
-        # Calculate weighted scores
-        weighted_total = score_record.calculate_weighted_total(domain.weight_distribution)
-        
-        # Add quality bonuses/penalties
-        presentation_bonus = calculate_presentation_bonus(evaluation)
-        consistency_penalty = calculate_consistency_penalty(evaluation)
-        
-        score_record.presentation_quality_bonus = presentation_bonus
-        score_record.consistency_penalty = consistency_penalty
-        
-        # Final adjusted score
-        final_score = weighted_total + presentation_bonus - consistency_penalty
-        score_record.weighted_total = final_score
-        
-        # Normalize to 100 scale (assuming max possible score is 10 * sum of weights)
-        max_possible = 10.0 * sum(domain.weight_distribution.values())
-        score_record.normalized_score = (final_score / max_possible) * 100 if max_possible > 0 else 0
-
-        db.commit()
+        for field, value in score_fields(criteria_scores, scores, 0).items():
+            setattr(score_record, field, value)
+        score_record.weights_version = domain.weights_version
+        final_score = score_record.weighted_total
         
         # Update submission with final scores and mark as completed
         submission.total_score = score_record.raw_total
@@ -297,9 +474,14 @@ def calculate_score_task(self, submission_id: int):
         submission.status = "completed"  # NOW we mark it as completed
         db.commit()
 
-        # Queue ranking calculation for the domain
-        logger.info(f"Queueing ranking calculation for domain {domain.id}")
-        calculate_rankings_task.delay(domain.id)
+        # O(log n) leaderboard update; ranks are readable immediately and the
+        # database copy is written back by the ranking task
+        leaderboard.record(domain.id, submission_id, final_score)
+        if leaderboard.request_write_back(domain.id):
+            logger.info(f"Queueing ranking write-back for domain {domain.id} in {leaderboard.debounce_seconds}s")
+            calculate_rankings_task.apply_async((domain.id,), countdown=leaderboard.debounce_seconds)
+        else:
+            logger.info(f"Ranking write-back already pending for domain {domain.id}")
 
         logger.info(f"Score calculated for submission {submission_id}: {final_score:.2f}")
 
@@ -319,35 +501,122 @@ def calculate_score_task(self, submission_id: int):
     finally:
         db.close()
 
-def calculate_presentation_bonus(evaluation: SubmissionEvaluation) -> float:
-    """
-    Calculate bonus points based on presentation quality metrics
-    """
-    base_bonus = 0.0
-    
-    # Add bonus for excellent flow
-    if evaluation.presentation_flow_score and evaluation.presentation_flow_score >= 8:
-        base_bonus += 0.5
-    
-    # Add bonus for completeness
-    if evaluation.completeness_score and evaluation.completeness_score >= 8:
-        base_bonus += 0.3
-    
-    return min(base_bonus, 1.0)  # Cap bonus at 1.0
+def score_fields(criteria_scores: Dict[str, float], scores: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """SubmissionScore column values for one submission of a score_batch result"""
+    return {
+        "criteria_breakdown": criteria_scores,
+        "raw_total": float(scores["raw_total"][index]),
+        "weighted_breakdown": scores["weighted_breakdowns"][index],
+        "presentation_quality_bonus": float(scores["bonus"][index]),
+        "consistency_penalty": float(scores["penalty"][index]),
+        # Final adjusted score
+        "weighted_total": float(scores["final_score"][index]),
+        "normalized_score": float(scores["normalized_score"][index])
+    }
 
-def calculate_consistency_penalty(evaluation: SubmissionEvaluation) -> float:
+@celery_app.task(bind=True, max_retries=3, default_retry_delay=30)
+def score_domain_task(self, domain_id: int, weights_version: Optional[int] = None):
     """
-    Calculate penalty points based on consistency issues
+    Score and rank every evaluated submission of a domain in one pass
+    Used when a domain's weights change; one query in, one bulk write out.
+    A run queued for weights_version is skipped once newer weights exist
+    (their own run re-scores the domain). The submissions are locked while
+    they are scored, and scores are upserted, so a concurrent
+    calculate_score_task cannot collide with the batch on the unique key.
     """
-    if not evaluation.consistency_score:
-        return 0.0
+    db = SessionLocal()
     
-    if evaluation.consistency_score < 5:
-        return 1.0
-    elif evaluation.consistency_score < 7:
-        return 0.5
+    try:
+        start_time = time.time()
+        logger.info(f"Starting batch scoring for domain {domain_id}")
+        
+        domain = db.query(Domain).filter(Domain.id == domain_id).first()
+        if not domain:
+            logger.error(f"Domain {domain_id} not found")
+            return {"status": "error", "message": "Domain not found"}
+        
+        if weights_version is not None and (domain.weights_version or 1) > weights_version:
+            logger.info(f"Skipping rescore of domain {domain_id}: weights version {weights_version} superseded")
+            return {"status": "skipped", "domain_id": domain_id, "weights_version": weights_version}
+        
+        rows = db.query(
+            Submission.id,
+            Submission.status,
+            SubmissionEvaluation.criteria_scores,
+            SubmissionEvaluation.presentation_flow_score,
+            SubmissionEvaluation.completeness_score,
+            SubmissionEvaluation.consistency_score
+        ).join(
+            SubmissionEvaluation, SubmissionEvaluation.submission_id == Submission.id
+        ).filter(
+            Submission.domain_id == domain_id,
+            Submission.status.in_(("evaluated", "completed"))
+        ).with_for_update(of=Submission).all()
+        rows = [row for row in rows if row.criteria_scores]
+        
+        if not rows:
+            logger.warning(f"No evaluated submissions found for domain {domain_id}")
+            return {"status": "success", "domain_id": domain_id, "submissions_scored": 0}
+        
+        scoring_start = time.perf_counter()
+        scores = score_batch(
+            [row.criteria_scores for row in rows], domain.weight_distribution,
+            [row.presentation_flow_score for row in rows],
+            [row.completeness_score for row in rows],
+            [row.consistency_score for row in rows]
+        )
+        scoring_seconds = time.perf_counter() - scoring_start
+        
+        score_rows = []
+        submission_rows = []
+        
+        for index, row in enumerate(rows):
+            fields = score_fields(row.criteria_scores, scores, index)
+            fields["ranking_position"] = int(scores["rank"][index])
+            fields["percentile_rank"] = float(scores["percentile"][index])
+            fields["weights_version"] = domain.weights_version
+            score_rows.append({"submission_id": row.id, **fields})
+            submission_rows.append({
+                "submission_id": row.id,
+                "total_score": fields["raw_total"],
+                "weighted_score": fields["weighted_total"],
+                "ranking_position": fields["ranking_position"]
+            })
+        
+        upsert_scores(db, score_rows)
+        submissions_completed = complete_scored_submissions(db, submission_rows, datetime.utcnow())
+        db.commit()
+        
+        try:
+            leaderboard.rebuild(domain_id, zip((row.id for row in rows), scores["final_score"].tolist()))
+        except Exception as e:
+            # The next ranking write-back rebuilds it from the database
+            logger.error(f"Error rebuilding leaderboard for domain {domain_id}: {str(e)}")
+        
+        total_seconds = time.time() - start_time
+        logger.info(
+            f"Batch scored {len(rows)} submissions in domain {domain_id}: "
+            f"{scoring_seconds * 1000:.1f}ms scoring, {total_seconds:.2f}s total"
+        )
+        
+        return {
+            "status": "success",
+            "domain_id": domain_id,
+            "weights_version": domain.weights_version,
+            "submissions_scored": len(rows),
+            "submissions_completed": submissions_completed,
+            "scoring_seconds": scoring_seconds,
+            "total_seconds": total_seconds
+        }
     
-    return 0.0
+    except Exception as e:
+        logger.error(f"Error batch scoring domain {domain_id}: {str(e)}")
+        if self.request.retries < self.max_retries:
+            raise self.retry(countdown=30 * (2 ** self.request.retries), exc=e)
+        return {"status": "error", "message": str(e)}
+    
+    finally:
+        db.close()
 
 def create_evaluation_prompt(domain: Domain) -> str:
     """
@@ -437,82 +706,85 @@ def record_system_metric(metric_name: str, value: float, unit: str, metadata: Di
     finally:
         db.close()
 
+def domain_standings(domain_id: int, scores: Dict[int, float]) -> List[Dict[str, Any]]:
+    """
+    Leaderboard standings for a domain, checked against its completed submissions
+    
+    The leaderboard is rebuilt when it has drifted from the database (Redis
+    flushed, a missed update, a submission no longer completed). Without Redis
+    the scores are ranked directly.
+    """
+    try:
+        standings = leaderboard.standings(domain_id)
+        if {entry["submission_id"]: entry["score"] for entry in standings} != scores:
+            leaderboard.rebuild(domain_id, scores.items())
+            standings = leaderboard.standings(domain_id)
+        return standings
+    except Exception as e:
+        logger.error(f"Error reading leaderboard for domain {domain_id}: {str(e)}")
+        ordered = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked_entries(ordered, len(ordered))
+
 @celery_app.task(bind=True, max_retries=3, default_retry_delay=60)
 def calculate_rankings_task(self, domain_id: int):
     """
-    Calculate and update rankings for all submissions in a domain
-    Updates both SubmissionScore and Submission tables with ranking information
+    Write the domain's rankings back to the database
+    Updates both SubmissionScore and Submission tables with a handful of
+    set-based statements, only for rows whose ranking changed
     """
     db = SessionLocal()
     
     try:
         logger.info(f"Starting ranking calculation for domain {domain_id}")
         
-        # Get all completed submissions for the domain with their scores
-        submissions_with_scores = db.query(SubmissionScore).join(Submission).filter(
-            Submission.domain_id == domain_id,
-            Submission.status == "completed"
-        ).order_by(SubmissionScore.weighted_total.desc()).all()
+        # Clear the pending flag before reading, so scores committed from here
+        # on schedule another run instead of being coalesced into this one
+        coalesced = leaderboard.claim_write_back(domain_id)
+        if coalesced:
+            logger.info(f"Coalesced {coalesced} ranking requests for domain {domain_id}")
+        record_system_metric(
+            "ranking_requests_coalesced", coalesced, "requests", {"domain_id": domain_id}
+        )
         
-        if not submissions_with_scores:
+        rows = load_ranking_rows(db, domain_id)
+        
+        # Keeps the Redis leaderboard in step with the database either way
+        standings = domain_standings(
+            domain_id, {row.submission_id: row.weighted_total for row in rows}
+        )
+        
+        if not standings:
             logger.warning(f"No completed submissions found for domain {domain_id}")
             return {
                 "status": "success",
                 "domain_id": domain_id,
                 "submissions_ranked": 0,
+                "coalesced_requests": coalesced,
                 "message": "No completed submissions to rank"
             }
         
-        # Calculate total submissions for percentile calculation
-        total_submissions = len(submissions_with_scores)
-        
-        # Update rankings in both SubmissionScore and Submission tables
-        ranking_updates = []
-        
-        for rank, score_record in enumerate(submissions_with_scores, 1):
-            # Update SubmissionScore table
-            score_record.ranking_position = rank
-            
-            # Calculate percentile rank (higher is better)
-            percentile = ((total_submissions - rank + 1) / total_submissions) * 100
-            score_record.percentile_rank = round(percentile, 2)
-            
-            # Get the corresponding submission
-            submission = db.query(Submission).filter(
-                Submission.id == score_record.submission_id
-            ).first()
-            
-            if submission:
-                # Update Submission table with ranking info
-                submission.ranking_position = rank
-                submission.weighted_score = score_record.weighted_total  # Ensure consistency
-                
-                ranking_updates.append({
-                    "submission_id": score_record.submission_id,
-                    "team_name": submission.team_name,
-                    "rank": rank,
-                    "score": score_record.weighted_total,
-                    "percentile": percentile
-                })
-                
-                logger.debug(
-                    f"Ranked submission {score_record.submission_id} ({submission.team_name}) "
-                    f"at position {rank} with score {score_record.weighted_total:.2f} "
-                    f"({percentile:.1f}th percentile)"
-                )
-        
-        # Commit all changes
+        # Set-based UPDATEs where the database has window functions, otherwise
+        # the leaderboard's standings in bulk; only changed rows are written
+        if supports_window_updates(db):
+            method = "window"
+            rows_updated = write_rankings_window(db, domain_id)
+        else:
+            method = "bulk"
+            rows_updated = write_rankings_bulk(db, rows, standings)
         db.commit()
         
         logger.info(
-            f"Rankings updated for domain {domain_id}: {len(submissions_with_scores)} submissions ranked"
+            f"Rankings updated for domain {domain_id}: {len(standings)} submissions ranked, "
+            f"{rows_updated} rows updated ({method})"
         )
         
         return {
             "status": "success",
             "domain_id": domain_id,
-            "submissions_ranked": len(submissions_with_scores),
-            "rankings": ranking_updates
+            "submissions_ranked": len(standings),
+            "rows_updated": rows_updated,
+            "method": method,
+            "coalesced_requests": coalesced
         }
     
     except Exception as e:
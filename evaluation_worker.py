@@ -0,0 +1,120 @@
+# evaluation_worker.py
+"""
+Asyncio evaluation worker
+
+Runs up to --concurrency evaluations at once in a single process, instead of
+one per Celery worker process. Evaluations wait on Gemini (or on the admission
+scheduler) almost all of the time, so one process can keep many requests in
+flight. Jobs come from the Redis evaluation queue, used when EVALUATION_MODE=async.
+
+Usage:
+    EVALUATION_MODE=async python evaluation_worker.py --concurrency 16
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from celery_tasks import evaluate_submission, evaluation_queue, admission_scheduler, set_submission_status
+from services.admission_scheduler import AdmissionTimeoutError
+
+logger = logging.getLogger("evaluation_worker")
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 120
+
+
+async def run_job(raw, job, worker_name: str, slots: asyncio.Semaphore):
+    """Evaluate one submission, requeueing it on failure with exponential backoff"""
+    submission_id = job["submission_id"]
+    attempt = job.get("attempt", 0)
+
+    try:
+        result = await evaluate_submission(submission_id, job.get("bypass_cache", False))
+        logger.info(f"Submission {submission_id}: {result['status']}")
+
+    except AdmissionTimeoutError as e:
+        # Waiting for a slot is not a failure, so it does not use up an attempt,
+        # but a submission that keeps timing out is given up on
+        admission_timeouts = job.get("admission_timeouts", 0) + 1
+        requeue_delay = admission_scheduler.requeue_delay(admission_timeouts)
+        if requeue_delay is None:
+            logger.error(f"Error evaluating submission {submission_id}: {str(e)} ({admission_timeouts} times)")
+            await asyncio.to_thread(set_submission_status, submission_id, "evaluation_error")
+        else:
+            logger.info(f"No Gemini slot for submission {submission_id}, requeueing in {requeue_delay} seconds")
+            await asyncio.to_thread(
+                evaluation_queue.push, submission_id, job.get("bypass_cache", False), attempt, requeue_delay,
+                admission_timeouts
+            )
+    except Exception as e:
+        logger.error(f"Error evaluating submission {submission_id}: {str(e)}")
+        await asyncio.to_thread(set_submission_status, submission_id, "evaluation_error")
+
+        if attempt + 1 < MAX_ATTEMPTS:
+            retry_delay = RETRY_BASE_DELAY * (2 ** attempt)
+            logger.info(f"Retrying evaluation for submission {submission_id} in {retry_delay} seconds")
+            await asyncio.to_thread(
+                evaluation_queue.push, submission_id, job.get("bypass_cache", False), attempt + 1, retry_delay,
+                job.get("admission_timeouts", 0)
+            )
+    finally:
+        await asyncio.to_thread(evaluation_queue.complete, worker_name, raw)
+        slots.release()
+
+
+async def run_worker(concurrency: int, worker_name: str):
+    """Claim jobs while fewer than `concurrency` evaluations are in flight"""
+    loop = asyncio.get_running_loop()
+    # Every in-flight evaluation may hold a thread (admission wait, database
+    # writes), plus one for claiming jobs
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency * 2 + 2))
+
+    stopping = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await asyncio.to_thread(evaluation_queue.recover, worker_name)
+    logger.info(f"Worker {worker_name} running {concurrency} concurrent evaluations")
+
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+
+    while not stopping.is_set():
+        await slots.acquire()
+        await asyncio.to_thread(evaluation_queue.promote_due)
+        claimed = await asyncio.to_thread(evaluation_queue.claim, worker_name, 1.0)
+        if claimed is None:
+            slots.release()
+            continue
+
+        raw, job = claimed
+        task = asyncio.create_task(run_job(raw, job, worker_name, slots))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    # Let in-flight evaluations finish; unclaimed jobs stay queued
+    logger.info(f"Stopping, waiting for {len(running)} in-flight evaluations")
+    await asyncio.gather(*running, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--concurrency", type=int, default=int(os.getenv("EVALUATION_ASYNC_CONCURRENCY", 16)),
+        help="Evaluations in flight at once"
+    )
+    parser.add_argument(
+        "--name", default=f"{socket.gethostname()}-evaluation",
+        help="Stable worker name; unfinished jobs of a previous run with this name are requeued"
+    )
+    args = parser.parse_args()
+
+    asyncio.run(run_worker(args.concurrency, args.name))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,36 @@
 #main.py
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple, BinaryIO
 import os
+import uuid
+import hashlib
 import shutil
 from pathlib import Path
 import logging
 from datetime import datetime
 
 from database import engine, SessionLocal, Base
-from models import Domain, Submission, SubmissionEvaluation, SubmissionScore
+from models import Domain, DomainWeightVersion, Submission, SubmissionBatch, SubmissionEvaluation, SubmissionScore
 from schemas import (
-    DomainCreate, DomainResponse, SubmissionCreate, SubmissionResponse,
-    EvaluationResponse, ScoreResponse
+    DomainCreate, DomainResponse, DomainUpdate, DomainUpdateResponse, DomainWeightVersionResponse,
+    SubmissionCreate, SubmissionResponse, SubmissionBatchResponse, SubmissionBatchProgress, EvaluationResponse, ScoreResponse
 )
 from services.pdf_processor import PDFProcessor
 from services.gemini_service import GeminiService
 from services.rate_limiter import GeminiRateLimiter
-from celery_tasks import evaluate_presentation_task
+from services.admission_scheduler import AdmissionScheduler
+from services.slide_cache import SlideCache
+from services.leaderboard import DomainLeaderboard, ranked_entries
+from services.bulk_ingest import BulkIngestError, ZIP_MAGIC, read_archive_entries, extract_members
+from celery_tasks import queue_evaluation, process_submission_task, score_domain_task
+from celery import group
 import redis
 
 # Configure logging
@@ -50,7 +60,8 @@ app.add_middleware(
 redis_client = redis.Redis(host='localhost', port=6379, db=0)
 rate_limiter = GeminiRateLimiter(redis_client)
 pdf_processor = PDFProcessor()
-gemini_service = GeminiService()
+gemini_service = GeminiService(redis_client)
+admission_scheduler = AdmissionScheduler(redis_client, rate_limiter, capacity=gemini_service.key_pool.healthy_count)
 
 # Storage configuration
 STORAGE_PATH = Path("storage")
@@ -58,10 +69,24 @@ UPLOADS_PATH = STORAGE_PATH / "uploads"
 TEMP_PATH = STORAGE_PATH / "temp"
 PROCESSED_PATH = STORAGE_PATH / "processed"
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
+MAX_BULK_UPLOAD_BYTES = int(os.getenv("MAX_BULK_UPLOAD_BYTES", 4 * 1024 * 1024 * 1024))
+MAX_BULK_FILES = int(os.getenv("MAX_BULK_FILES", 1000))
+PDF_MAGIC = b"%PDF-"
+
+# Submission statuses after which a submission needs no further processing
+# ("error" is only set once the processing task has used up its retries)
+FINISHED_STATUSES = {"completed", "error", "evaluation_error"}
+
 # Create storage directories
 for path in [STORAGE_PATH, UPLOADS_PATH, TEMP_PATH, PROCESSED_PATH]:
     path.mkdir(exist_ok=True)
 
+# Content-addressed store of rendered slides, shared with the Celery workers
+slide_cache = SlideCache(PROCESSED_PATH, redis_client)
+leaderboard = DomainLeaderboard(redis_client)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -70,6 +95,20 @@ def get_db():
     finally:
         db.close()
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized uploads from Content-Length, before the body is read"""
+    if request.method == "POST" and request.url.path.startswith("/submissions"):
+        limit = MAX_BULK_UPLOAD_BYTES if request.url.path.startswith("/submissions/bulk") else MAX_UPLOAD_BYTES
+        content_length = request.headers.get("content-length")
+        # Allow some headroom for multipart boundaries and form fields
+        if content_length and content_length.isdigit() and int(content_length) > limit + 64 * 1024:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Upload exceeds the {limit} byte limit"}
+            )
+    return await call_next(request)
+
 @app.get("/")
 async def root():
     return {"message": "Hackathon PPT Evaluation Engine API", "version": "1.0.0"}
@@ -78,13 +117,23 @@ async def root():
 @app.post("/domains/", response_model=DomainResponse)
 async def create_domain(domain: DomainCreate, db: Session = Depends(get_db)):
     """Create a new evaluation domain/category"""
+    if domain.slide_encoding:
+        try:
+            pdf_processor.resolve_encoding(domain.slide_encoding)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
     db_domain = Domain(
         name=domain.name,
         description=domain.description,
         judging_criteria=domain.judging_criteria,
-        weight_distribution=domain.weight_distribution
+        weight_distribution=domain.weight_distribution,
+        slide_encoding=domain.slide_encoding,
+        weights_version=1
     )
     db.add(db_domain)
+    db.flush()
+    db.add(DomainWeightVersion(domain_id=db_domain.id, version=1, weight_distribution=domain.weight_distribution))
     db.commit()
     db.refresh(db_domain)
     return db_domain
@@ -102,13 +151,134 @@ async def get_domain(domain_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Domain not found")
     return domain
 
+@app.patch("/domains/{domain_id}", response_model=DomainUpdateResponse)
+async def update_domain(domain_id: int, domain_update: DomainUpdate, db: Session = Depends(get_db)):
+    """
+    Update a domain
+    New weights get a new weights_version and queue a batch re-score of the
+    domain from the stored evaluations (no Gemini calls); so do new criteria.
+    The domain row stays locked until commit, so concurrent updates get
+    consecutive versions.
+    """
+    domain = db.query(Domain).filter(Domain.id == domain_id).with_for_update().first()
+    if not domain:
+        raise HTTPException(status_code=404, detail="Domain not found")
+    
+    changes = domain_update.model_dump(exclude_unset=True)
+    for field in ("name", "judging_criteria", "weight_distribution", "is_active"):
+        if field in changes and changes[field] is None:
+            raise HTTPException(status_code=400, detail=f"{field} cannot be null")
+    
+    if changes.get("slide_encoding"):
+        try:
+            pdf_processor.resolve_encoding(changes["slide_encoding"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    weights = changes.get("weight_distribution")
+    criteria_changed = "judging_criteria" in changes and changes["judging_criteria"] != domain.judging_criteria
+    if weights is not None or criteria_changed:
+        # New criteria are checked against the stored weights when no new weights come with them
+        criteria = changes.get("judging_criteria", domain.judging_criteria)
+        unknown = sorted(set(weights if weights is not None else domain.weight_distribution) - set(criteria))
+        if unknown:
+            detail = f"Weights for unknown criteria: {', '.join(unknown)}"
+            if weights is None:
+                detail += " (send weight_distribution for the new criteria)"
+            raise HTTPException(status_code=400, detail=detail)
+        if weights is not None and any(weight < 0 for weight in weights.values()):
+            raise HTTPException(status_code=400, detail="Weights cannot be negative")
+    weights_changed = weights is not None and weights != domain.weight_distribution
+    
+    if weights_changed:
+        current_version = domain.weights_version or 1
+        recorded = db.query(DomainWeightVersion.id).filter(
+            DomainWeightVersion.domain_id == domain_id,
+            DomainWeightVersion.version == current_version
+        ).first()
+        if not recorded:
+            # Domains created before weights were versioned
+            db.add(DomainWeightVersion(
+                domain_id=domain_id, version=current_version, weight_distribution=domain.weight_distribution
+            ))
+        domain.weights_version = current_version + 1
+        db.add(DomainWeightVersion(domain_id=domain_id, version=domain.weights_version, weight_distribution=weights))
+    
+    for field, value in changes.items():
+        setattr(domain, field, value)
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        logger.error(f"Error updating domain {domain_id}: {str(e)}")
+        raise HTTPException(status_code=409, detail="Domain update conflicts with an existing domain or a concurrent update")
+    db.refresh(domain)
+    
+    rescore_task_id = None
+    if weights_changed or criteria_changed:
+        logger.info(f"Scoring of domain {domain_id} changed (weights version {domain.weights_version}), queueing rescore")
+        task = await run_in_threadpool(score_domain_task.delay, domain_id, domain.weights_version)
+        rescore_task_id = task.id
+    
+    response = DomainUpdateResponse.model_validate(domain)
+    response.rescore_task_id = rescore_task_id
+    return response
+
+@app.get("/domains/{domain_id}/weight-versions", response_model=List[DomainWeightVersionResponse])
+async def get_domain_weight_versions(domain_id: int, db: Session = Depends(get_db)):
+    """Get every weight distribution the domain has been scored with, oldest first"""
+    return db.query(DomainWeightVersion).filter(
+        DomainWeightVersion.domain_id == domain_id
+    ).order_by(DomainWeightVersion.version).all()
+
+@app.get("/domains/{domain_id}/leaderboard")
+async def get_domain_leaderboard(domain_id: int, offset: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+    """Get a page of the domain's live rankings (best first)"""
+    if offset < 0 or not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 500")
+    
+    try:
+        page = leaderboard.page(domain_id, offset, limit)
+        total, entries = page["total"], page["entries"]
+    except Exception as e:
+        # Redis unavailable: rank the completed scores straight from the database
+        logger.error(f"Error reading leaderboard for domain {domain_id}: {str(e)}")
+        query = db.query(SubmissionScore.submission_id, SubmissionScore.weighted_total).join(Submission).filter(
+            Submission.domain_id == domain_id,
+            Submission.status == "completed",
+            SubmissionScore.weighted_total.isnot(None)
+        )
+        scores = query.order_by(SubmissionScore.weighted_total.desc()).all()
+        total = len(scores)
+        entries = ranked_entries(scores, total)[offset:offset + limit]
+    
+    team_names = dict(
+        db.query(Submission.id, Submission.team_name).filter(
+            Submission.id.in_([entry["submission_id"] for entry in entries])
+        ).all()
+    ) if entries else {}
+    for entry in entries:
+        entry["team_name"] = team_names.get(entry["submission_id"])
+    
+    return {"domain_id": domain_id, "total": total, "offset": offset, "limit": limit, "entries": entries}
+
+@app.post("/domains/{domain_id}/rescore")
+async def rescore_domain(domain_id: int, db: Session = Depends(get_db)):
+    """Queue a batch re-score and re-rank of every evaluated submission in the domain"""
+    domain = db.query(Domain).filter(Domain.id == domain_id).first()
+    if not domain:
+        raise HTTPException(status_code=404, detail="Domain not found")
+    
+    task = await run_in_threadpool(score_domain_task.delay, domain_id)
+    
+    return {"domain_id": domain_id, "status": "queued", "task_id": task.id}
+
 # Submission Management Endpoints
 @app.post("/submissions/", response_model=SubmissionResponse)
 async def create_submission(
     domain_id: int,
     team_name: str,
     file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
     db: Session = Depends(get_db)
 ):
     """Upload and create a new submission"""
@@ -116,39 +286,46 @@ async def create_submission(
     # Validate file type
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
     
     # Check if domain exists
-    domain = db.query(Domain).filter(Domain.id == domain_id).first()
+    domain = await run_in_threadpool(
+        lambda: db.query(Domain).filter(Domain.id == domain_id).first()
+    )
     if not domain:
         raise HTTPException(status_code=404, detail="Domain not found")
     
-    # Create submission record
-    submission = Submission(
-        domain_id=domain_id,
-        team_name=team_name,
-        status="uploaded"
-    )
-    db.add(submission)
-    db.commit()
-    db.refresh(submission)
+    # Stream the upload to a temp file first, so nothing is committed for
+    # oversized or non-PDF uploads
+    tmp_path, pdf_sha256 = await stream_upload_to_temp(file)
+    
+    try:
+        # Create submission record
+        submission = Submission(
+            domain_id=domain_id,
+            team_name=team_name,
+            pdf_sha256=pdf_sha256,
+            status="uploaded"
+        )
+        await run_in_threadpool(_commit_new, db, submission)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
     
     try:
-        # Create storage directory for this submission
+        # Move the validated PDF into the submission's storage directory
         submission_dir = UPLOADS_PATH / f"domain_{domain_id}" / f"submission_{submission.id}"
-        submission_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Save PDF file
         pdf_path = submission_dir / "original.pdf"
-        with open(pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await run_in_threadpool(_move_into_place, tmp_path, pdf_path)
         
         # Update submission with file path
         submission.pdf_file_url = str(pdf_path)
         submission.status = "processing"
-        db.commit()
+        await run_in_threadpool(db.commit)
         
-        # Queue background processing
-        background_tasks.add_task(process_submission, submission.id, str(pdf_path))
+        # Queue rasterization on the Celery processing workers
+        await run_in_threadpool(process_submission_task.delay, submission.id)
         
         logger.info(f"Submission {submission.id} created and queued for processing")
         
@@ -156,34 +333,238 @@ async def create_submission(
         
     except Exception as e:
         # Clean up on error
+        tmp_path.unlink(missing_ok=True)
         submission.status = "error"
-        db.commit()
+        await run_in_threadpool(db.commit)
         logger.error(f"Error processing submission {submission.id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Error processing submission")
 
-async def process_submission(submission_id: int, pdf_path: str):
-    """Background task to process PDF and queue evaluation"""
+def _write_chunk(buffer: BinaryIO, digest, chunk: bytes) -> None:
+    """Hash and write one upload chunk (runs in the thread pool)"""
+    digest.update(chunk)
+    buffer.write(chunk)
+
+def _commit_new(db: Session, instance) -> None:
+    """Insert a row and load its generated id (runs in the thread pool)"""
+    db.add(instance)
+    db.commit()
+    db.refresh(instance)
+
+def _move_into_place(source: Path, destination: Path) -> None:
+    """Move a file into a (possibly new) directory (runs in the thread pool)"""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(source, destination)
+
+async def stream_upload_to_temp(
+    file: UploadFile,
+    magic: bytes = PDF_MAGIC,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    suffix: str = ".pdf"
+) -> Tuple[Path, str]:
+    """
+    Stream an uploaded file to TEMP_PATH off the event loop
+    
+    The size limit is enforced while streaming, the file header is checked on
+    the first chunk and a SHA-256 is computed on the fly.
+    
+    Args:
+        file: Uploaded file
+        magic: Header bytes expected within the first 1024 bytes
+        max_bytes: Largest allowed upload
+        suffix: Temp file suffix
+        
+    Returns:
+        Tuple of (temp file path, hex SHA-256)
+        
+    Raises:
+        HTTPException: 400 for empty or mistyped content, 413 when too large
+    """
+    tmp_path = TEMP_PATH / f"upload_{uuid.uuid4().hex}{suffix}"
+    digest = hashlib.sha256()
+    size = 0
+    
+    buffer = await run_in_threadpool(open, tmp_path, "wb")
     try:
-        # Convert PDF to images
-        slides_dir = Path(pdf_path).parent / "slides"
-        slides_dir.mkdir(exist_ok=True)
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            # The PDF header may be preceded by a little junk (allowed by the spec)
+            if size == 0 and magic not in chunk[:1024]:
+                detail = "File is not a valid PDF" if magic == PDF_MAGIC else "File is not of the expected type"
+                raise HTTPException(status_code=400, detail=detail)
+            
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413, detail=f"Upload exceeds the {max_bytes} byte limit"
+                )
+            
+            await run_in_threadpool(_write_chunk, buffer, digest, chunk)
         
-        image_paths = pdf_processor.convert_pdf_to_images(pdf_path, str(slides_dir))
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    except BaseException:
+        await run_in_threadpool(buffer.close)
+        tmp_path.unlink(missing_ok=True)
+        raise
+    
+    await run_in_threadpool(buffer.close)
+    return tmp_path, digest.hexdigest()
+
+@app.post("/submissions/bulk", response_model=SubmissionBatchResponse)
+async def create_submission_batch(
+    domain_id: int,
+    archive: UploadFile = File(..., description="ZIP archive of PDF decks"),
+    manifest: Optional[str] = Form(
+        None, description='Team names as JSON, e.g. {"deck.pdf": "Team A"}; defaults to manifest.json in the archive'
+    ),
+    db: Session = Depends(get_db)
+):
+    """Ingest a ZIP archive of decks as one batch of submissions"""
+    
+    if not archive.filename.lower().endswith('.zip'):
+        raise HTTPException(status_code=400, detail="Only ZIP archives are allowed")
+    
+    domain = await run_in_threadpool(
+        lambda: db.query(Domain).filter(Domain.id == domain_id).first()
+    )
+    if not domain:
+        raise HTTPException(status_code=404, detail="Domain not found")
+    
+    archive_path, _ = await stream_upload_to_temp(
+        archive, magic=ZIP_MAGIC, max_bytes=MAX_BULK_UPLOAD_BYTES, suffix=".zip"
+    )
+    
+    try:
+        try:
+            entries = await run_in_threadpool(
+                read_archive_entries, archive_path, manifest, MAX_UPLOAD_BYTES, MAX_BULK_FILES
+            )
+        except BulkIngestError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Queue comprehensive evaluation task
-        evaluate_presentation_task.delay(submission_id)
+        batch_id = uuid.uuid4().hex
+        submission_ids = await run_in_threadpool(
+            _ingest_batch, db, batch_id, domain_id, archive_path, entries
+        )
+    finally:
+        archive_path.unlink(missing_ok=True)
+    
+    # Rasterize the whole batch on the processing workers
+    try:
+        group_result = await run_in_threadpool(
+            group(process_submission_task.s(submission_id) for submission_id in submission_ids).apply_async
+        )
+    except Exception as e:
+        # Nothing will pick the submissions up, so don't leave them "processing"
+        await run_in_threadpool(_fail_batch, db, batch_id)
+        logger.error(f"Error queueing batch {batch_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error queueing submission batch for processing")
+    
+    batch = await run_in_threadpool(lambda: db.get(SubmissionBatch, batch_id))
+    batch.task_group_id = group_result.id
+    await run_in_threadpool(db.commit)
+    
+    logger.info(f"Batch {batch_id}: {len(submission_ids)} submissions created and queued for processing")
+    
+    return SubmissionBatchResponse(
+        batch_id=batch_id,
+        domain_id=domain_id,
+        total_submissions=len(submission_ids),
+        submission_ids=submission_ids,
+        task_group_id=group_result.id
+    )
+
+def _ingest_batch(
+    db: Session,
+    batch_id: str,
+    domain_id: int,
+    archive_path: Path,
+    entries: List[dict]
+) -> List[int]:
+    """
+    Create a batch and its submissions, then extract the decks (runs in the thread pool)
+    
+    The submission rows are flushed together, which the ORM batches into
+    INSERT ... RETURNING where the database supports it, so ids come back in
+    archive order. Real paths and hashes are written once the decks are on disk.
+    If anything fails, the decks extracted so far are removed again.
+    
+    Returns:
+        Submission ids in archive order
+    """
+    targets = []
+    
+    try:
+        db.add(SubmissionBatch(id=batch_id, domain_id=domain_id, total_submissions=len(entries)))
+        submissions = [
+            Submission(
+                domain_id=domain_id,
+                team_name=entry["team_name"],
+                batch_id=batch_id,
+                status="uploaded"
+            )
+            for entry in entries
+        ]
+        db.add_all(submissions)
+        db.flush()
+        submission_ids = [submission.id for submission in submissions]
         
-        logger.info(f"Submission {submission_id} processed and evaluation queued")
+        targets = [
+            {
+                "member": entry["member"],
+                "destination": UPLOADS_PATH / f"domain_{domain_id}" / f"submission_{submission_id}" / "original.pdf"
+            }
+            for entry, submission_id in zip(entries, submission_ids)
+        ]
+        digests = extract_members(archive_path, targets)
         
+        for submission, target, digest in zip(submissions, targets, digests):
+            submission.pdf_file_url = str(target["destination"])
+            submission.pdf_sha256 = digest
+            submission.status = "processing"
+        db.commit()
+        return submission_ids
+    
     except Exception as e:
-        logger.error(f"Error in background processing for submission {submission_id}: {str(e)}")
-        # Update submission status to error
-        db = SessionLocal()
-        submission = db.query(Submission).filter(Submission.id == submission_id).first()
-        if submission:
-            submission.status = "error"
-            db.commit()
-        db.close()
+        db.rollback()
+        for target in targets:
+            shutil.rmtree(target["destination"].parent, ignore_errors=True)
+        logger.error(f"Error ingesting batch {batch_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error ingesting submission batch")
+
+def _fail_batch(db: Session, batch_id: str) -> None:
+    """Mark every submission of a batch as errored (runs in the thread pool)"""
+    db.rollback()
+    db.query(Submission).filter(Submission.batch_id == batch_id).update(
+        {Submission.status: "error"}, synchronize_session=False
+    )
+    db.commit()
+
+@app.get("/submissions/batches/{batch_id}", response_model=SubmissionBatchProgress)
+async def get_submission_batch(batch_id: str, db: Session = Depends(get_db)):
+    """Get processing progress for a bulk submission batch"""
+    batch = db.query(SubmissionBatch).filter(SubmissionBatch.id == batch_id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    status_counts = dict(
+        db.query(Submission.status, func.count(Submission.id))
+        .filter(Submission.batch_id == batch_id)
+        .group_by(Submission.status)
+        .all()
+    )
+    finished = sum(count for status, count in status_counts.items() if status in FINISHED_STATUSES)
+    total = batch.total_submissions
+    
+    return SubmissionBatchProgress(
+        batch_id=batch.id,
+        domain_id=batch.domain_id,
+        total_submissions=total,
+        status_counts=status_counts,
+        finished=finished,
+        progress_percent=round(finished / total * 100, 2) if total else 100.0,
+        is_complete=finished >= total,
+        created_at=batch.created_at
+    )
 
 @app.get("/submissions/", response_model=List[SubmissionResponse])
 async def get_submissions(
@@ -234,6 +615,23 @@ async def get_score(submission_id: int, db: Session = Depends(get_db)):
     
     return score
 
+@app.post("/submissions/{submission_id}/evaluate")
+async def reevaluate_submission(
+    submission_id: int,
+    bypass_cache: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Queue a (re-)evaluation; bypass_cache forces a fresh Gemini judgement"""
+    submission = db.query(Submission).filter(Submission.id == submission_id).first()
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    if not submission.pdf_file_url:
+        raise HTTPException(status_code=400, detail="Submission has no uploaded PDF")
+    
+    await run_in_threadpool(queue_evaluation, submission_id, bypass_cache)
+    
+    return {"submission_id": submission_id, "status": "queued", "bypass_cache": bypass_cache}
+
 # Analytics Endpoints
 @app.get("/analytics/domain/{domain_id}/scores")
 async def get_domain_analytics(domain_id: int, db: Session = Depends(get_db)):
@@ -271,6 +669,22 @@ async def get_domain_analytics(domain_id: int, db: Session = Depends(get_db)):
     
     return analytics
 
+@app.get("/analytics/slide-cache")
+async def get_slide_cache_stats():
+    """Get slide cache hit/miss counters and store size"""
+    # Falls back to scanning the store when Redis is down, so keep it off the event loop
+    return await run_in_threadpool(slide_cache.get_stats)
+
+@app.get("/analytics/rankings")
+async def get_ranking_stats():
+    """Get ranking write-back counters (requests coalesced by debouncing)"""
+    return leaderboard.get_stats()
+
+@app.get("/analytics/gemini-files")
+async def get_gemini_file_stats():
+    """Get slide upload/reuse counters for Gemini file handles"""
+    return gemini_service.slide_files.get_stats()
+
 @app.get("/analytics/processing-stats")
 async def get_processing_stats(db: Session = Depends(get_db)):
     """Get processing statistics"""
@@ -319,14 +733,17 @@ async def health_check():
 
 @app.get("/rate-limit/status")
 async def rate_limit_status():
-    """Check current rate limit status"""
-    can_make_request = await rate_limiter.can_make_request("gemini_api")
-    wait_time = await rate_limiter.get_wait_time("gemini_api") if not can_make_request else 0
+    """Check current rate limit status (does not consume a request)"""
+    usage = await rate_limiter.get_current_usage("gemini_api")
     
     return {
-        "can_make_request": can_make_request,
-        "wait_time_seconds": wait_time,
-        "requests_per_minute_limit": rate_limiter.max_requests
+        "can_make_request": usage["requests_allowed"],
+        "wait_time_seconds": await rate_limiter.get_wait_time("gemini_api"),
+        "requests_per_minute_limit": rate_limiter.max_requests * max(1, gemini_service.key_pool.healthy_count()),
+        "burst": usage["burst"],
+        "remaining_requests": usage["remaining_requests"],
+        "admission_queue": admission_scheduler.get_stats(),
+        "key_pool": gemini_service.key_pool.get_stats()
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from models import Base, Domain, Submission, SubmissionScore
+from database import engine
+
+# Columns added to tables that existed before them, with the value existing rows get.
+# create_all() creates missing tables but never alters existing ones.
+NEW_COLUMNS = [
+    (Domain.__table__.c.weights_version, "1"),
+    (Domain.__table__.c.slide_encoding, None),
+    (Submission.__table__.c.pdf_sha256, None),
+    (Submission.__table__.c.batch_id, None),
+    (SubmissionScore.__table__.c.weights_version, None),
+]
+
+def add_column(connection, column, default):
+    """ALTER TABLE ... ADD COLUMN, plus the column's index and foreign key"""
+    quote = connection.dialect.identifier_preparer.quote
+    table = column.table
+
+    ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=connection.dialect)}"
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    connection.execute(text(ddl))
+
+    for index in table.indexes:
+        if [indexed.name for indexed in index.columns] == [column.name]:
+            connection.execute(CreateIndex(index))
+
+    # SQLite cannot add constraints to an existing table
+    if connection.dialect.name != "sqlite":
+        for foreign_key in column.foreign_keys:
+            target = foreign_key.column
+            connection.execute(text(
+                f"ALTER TABLE {quote(table.name)} ADD CONSTRAINT {quote(f'fk_{table.name}_{column.name}')} "
+                f"FOREIGN KEY ({quote(column.name)}) REFERENCES {quote(target.table.name)} ({quote(target.name)})"
+            ))
+
+def migrate_database():
+    print("Creating missing database tables...")
+    Base.metadata.create_all(engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for column, default in NEW_COLUMNS:
+            existing = {existing_column["name"] for existing_column in inspector.get_columns(column.table.name)}
+            if column.name in existing:
+                continue
+            print(f"Adding {column.table.name}.{column.name}...")
+            add_column(connection, column, default)
+
+    print("Database schema is up to date!")
+
+if __name__ == "__main__":
+    migrate_database()
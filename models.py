@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, JSON, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, JSON, ForeignKey, Boolean, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -27,6 +27,13 @@ class Domain(Base):
     # Example: {"innovation": 0.2, "technical": 0.25, "problem_fit": 0.2, "presentation": 0.15, "business": 0.1, "demo": 0.1}
     weight_distribution = Column(JSON, nullable=False, default=dict)
     
+    # Bumped whenever weight_distribution changes; past versions are kept in DomainWeightVersion
+    weights_version = Column(Integer, nullable=False, default=1)
+    
+    # JSON field with the slide image encoding profile used when rasterizing PDFs
+    # Example: {"format": "webp", "quality": 80} or {"format": "png", "compress_level": 3}
+    slide_encoding = Column(JSON, nullable=True)
+    
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -59,6 +66,10 @@ class Submission(Base):
     team_name = Column(String(255), nullable=False, index=True)
       # File storage information
     pdf_file_url = Column(String(500), nullable=True)  # Local file path
+    pdf_sha256 = Column(String(64), nullable=True, index=True)  # Content hash of the uploaded PDF
+    
+    # Set for submissions ingested through a bulk upload
+    batch_id = Column(String(32), ForeignKey("submission_batches.id"), nullable=True, index=True)
     
     # Processing status: uploaded, processing, evaluated, error, completed
     status = Column(String(50), default="uploaded", nullable=False, index=True)
@@ -94,6 +105,46 @@ class Submission(Base):
         return None
 
 
+class DomainWeightVersion(Base):
+    """
+    Weight distribution of a domain as of one weights_version
+    Lets scores computed under older weights be reproduced after a change
+    """
+    __tablename__ = "domain_weight_versions"
+    __table_args__ = (UniqueConstraint("domain_id", "version", name="uq_domain_weight_version"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    domain_id = Column(Integer, ForeignKey("domains.id"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    weight_distribution = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<DomainWeightVersion(domain_id={self.domain_id}, version={self.version})>"
+
+
+class SubmissionBatch(Base):
+    """
+    A group of submissions ingested together from one bulk archive upload
+    """
+    __tablename__ = "submission_batches"
+    
+    id = Column(String(32), primary_key=True)  # uuid4 hex, returned to the client for polling
+    domain_id = Column(Integer, ForeignKey("domains.id"), nullable=False, index=True)
+    total_submissions = Column(Integer, nullable=False, default=0)
+    
+    # Celery group processing the batch
+    task_group_id = Column(String(255), nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    submissions = relationship("Submission", backref="batch")
+    
+    def __repr__(self):
+        return f"<SubmissionBatch(id='{self.id}', domain_id={self.domain_id}, total={self.total_submissions})>"
+
+
 class SubmissionEvaluation(Base):
     """
     Comprehensive AI evaluation results for a submission
@@ -194,6 +245,9 @@ class SubmissionScore(Base):
     presentation_quality_bonus = Column(Float, default=0.0)  # Bonus for exceptional presentation flow
     consistency_penalty = Column(Float, default=0.0)  # Penalty for inconsistent messaging
     
+    # Domain weights_version the weighted scores were computed with
+    weights_version = Column(Integer, nullable=True)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -303,6 +357,39 @@ class APIRateLimit(Base):
         return int((window_end - current_time).total_seconds())
 
 
+class EvaluationCacheEntry(Base):
+    """
+    Cached Gemini evaluations keyed by slide content and evaluation settings
+    Lets identical decks under an identical prompt skip the Gemini call
+    """
+    __tablename__ = "evaluation_cache"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    
+    # SHA-256 over (ordered slide hashes, prompt hash, model name, generation config)
+    cache_key = Column(String(64), unique=True, nullable=False, index=True)
+    
+    model_name = Column(String(100), nullable=False)
+    slide_count = Column(Integer, nullable=False)
+    
+    # Complete Gemini response, including metadata, as returned by GeminiService
+    gemini_response = Column(JSON, nullable=False)
+    
+    hit_count = Column(Integer, default=0, nullable=False)
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<EvaluationCacheEntry(key='{self.cache_key[:12]}', hits={self.hit_count})>"
+    
+    @property
+    def is_expired(self):
+        """Check if the cached evaluation is past its TTL"""
+        expires_at = self.expires_at.replace(tzinfo=None) if self.expires_at.tzinfo else self.expires_at
+        return datetime.utcnow() >= expires_at
+
+
 # Additional utility model for system health monitoring
 class SystemHealth(Base):
     """
@@ -1,15 +1,18 @@
 # schemas.py
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Annotated
 from datetime import datetime
 from enum import Enum
 
 class SubmissionStatusEnum(str, Enum):
     uploaded = "uploaded"
     processing = "processing"
+    processed = "processed"
     evaluating = "evaluating"
+    evaluated = "evaluated"
     completed = "completed"
     error = "error"
+    evaluation_error = "evaluation_error"
 
 # Domain Schemas
 class DomainBase(BaseModel):
@@ -17,22 +20,51 @@ class DomainBase(BaseModel):
     description: Optional[str] = None
     judging_criteria: Dict[str, Any] = Field(..., description="Criteria definitions")
     weight_distribution: Dict[str, float] = Field(..., description="Scoring weights")
+    slide_encoding: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Slide image encoding profile, e.g. {\"format\": \"webp\", \"quality\": 80}"
+    )
     is_active: bool = Field(default=True, description="Whether the domain is active")
 
 class DomainCreate(DomainBase):
     pass
 
+class DomainUpdate(BaseModel):
+    name: Optional[str] = Field(default=None, min_length=1, max_length=100)
+    description: Optional[str] = None
+    judging_criteria: Optional[Dict[str, Any]] = None
+    weight_distribution: Optional[Dict[str, float]] = Field(
+        default=None, description="New scoring weights; rescoring the domain's submissions"
+    )
+    slide_encoding: Optional[Dict[str, Any]] = None
+    is_active: Optional[bool] = None
+
 class DomainResponse(DomainBase):
     id: int
+    weights_version: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
 
+class DomainUpdateResponse(DomainResponse):
+    rescore_task_id: Optional[str] = None
+
+class DomainWeightVersionResponse(BaseModel):
+    version: int
+    weight_distribution: Dict[str, float]
+    created_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 # Submission Schemas
+# Also applied to team names read from bulk upload manifests
+TEAM_NAME_MAX_LENGTH = 100
+
 class SubmissionBase(BaseModel):
-    team_name: str = Field(..., min_length=1, max_length=100)
+    team_name: str = Field(..., min_length=1, max_length=TEAM_NAME_MAX_LENGTH)
     domain_id: int
 
 class SubmissionCreate(SubmissionBase):
@@ -51,6 +83,23 @@ class SubmissionResponse(SubmissionBase):
     class Config:
         from_attributes = True
 
+class SubmissionBatchResponse(BaseModel):
+    batch_id: str
+    domain_id: int
+    total_submissions: int
+    submission_ids: List[int]
+    task_group_id: Optional[str] = None
+
+class SubmissionBatchProgress(BaseModel):
+    batch_id: str
+    domain_id: int
+    total_submissions: int
+    status_counts: Dict[str, int]
+    finished: int
+    progress_percent: float
+    is_complete: bool
+    created_at: Optional[datetime] = None
+
 # Evaluation Schemas
 class EvaluationResponse(BaseModel):
     id: int
@@ -73,6 +122,7 @@ class ScoreResponse(BaseModel):
     weighted_total: Optional[float] = None
     raw_total: Optional[float] = None
     ranking_position: Optional[int] = None
+    weights_version: Optional[int] = None
     created_at: datetime
     
     class Config:
@@ -134,13 +184,30 @@ class CriteriaScores(BaseModel):
     business: int = Field(..., ge=1, le=10)
     demo: int = Field(..., ge=1, le=10)
 
-class GeminiEvaluationResponse(BaseModel):
+# Criteria are configured per domain, so scores are keyed by the domain's criteria names
+CriterionScore = Annotated[float, Field(ge=1, le=10)]
+
+class GeminiJudgement(BaseModel):
     overall_analysis: OverallAnalysis
-    criteria_scores: CriteriaScores
+    criteria_scores: Dict[str, CriterionScore]
     detailed_feedback: DetailedFeedback
-    slide_by_slide_notes: List[SlideNote]
     executive_summary: str
 
+class GeminiEvaluationResponse(GeminiJudgement):
+    slide_by_slide_notes: List[SlideNote]
+
+# Map step of map-reduce evaluations (one chunk of slides)
+class CriterionEvidence(BaseModel):
+    score: Optional[CriterionScore] = None
+    evidence: str = ""
+
+class GeminiChunkSummary(BaseModel):
+    part_summary: str
+    criteria_evidence: Dict[str, CriterionEvidence]
+    strengths: List[str] = []
+    weaknesses: List[str] = []
+    slide_by_slide_notes: List[SlideNote]
+
 # Default domain configurations
 DEFAULT_DOMAINS = [
     {
@@ -0,0 +1,384 @@
+# services/admission_scheduler.py
+import os
+import time
+from typing import Dict, Any, Optional, Callable
+import logging
+
+import redis
+
+from services.rate_limiter import GeminiRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Hand out Gemini call slots to waiting evaluations, in one atomic step.
+#
+# Pending evaluations live in one sorted set per domain (FIFO by submission id).
+# Domains sit in a fairness sorted set scored by when they were last served, so
+# the least recently served domain goes first. Each pass walks the domains in
+# that order and runs the same GCRA check as GeminiRateLimiter, against the same
+# key, for the head item of each; if a slot is free it consumes it and pushes a
+# lease onto the item's lease list, waking the worker blocked on it. Passes
+# repeat until a whole pass grants nothing.
+#
+# A head item that does not fit yet (a heavy call waiting for the bucket to
+# drain) is skipped for the pass, so lighter items of other domains are not held
+# up behind it. Once it has been skipped for as long as its own weight takes to
+# earn (weight * interval), it holds a reservation: nothing else is granted until
+# it fits, so a stream of light calls cannot starve it.
+#
+# Items whose waiter heartbeat has expired (worker died while queued) are
+# dropped instead of being leased, so no slot is handed to nobody.
+#
+# KEYS[1]: domains fairness zset
+# KEYS[2]: limiter key (shared with GeminiRateLimiter)
+# KEYS[3]: served counter
+# ARGV[1]: emission interval in seconds
+# ARGV[2]: burst tolerance in seconds, at the same scale as the interval
+# ARGV[3]: key prefix
+# ARGV[4]: lease TTL in milliseconds
+# ARGV[5]: maximum number of leases to grant in this call
+# Returns: {retry_after (-1 when nothing is queued), granted submission ids...}
+DISPATCH_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local prefix = ARGV[3]
+local lease_ttl = tonumber(ARGV[4])
+local max_grants = tonumber(ARGV[5])
+local weights_key = prefix .. ':weights'
+local skipped_key = prefix .. ':skipped'
+local reserved_key = prefix .. ':reserved'
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local granted = {}
+local wait = nil
+local reserved = false
+local progress = true
+
+while progress and not reserved and #granted < max_grants do
+    progress = false
+    wait = nil
+    local domains = redis.call('ZRANGE', KEYS[1], 0, -1)
+    local reserved_domain = redis.call('GET', reserved_key)
+    if reserved_domain then
+        -- The domain holding the reservation is checked before anyone else
+        local ordered = {reserved_domain}
+        for _, domain in ipairs(domains) do
+            if domain ~= reserved_domain then
+                table.insert(ordered, domain)
+            end
+        end
+        domains = ordered
+    end
+
+    for _, domain in ipairs(domains) do
+        if #granted >= max_grants then
+            break
+        end
+
+        local queue_key = prefix .. ':queue:' .. domain
+        local item = redis.call('ZRANGE', queue_key, 0, 0)
+        while #item > 0 and redis.call('EXISTS', prefix .. ':waiter:' .. item[1]) == 0 do
+            redis.call('ZREM', queue_key, item[1])
+            redis.call('HDEL', weights_key, item[1])
+            redis.call('HDEL', skipped_key, item[1])
+            item = redis.call('ZRANGE', queue_key, 0, 0)
+        end
+
+        if #item == 0 then
+            redis.call('ZREM', KEYS[1], domain)
+            if domain == reserved_domain then
+                redis.call('DEL', reserved_key)
+            end
+        else
+            local submission_id = item[1]
+            local weight = tonumber(redis.call('HGET', weights_key, submission_id) or '1')
+
+            local tat = tonumber(redis.call('GET', KEYS[2])) or now
+            if tat < now then
+                tat = now
+            end
+            local item_tolerance = math.max(tolerance, (weight - 1) * interval)
+            local allow_at = tat + (weight - 1) * interval - item_tolerance
+
+            if now < allow_at then
+                if wait == nil or allow_at - now < wait then
+                    wait = allow_at - now
+                end
+                local skipped_since = tonumber(redis.call('HGET', skipped_key, submission_id))
+                if skipped_since == nil then
+                    skipped_since = now
+                    redis.call('HSET', skipped_key, submission_id, string.format('%.6f', now))
+                end
+                if domain == reserved_domain or now - skipped_since >= weight * interval then
+                    -- Hold the capacity for this item until it fits
+                    redis.call('SET', reserved_key, domain, 'PX', lease_ttl)
+                    wait = allow_at - now
+                    reserved = true
+                    break
+                end
+            else
+                local new_tat = tat + weight * interval
+                redis.call('SET', KEYS[2], string.format('%.6f', new_tat), 'PX', math.ceil((new_tat - now) * 1000) + 1000)
+
+                redis.call('ZREM', queue_key, submission_id)
+                redis.call('HDEL', weights_key, submission_id)
+                redis.call('HDEL', skipped_key, submission_id)
+                if domain == reserved_domain then
+                    redis.call('DEL', reserved_key)
+                    reserved_domain = nil
+                end
+                local served = redis.call('INCR', KEYS[3])
+                if redis.call('ZCARD', queue_key) > 0 then
+                    redis.call('ZADD', KEYS[1], served, domain)
+                else
+                    redis.call('ZREM', KEYS[1], domain)
+                end
+
+                local lease_key = prefix .. ':lease:' .. submission_id
+                redis.call('RPUSH', lease_key, weight)
+                redis.call('PEXPIRE', lease_key, lease_ttl)
+                table.insert(granted, submission_id)
+                progress = true
+            end
+        end
+    end
+end
+
+local retry_after = wait or 0
+if redis.call('ZCARD', KEYS[1]) == 0 then
+    retry_after = -1
+end
+
+local result = {string.format('%.6f', retry_after)}
+for _, submission_id in ipairs(granted) do
+    table.insert(result, submission_id)
+end
+return result
+"""
+
+# Add an item to its domain queue. A domain joining the rotation is placed
+# behind every domain served so far in the current round.
+#
+# KEYS[1]: domains fairness zset
+# KEYS[2]: served counter
+# KEYS[3]: domain queue
+# KEYS[4]: weights hash
+# KEYS[5]: waiter heartbeat key
+# ARGV[1]: domain id, ARGV[2]: submission id, ARGV[3]: FIFO position,
+# ARGV[4]: weight, ARGV[5]: waiter TTL in milliseconds
+ENQUEUE_SCRIPT = """
+redis.call('SET', KEYS[5], '1', 'PX', ARGV[5])
+redis.call('HSET', KEYS[4], ARGV[2], ARGV[4])
+redis.call('ZADD', KEYS[3], 'NX', ARGV[3], ARGV[2])
+local served = tonumber(redis.call('GET', KEYS[2]) or '0')
+redis.call('ZADD', KEYS[1], 'NX', served, ARGV[1])
+return redis.call('ZCARD', KEYS[3])
+"""
+
+
+class AdmissionTimeoutError(RuntimeError):
+    """Raised when a submission was not granted a Gemini slot within the wait limit"""
+
+
+class AdmissionScheduler:
+    """
+    Central admission queue for Gemini calls
+
+    Workers that need a Gemini slot enqueue themselves and block on a lease
+    instead of retrying through the broker. Slots are granted at exactly the
+    rate configured on the shared GeminiRateLimiter, FIFO within a domain and
+    round-robin across domains. With a key pool the rate is multiplied by the
+    number of healthy keys (capacity). There is no separate scheduler process: every
+    waiting worker runs the atomic dispatch script when the next slot is due,
+    so dispatch keeps going as long as anyone is waiting.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        rate_limiter: GeminiRateLimiter,
+        identifier: str = "gemini_api",
+        max_wait_seconds: Optional[int] = None,
+        capacity: Optional[Callable[[], int]] = None
+    ):
+        self.redis = redis_client
+        self.rate_limiter = rate_limiter
+        self.identifier = identifier
+        self.capacity = capacity or (lambda: 1)
+        self.key_prefix = "gemini_admission"
+        self.max_wait_seconds = max_wait_seconds or int(os.getenv("GEMINI_ADMISSION_MAX_WAIT", 900))
+
+        # A submission that timed out waiting is requeued with a growing delay,
+        # and marked as an evaluation error after max_requeues timeouts
+        self.max_requeues = int(os.getenv("GEMINI_ADMISSION_MAX_REQUEUES", 3))
+        self.requeue_base_delay = int(os.getenv("GEMINI_ADMISSION_REQUEUE_DELAY", 60))
+
+        # Waiters refresh their heartbeat at least every poll interval; a lease
+        # nobody picks up within lease_ttl is lost (its slot is already spent)
+        self.poll_seconds = 5.0
+        self.waiter_ttl_ms = 30 * 1000
+        self.lease_ttl_ms = 60 * 1000
+
+        self._dispatch_script = self.redis.register_script(DISPATCH_SCRIPT)
+        self._enqueue_script = self.redis.register_script(ENQUEUE_SCRIPT)
+
+    def _key(self, *parts) -> str:
+        return ":".join([self.key_prefix, *[str(part) for part in parts]])
+
+    def enqueue(self, submission_id: int, domain_id: int, weight: int = 1, position: Optional[float] = None) -> int:
+        """
+        Queue a submission for a Gemini slot (idempotent)
+
+        Args:
+            submission_id: Submission waiting to be evaluated
+            domain_id: Domain whose queue the submission joins
+            weight: Request units the call will consume
+            position: FIFO position within the domain, defaults to the submission id
+
+        Returns:
+            Number of submissions queued for the domain
+        """
+        return self._enqueue_script(
+            keys=[
+                self._key("domains"),
+                self._key("served"),
+                self._key("queue", domain_id),
+                self._key("weights"),
+                self._key("waiter", submission_id)
+            ],
+            args=[domain_id, submission_id, position if position is not None else submission_id,
+                  weight, self.waiter_ttl_ms]
+        )
+
+    def dispatch(self, max_grants: int = 16) -> Dict[str, Any]:
+        """
+        Grant every slot that is due right now
+
+        Args:
+            max_grants: Upper bound on leases granted by this call
+
+        Returns:
+            Dictionary with granted submission ids and seconds until the next
+            slot (None when nothing is queued)
+        """
+        # More keys mean proportionally shorter slots; the burst shrinks with them
+        capacity = max(1, self.capacity())
+        result = self._dispatch_script(
+            keys=[
+                self._key("domains"),
+                self.rate_limiter._get_key(self.identifier),
+                self._key("served")
+            ],
+            args=[
+                self.rate_limiter.emission_interval / capacity,
+                self.rate_limiter.tolerance / capacity,
+                self.key_prefix,
+                self.lease_ttl_ms,
+                max_grants
+            ]
+        )
+        retry_after = float(result[0])
+        return {
+            "granted": [int(submission_id) for submission_id in result[1:]],
+            "retry_after": None if retry_after < 0 else retry_after
+        }
+
+    def requeue_delay(self, timeouts: int) -> Optional[int]:
+        """
+        Backoff before a submission that timed out waiting is queued again
+
+        Args:
+            timeouts: Admission timeouts the submission has had so far, this one included
+
+        Returns:
+            Delay in seconds, or None once the submission has used up max_requeues
+        """
+        if timeouts > self.max_requeues:
+            return None
+        return self.requeue_base_delay * (2 ** (timeouts - 1))
+
+    def cancel(self, submission_id: int, domain_id: int) -> None:
+        """Remove a submission from the queue and drop any unclaimed lease"""
+        pipe = self.redis.pipeline()
+        pipe.zrem(self._key("queue", domain_id), submission_id)
+        pipe.hdel(self._key("weights"), submission_id)
+        pipe.hdel(self._key("skipped"), submission_id)
+        pipe.delete(self._key("waiter", submission_id), self._key("lease", submission_id))
+        pipe.execute()
+
+    def acquire(self, submission_id: int, domain_id: int, weight: int = 1) -> Optional[Dict[str, Any]]:
+        """
+        Queue a submission and block until it is granted a Gemini slot
+
+        Args:
+            submission_id: Submission waiting to be evaluated
+            domain_id: Domain of the submission
+            weight: Request units the call will consume
+
+        Returns:
+            Lease dictionary, or None if max_wait_seconds passed first. Falls
+            back to a plain rate limiter check if Redis is unavailable.
+        """
+        start_time = time.time()
+        deadline = start_time + self.max_wait_seconds
+        lease_key = self._key("lease", submission_id)
+        waiter_key = self._key("waiter", submission_id)
+
+        try:
+            depth = self.enqueue(submission_id, domain_id, weight)
+            logger.info(f"Submission {submission_id} queued for a Gemini slot ({depth} waiting in domain {domain_id})")
+
+            while True:
+                # Heartbeat, then grant whatever is due (possibly our own lease)
+                self.redis.pexpire(waiter_key, self.waiter_ttl_ms)
+                retry_after = self.dispatch()["retry_after"]
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+
+                timeout = min(self.poll_seconds, remaining, retry_after if retry_after is not None else self.poll_seconds)
+                # A zero timeout would make BLPOP block forever
+                lease = self.redis.blpop([lease_key], timeout=max(timeout, 0.01))
+                if lease:
+                    waited = time.time() - start_time
+                    self.redis.delete(waiter_key)
+                    logger.info(f"Submission {submission_id} granted a Gemini slot after {waited:.2f}s")
+                    return {"submission_id": submission_id, "weight": int(lease[1]), "waited_seconds": waited}
+
+            logger.warning(f"Submission {submission_id} gave up waiting for a Gemini slot after {self.max_wait_seconds}s")
+            self.cancel(submission_id, domain_id)
+            return None
+
+        except redis.RedisError as e:
+            # Fail open like GeminiRateLimiter does
+            logger.error(f"Error in admission scheduler: {str(e)}")
+            return {"submission_id": submission_id, "weight": weight, "waited_seconds": time.time() - start_time,
+                    "error": str(e)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get queue depths per domain
+
+        Returns:
+            Dictionary with admission queue statistics
+        """
+        try:
+            domains = self.redis.zrange(self._key("domains"), 0, -1)
+            pipe = self.redis.pipeline()
+            for domain in domains:
+                pipe.zcard(self._key("queue", domain.decode()))
+            depths = pipe.execute()
+
+            return {
+                "queued_by_domain": {domain.decode(): depth for domain, depth in zip(domains, depths)},
+                "queued_total": sum(depths),
+                "leases_granted": int(self.redis.get(self._key("served")) or 0),
+                "domain_order": [domain.decode() for domain in domains],
+                "timestamp": time.time()
+            }
+        except Exception as e:
+            logger.error(f"Error reading admission stats: {str(e)}")
+            return {"queued_by_domain": {}, "queued_total": 0, "error": str(e)}
@@ -0,0 +1,155 @@
+# services/bulk_ingest.py
+import json
+import hashlib
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import List, Dict, Any, Optional
+import logging
+
+from schemas import TEAM_NAME_MAX_LENGTH
+
+logger = logging.getLogger(__name__)
+
+PDF_MAGIC = b"%PDF-"
+ZIP_MAGIC = b"PK\x03\x04"
+MANIFEST_FILENAME = "manifest.json"
+
+
+class BulkIngestError(ValueError):
+    """Raised when an archive or its manifest cannot be ingested"""
+
+
+def _is_pdf_member(info: zipfile.ZipInfo) -> bool:
+    """PDF files in the archive, skipping directories and macOS metadata"""
+    path = PurePosixPath(info.filename)
+    return (
+        not info.is_dir()
+        and path.suffix.lower() == ".pdf"
+        and "__MACOSX" not in path.parts
+        and not path.name.startswith(".")
+    )
+
+
+def parse_manifest(raw_manifest: Optional[str]) -> Dict[str, str]:
+    """
+    Parse a team-name manifest
+
+    Accepts either {"deck.pdf": "Team Name", ...} or
+    [{"file": "deck.pdf", "team_name": "Team Name"}, ...].
+
+    Args:
+        raw_manifest: JSON text, or None
+
+    Returns:
+        Mapping of archive path (or bare file name) to team name
+    """
+    if not raw_manifest:
+        return {}
+
+    try:
+        manifest = json.loads(raw_manifest)
+    except json.JSONDecodeError as e:
+        raise BulkIngestError(f"Invalid manifest JSON: {str(e)}")
+
+    if isinstance(manifest, dict):
+        return {str(name): str(team) for name, team in manifest.items()}
+    if isinstance(manifest, list):
+        try:
+            return {str(entry["file"]): str(entry["team_name"]) for entry in manifest}
+        except (TypeError, KeyError):
+            raise BulkIngestError("Manifest entries need 'file' and 'team_name'")
+
+    raise BulkIngestError("Manifest must be a JSON object or list")
+
+
+def read_archive_entries(
+    archive_path: Path,
+    raw_manifest: Optional[str],
+    max_file_bytes: int,
+    max_files: int
+) -> List[Dict[str, Any]]:
+    """
+    List the decks in a ZIP archive with their team names
+
+    The manifest comes from the request or, failing that, from a
+    manifest.json at the archive root. Decks missing from the manifest are
+    named after their file stem. Every member is size-checked from the ZIP
+    directory and its PDF header is verified before anything is extracted.
+
+    Args:
+        archive_path: Path to the uploaded ZIP file
+        raw_manifest: Manifest JSON from the request, if any
+        max_file_bytes: Largest allowed uncompressed deck
+        max_files: Largest allowed number of decks
+
+    Returns:
+        List of {"member", "team_name", "size"} in archive order
+    """
+    try:
+        archive = zipfile.ZipFile(archive_path)
+    except zipfile.BadZipFile:
+        raise BulkIngestError("File is not a valid ZIP archive")
+
+    with archive:
+        if not raw_manifest and MANIFEST_FILENAME in archive.namelist():
+            raw_manifest = archive.read(MANIFEST_FILENAME).decode("utf-8")
+        team_names = parse_manifest(raw_manifest)
+
+        members = [info for info in archive.infolist() if _is_pdf_member(info)]
+        if not members:
+            raise BulkIngestError("Archive contains no PDF files")
+        if len(members) > max_files:
+            raise BulkIngestError(f"Archive contains {len(members)} PDFs, the limit is {max_files}")
+
+        entries = []
+        for info in members:
+            # Uncompressed sizes come from the ZIP directory, guarding against zip bombs
+            if info.file_size > max_file_bytes:
+                raise BulkIngestError(f"{info.filename} exceeds the {max_file_bytes} byte limit")
+
+            with archive.open(info) as member:
+                if PDF_MAGIC not in member.read(1024):
+                    raise BulkIngestError(f"{info.filename} is not a valid PDF")
+
+            path = PurePosixPath(info.filename)
+            team_name = team_names.get(info.filename) or team_names.get(path.name) or path.stem
+            entries.append({
+                "member": info.filename,
+                "team_name": team_name[:TEAM_NAME_MAX_LENGTH],
+                "size": info.file_size
+            })
+
+        return entries
+
+
+def extract_members(
+    archive_path: Path,
+    targets: List[Dict[str, Any]],
+    chunk_size: int = 1024 * 1024
+) -> List[str]:
+    """
+    Stream archive members to disk, hashing each on the way
+
+    Args:
+        archive_path: Path to the ZIP file
+        targets: List of {"member": archive path, "destination": Path}
+        chunk_size: Bytes per read
+
+    Returns:
+        Hex SHA-256 of each extracted file, in target order
+    """
+    digests = []
+    with zipfile.ZipFile(archive_path) as archive:
+        for target in targets:
+            destination = target["destination"]
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            digest = hashlib.sha256()
+
+            with archive.open(target["member"]) as source, open(destination, "wb") as output:
+                for chunk in iter(lambda: source.read(chunk_size), b""):
+                    digest.update(chunk)
+                    output.write(chunk)
+
+            digests.append(digest.hexdigest())
+
+    return digests
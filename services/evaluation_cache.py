@@ -0,0 +1,153 @@
+# services/evaluation_cache.py
+import os
+import json
+import copy
+import hashlib
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Callable
+import logging
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import EvaluationCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationResultCache:
+    """
+    Persistent cache of Gemini evaluations
+
+    Keyed by the ordered slide hashes plus the evaluation fingerprint (prompt
+    hash, model name, generation config), so the same slides judged under the
+    same rubric prompt reuse the stored response instead of spending a Gemini
+    request. Weights are applied later during scoring and are not part of the key.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], ttl_hours: Optional[int] = None):
+        self.session_factory = session_factory
+        self.ttl = timedelta(hours=ttl_hours or int(os.getenv("EVALUATION_CACHE_TTL_HOURS", 24 * 7)))
+
+    def build_key(self, slide_hashes: List[str], fingerprint: Dict[str, Any]) -> str:
+        """
+        Build the cache key for an evaluation
+
+        Args:
+            slide_hashes: SHA-256 of each slide, in page order
+            fingerprint: GeminiService.evaluation_fingerprint() output
+
+        Returns:
+            Hex cache key
+        """
+        payload = json.dumps({"slides": slide_hashes, **fingerprint}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached evaluation
+
+        Args:
+            cache_key: Key from build_key()
+
+        Returns:
+            Copy of the cached Gemini response, or None on a miss or expiry
+        """
+        db = self.session_factory()
+        try:
+            entry = db.query(EvaluationCacheEntry).filter(
+                EvaluationCacheEntry.cache_key == cache_key
+            ).first()
+            if not entry:
+                return None
+
+            if entry.is_expired:
+                db.delete(entry)
+                db.commit()
+                return None
+
+            entry.hit_count += 1
+            entry.last_hit_at = datetime.utcnow()
+            db.commit()
+
+            response = copy.deepcopy(entry.gemini_response)
+            response.setdefault("metadata", {})["evaluation_cache"] = {
+                "hit": True,
+                "cache_key": cache_key,
+                "cached_at": entry.created_at.isoformat() if entry.created_at else None
+            }
+            logger.info(f"Evaluation cache hit for {cache_key[:12]} ({entry.hit_count} hits)")
+            return response
+
+        except Exception as e:
+            # A cache failure must never block an evaluation
+            logger.error(f"Error reading evaluation cache: {str(e)}")
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    def put(self, cache_key: str, gemini_response: Dict[str, Any], model_name: str, slide_count: int) -> bool:
+        """
+        Store an evaluation, replacing any previous entry for the key
+
+        Fallback and partial responses are never cached: unparseable Gemini
+        output, fields that still failed validation after re-asking, or
+        map-reduce chunks that could not be summarized. Those are judged
+        afresh next time instead of being served from the cache.
+
+        Args:
+            cache_key: Key from build_key()
+            gemini_response: Response returned by GeminiService
+            model_name: Gemini model that produced the response
+            slide_count: Number of slides evaluated
+
+        Returns:
+            True if stored, False otherwise
+        """
+        metadata = gemini_response.get("metadata", {})
+        if metadata.get("parsing_error") or metadata.get("validation_errors") or metadata.get("failed_chunks"):
+            return False
+
+        db = self.session_factory()
+        try:
+            db.query(EvaluationCacheEntry).filter(
+                EvaluationCacheEntry.cache_key == cache_key
+            ).delete()
+            db.add(EvaluationCacheEntry(
+                cache_key=cache_key,
+                model_name=model_name,
+                slide_count=slide_count,
+                gemini_response=gemini_response,
+                expires_at=datetime.utcnow() + self.ttl
+            ))
+            db.commit()
+            return True
+
+        except IntegrityError:
+            # Another worker stored the same evaluation concurrently
+            db.rollback()
+            return False
+        except Exception as e:
+            logger.error(f"Error writing evaluation cache: {str(e)}")
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        """
+        Delete expired entries (admin/maintenance function)
+
+        Returns:
+            Number of entries deleted
+        """
+        db = self.session_factory()
+        try:
+            deleted = db.query(EvaluationCacheEntry).filter(
+                EvaluationCacheEntry.expires_at <= datetime.utcnow()
+            ).delete()
+            db.commit()
+            return deleted
+        finally:
+            db.close()
@@ -0,0 +1,126 @@
+# services/evaluation_queue.py
+import json
+import time
+from typing import Dict, Any, Optional, Tuple
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationJobQueue:
+    """
+    Redis job queue feeding the asyncio evaluation worker
+
+    Used instead of the Celery evaluation queue when EVALUATION_MODE=async.
+    Claimed jobs are moved to a per-worker processing list and only removed
+    once handled, so a worker that dies mid-evaluation gets its jobs back on
+    restart. Failed jobs wait in a delayed sorted set until their retry is due.
+    """
+
+    def __init__(self, redis_client: redis.Redis, name: str = "evaluation_jobs"):
+        self.redis = redis_client
+        self.pending_key = name
+        self.delayed_key = f"{name}:delayed"
+        self.processing_prefix = f"{name}:processing"
+
+    def _processing_key(self, worker_name: str) -> str:
+        return f"{self.processing_prefix}:{worker_name}"
+
+    def push(
+        self,
+        submission_id: int,
+        bypass_cache: bool = False,
+        attempt: int = 0,
+        delay_seconds: float = 0,
+        admission_timeouts: int = 0
+    ) -> None:
+        """
+        Queue an evaluation
+
+        Args:
+            submission_id: Submission to evaluate
+            bypass_cache: Force a fresh Gemini judgement
+            attempt: Number of failed attempts so far
+            delay_seconds: Hold the job back for this long (retry backoff)
+            admission_timeouts: Times the job gave up waiting for a Gemini slot
+        """
+        job = json.dumps({
+            "submission_id": submission_id,
+            "bypass_cache": bypass_cache,
+            "attempt": attempt,
+            "admission_timeouts": admission_timeouts,
+            "queued_at": time.time()
+        })
+        if delay_seconds > 0:
+            self.redis.zadd(self.delayed_key, {job: time.time() + delay_seconds})
+        else:
+            self.redis.rpush(self.pending_key, job)
+
+    def promote_due(self) -> int:
+        """
+        Move delayed jobs whose retry time has passed onto the pending list
+
+        Returns:
+            Number of jobs promoted
+        """
+        due = self.redis.zrangebyscore(self.delayed_key, 0, time.time())
+        promoted = 0
+        for job in due:
+            # Only the worker that removes the job gets to requeue it
+            if self.redis.zrem(self.delayed_key, job):
+                self.redis.rpush(self.pending_key, job)
+                promoted += 1
+        return promoted
+
+    def claim(self, worker_name: str, timeout: float = 1.0) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        """
+        Block until a job is available and move it to this worker's processing list
+
+        Args:
+            worker_name: Name identifying the worker
+            timeout: Seconds to wait for a job
+
+        Returns:
+            (raw job, decoded job), or None on timeout
+        """
+        raw = self.redis.blmove(self.pending_key, self._processing_key(worker_name), timeout, "LEFT", "RIGHT")
+        if raw is None:
+            return None
+        return raw, json.loads(raw)
+
+    def complete(self, worker_name: str, raw: bytes) -> None:
+        """Drop a handled job from the worker's processing list"""
+        self.redis.lrem(self._processing_key(worker_name), 1, raw)
+
+    def recover(self, worker_name: str) -> int:
+        """
+        Requeue jobs left in a worker's processing list by a previous run
+
+        Returns:
+            Number of jobs requeued
+        """
+        recovered = 0
+        while self.redis.lmove(self._processing_key(worker_name), self.pending_key, "RIGHT", "LEFT"):
+            recovered += 1
+        if recovered:
+            logger.warning(f"Requeued {recovered} unfinished evaluations from worker {worker_name}")
+        return recovered
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get queue lengths
+
+        Returns:
+            Dictionary with pending and delayed job counts
+        """
+        try:
+            return {
+                "pending": self.redis.llen(self.pending_key),
+                "delayed": self.redis.zcard(self.delayed_key),
+                "timestamp": time.time()
+            }
+        except Exception as e:
+            logger.error(f"Error reading evaluation queue stats: {str(e)}")
+            return {"pending": 0, "delayed": 0, "error": str(e)}
@@ -0,0 +1,150 @@
+# services/gemini_files.py
+import os
+import json
+import time
+import shutil
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+FILE_MODES = ("files_api", "local", "inline")
+
+
+class SlideFileCache:
+    """
+    Upload slide images once and reuse the handles across requests
+
+    Handles are cached in Redis per (API key, slide SHA-256), so retries and
+    re-evaluations of the same slides send file references instead of image
+    bytes. Uploaded files belong to the key's project, which is why the key is
+    part of the cache key.
+
+    Modes (GEMINI_FILE_MODE):
+        files_api: upload through the Gemini files API and send file_data references
+        local: stand-in for the files API; slides are stored once under a local
+            content-addressed directory and sent inline from there (no API uploads,
+            for development and keys without files API access)
+        inline: no uploads, every request carries the image bytes
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        mode: Optional[str] = None,
+        ttl_hours: Optional[int] = None,
+        local_root: Optional[Path] = None
+    ):
+        self.redis = redis_client
+        self.mode = mode or os.getenv("GEMINI_FILE_MODE", "files_api")
+        if self.mode not in FILE_MODES:
+            raise ValueError(f"Unknown GEMINI_FILE_MODE '{self.mode}', expected one of {', '.join(FILE_MODES)}")
+
+        # The files API deletes uploads after 48 hours; expire handles well before
+        self.ttl_seconds = int((ttl_hours or int(os.getenv("GEMINI_FILE_TTL_HOURS", 46))) * 3600)
+        self.local_root = Path(local_root or os.getenv("GEMINI_LOCAL_FILES_PATH", "storage/gemini_files"))
+        self.key_prefix = "gemini_file"
+        self.stats_key = f"{self.key_prefix}:stats"
+
+    def _cache_key(self, key_hash: str, slide_sha256: str) -> str:
+        return f"{self.key_prefix}:{key_hash[:16]}:{slide_sha256}"
+
+    def _increment(self, counter: str, amount: int = 1) -> None:
+        try:
+            self.redis.hincrby(self.stats_key, counter, amount)
+        except Exception as e:
+            logger.error(f"Error updating slide file stats: {str(e)}")
+
+    def _upload(self, key: Dict[str, Any], path: str, mime_type: str, slide_sha256: str) -> Dict[str, str]:
+        """Upload one slide and describe the resulting handle"""
+        if self.mode == "local":
+            local_path = self.local_root / slide_sha256[:2] / f"{slide_sha256}{Path(path).suffix}"
+            if not local_path.exists():
+                local_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = local_path.with_name(f".{local_path.name}.tmp{os.getpid()}")
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, local_path)
+            return {"name": f"local/{slide_sha256}", "uri": str(local_path), "mime_type": mime_type}
+
+        uploaded = key["file_client"].create_file(
+            path=path, mime_type=mime_type, display_name=f"slide-{slide_sha256[:16]}"
+        )
+        return {"name": uploaded.name, "uri": uploaded.uri, "mime_type": uploaded.mime_type or mime_type}
+
+    def _to_part(self, handle: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Request part for a handle, or None if a local handle lost its file"""
+        if self.mode == "local":
+            local_path = Path(handle["uri"])
+            if not local_path.exists():
+                return None
+            return {"mime_type": handle["mime_type"], "data": local_path.read_bytes()}
+        return {"file_data": {"mime_type": handle["mime_type"], "file_uri": handle["uri"]}}
+
+    def get_part(self, key: Dict[str, Any], path: str, mime_type: str, slide_sha256: str) -> Dict[str, Any]:
+        """
+        Get the request part for one slide, uploading it on first use
+
+        Args:
+            key: Key pool entry the request will be sent with
+            path: Slide image path
+            mime_type: Slide image MIME type
+            slide_sha256: SHA-256 of the slide file
+
+        Returns:
+            file_data reference, or inline image bytes (inline mode, local
+            stand-in, or when the upload path fails)
+        """
+        if self.mode == "inline":
+            return {"mime_type": mime_type, "data": Path(path).read_bytes()}
+
+        cache_key = self._cache_key(key["key_hash"], slide_sha256)
+        try:
+            cached = self.redis.get(cache_key)
+            if cached:
+                part = self._to_part(json.loads(cached))
+                if part is not None:
+                    self._increment("reused")
+                    return part
+
+            handle = self._upload(key, path, mime_type, slide_sha256)
+            self.redis.set(cache_key, json.dumps(handle), ex=self.ttl_seconds)
+            self._increment("uploaded")
+            return self._to_part(handle)
+
+        except Exception as e:
+            # Uploads are an optimization: fall back to sending the bytes
+            logger.error(f"Error uploading slide {slide_sha256[:12]}: {str(e)}")
+            self._increment("inline_fallbacks")
+            return {"mime_type": mime_type, "data": Path(path).read_bytes()}
+
+    def invalidate(self, key: Dict[str, Any], slide_hashes: List[str]) -> None:
+        """Forget cached handles for a key, e.g. after the API reports them missing"""
+        try:
+            self.redis.delete(*[self._cache_key(key["key_hash"], slide_sha256) for slide_sha256 in slide_hashes])
+        except Exception as e:
+            logger.error(f"Error invalidating slide file handles: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get upload/reuse counters
+
+        Returns:
+            Dictionary with slide file cache statistics
+        """
+        counters = {"uploaded": 0, "reused": 0, "inline_fallbacks": 0}
+        try:
+            shared = self.redis.hgetall(self.stats_key)
+            counters = {name: int(shared.get(name.encode(), 0)) for name in counters}
+        except Exception as e:
+            logger.error(f"Error reading slide file stats: {str(e)}")
+
+        requests = counters["uploaded"] + counters["reused"]
+        return {
+            "mode": self.mode,
+            **counters,
+            "reuse_rate": counters["reused"] / requests if requests else 0.0,
+            "timestamp": time.time()
+        }
@@ -0,0 +1,253 @@
+# services/gemini_key_pool.py
+import os
+import time
+import asyncio
+import hashlib
+from typing import List, Dict, Any
+import logging
+
+import redis
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+from google.api_core import exceptions as google_exceptions
+
+from services.rate_limiter import GeminiRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# google.generativeai has no public way to give a model its own API key, so
+# per-key clients are built from these internals; requirements.txt pins the
+# exact version they were checked against
+SUPPORTED_GENAI_VERSION = "0.8.5"
+
+
+def hash_api_key(api_key: str) -> str:
+    """Stable, non-reversible identifier for an API key (APIRateLimit.api_key_hash)"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def load_api_keys() -> List[str]:
+    """
+    Read the Gemini API keys from the environment
+
+    GOOGLE_AI_API_KEYS holds a comma-separated pool; GOOGLE_AI_API_KEY is
+    still honoured as a single-key pool.
+
+    Returns:
+        List of distinct API keys, in configured order
+    """
+    raw_keys = os.getenv("GOOGLE_AI_API_KEYS") or os.getenv("GOOGLE_AI_API_KEY") or ""
+    api_keys = []
+    for api_key in raw_keys.split(","):
+        api_key = api_key.strip()
+        if api_key and api_key not in api_keys:
+            api_keys.append(api_key)
+    return api_keys
+
+
+class GeminiKeyPool:
+    """
+    Pool of Gemini API keys, each with its own rate limit bucket
+
+    Every key gets its own client (instead of the process-wide genai.configure)
+    and its own GCRA bucket identified by the key hash. Calls go to the healthy
+    key with the most remaining budget. Keys that answer with quota errors are
+    quarantined briefly; keys that fail authentication are quarantined for
+    long enough that an operator notices. Quarantine is shared across workers
+    through Redis.
+    """
+
+    def __init__(
+        self,
+        api_keys: List[str],
+        redis_client: redis.Redis,
+        model_name: str,
+        max_requests_per_key: int = 10,
+        window_minutes: int = 1
+    ):
+        if not api_keys:
+            raise ValueError("At least one Gemini API key is required")
+
+        self.redis = redis_client
+        self.model_name = model_name
+        self.quarantine_prefix = "gemini_key_quarantine"
+        self.quota_quarantine_seconds = int(os.getenv("GEMINI_QUOTA_QUARANTINE_SECONDS", 60))
+        self.auth_quarantine_seconds = int(os.getenv("GEMINI_AUTH_QUARANTINE_SECONDS", 3600))
+
+        if genai.__version__ != SUPPORTED_GENAI_VERSION:
+            logger.warning(
+                f"google-generativeai {genai.__version__} is installed but the key pool was checked against "
+                f"{SUPPORTED_GENAI_VERSION}; per-key clients rely on its internals"
+            )
+
+        self.keys = []
+        for api_key in api_keys:
+            key_hash = hash_api_key(api_key)
+            self.keys.append({
+                "key_hash": key_hash,
+                "label": key_hash[:8],
+                **self._build_clients(api_key),
+                "limiter": GeminiRateLimiter(redis_client, max_requests_per_key, window_minutes)
+            })
+
+        logger.info(f"Gemini key pool ready with {len(self.keys)} keys")
+
+    def _build_clients(self, api_key: str) -> Dict[str, Any]:
+        """Create a model and files client bound to their own API key rather than the global configuration"""
+        manager_class = getattr(genai_client, "_ClientManager", None)
+        model = genai.GenerativeModel(self.model_name)
+        if manager_class is None or not hasattr(manager_class, "make_client") or not hasattr(model, "_async_client"):
+            raise RuntimeError(
+                f"google-generativeai {genai.__version__} does not have the client internals the key pool "
+                f"needs; install google-generativeai=={SUPPORTED_GENAI_VERSION}"
+            )
+
+        manager = manager_class()
+        manager.configure(api_key=api_key)
+        model._client = manager.make_client("generative")
+
+        # Uploaded files belong to the key's project, so uploads go through the same key.
+        # The async client is created on first use, see async_model
+        return {
+            "model": model,
+            "file_client": manager.make_client("file"),
+            "client_manager": manager,
+            "async_loop": None
+        }
+
+    def async_model(self, key: Dict[str, Any]) -> genai.GenerativeModel:
+        """
+        Model whose async client is bound to the running event loop
+
+        gRPC asyncio channels belong to the loop they were created on, so the
+        async client is (re)built whenever a key is used from a new loop.
+        """
+        loop = asyncio.get_running_loop()
+        if key["async_loop"] is not loop:
+            key["model"]._async_client = key["client_manager"].make_client("generative_async")
+            key["async_loop"] = loop
+        return key["model"]
+
+    def _quarantine_key(self, key: Dict[str, Any]) -> str:
+        return f"{self.quarantine_prefix}:{key['key_hash']}"
+
+    def healthy_keys(self) -> List[Dict[str, Any]]:
+        """Keys not currently quarantined (all keys if Redis is unavailable)"""
+        try:
+            flags = self.redis.mget([self._quarantine_key(key) for key in self.keys])
+        except Exception as e:
+            logger.error(f"Error reading key quarantine: {str(e)}")
+            return list(self.keys)
+        return [key for key, flag in zip(self.keys, flags) if flag is None]
+
+    def healthy_count(self) -> int:
+        """Number of usable keys; the admission rate scales with this"""
+        return len(self.healthy_keys())
+
+    def acquire(self, weight: int = 1, admitted: bool = False) -> Dict[str, Any]:
+        """
+        Pick the healthy key with the most remaining budget and consume from it
+
+        Args:
+            weight: Request units the call will consume
+            admitted: The admission scheduler already paced this call; it is
+                charged to the least loaded key instead of waiting for it again
+
+        Returns:
+            Dictionary with the chosen key (or None) and, when no key could be
+            used, the seconds until one is expected to be
+        """
+        healthy = self.healthy_keys()
+        if not healthy:
+            return {"key": None, "retry_after": self._next_release()}
+
+        # Least loaded first: the key whose bucket is furthest from full
+        candidates = sorted(
+            ((key["limiter"].peek(key["key_hash"], weight), key) for key in healthy),
+            key=lambda candidate: candidate[0]["backlog_seconds"]
+        )
+
+        if admitted:
+            key = candidates[0][1]
+            key["limiter"].charge(key["key_hash"], weight)
+            return {"key": key, "retry_after": 0.0}
+
+        retry_after = None
+        for state, key in candidates:
+            if not state["allowed"]:
+                retry_after = state["retry_after"] if retry_after is None else min(retry_after, state["retry_after"])
+                continue
+            # Another worker may have taken the slot since the peek
+            result = key["limiter"].try_acquire(key["key_hash"], weight)
+            if result["allowed"]:
+                return {"key": key, "retry_after": 0.0}
+            retry_after = result["retry_after"] if retry_after is None else min(retry_after, result["retry_after"])
+
+        return {"key": None, "retry_after": retry_after or 0.0}
+
+    def _next_release(self) -> float:
+        """Seconds until the first quarantined key is released"""
+        try:
+            pipe = self.redis.pipeline()
+            for key in self.keys:
+                pipe.pttl(self._quarantine_key(key))
+            ttls = [ttl for ttl in pipe.execute() if ttl and ttl > 0]
+            return min(ttls) / 1000 if ttls else 0.0
+        except Exception as e:
+            logger.error(f"Error reading key quarantine: {str(e)}")
+            return 0.0
+
+    def quarantine(self, key: Dict[str, Any], seconds: int, reason: str) -> None:
+        """Take a key out of rotation for the given number of seconds"""
+        try:
+            self.redis.set(self._quarantine_key(key), reason, ex=seconds)
+            logger.warning(f"Gemini key {key['label']} quarantined for {seconds}s: {reason}")
+        except Exception as e:
+            logger.error(f"Error quarantining Gemini key {key['label']}: {str(e)}")
+
+    def report_error(self, key: Dict[str, Any], error: Exception) -> bool:
+        """
+        Quarantine a key if the error was caused by the key itself
+
+        Args:
+            key: Key that made the failing call
+            error: Exception raised by the Gemini client
+
+        Returns:
+            True if the key was quarantined (the call can be retried on another key)
+        """
+        if isinstance(error, google_exceptions.ResourceExhausted):
+            self.quarantine(key, self.quota_quarantine_seconds, "quota")
+            return True
+
+        if isinstance(error, (google_exceptions.Unauthenticated, google_exceptions.PermissionDenied)) or (
+            isinstance(error, google_exceptions.InvalidArgument) and "API key" in str(error)
+        ):
+            self.quarantine(key, self.auth_quarantine_seconds, "auth")
+            return True
+
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get per-key health and budget
+
+        Returns:
+            Dictionary with key pool statistics (keys identified by hash prefix)
+        """
+        healthy_hashes = {key["key_hash"] for key in self.healthy_keys()}
+        keys = []
+        for key in self.keys:
+            state = key["limiter"].peek(key["key_hash"])
+            keys.append({
+                "key": key["label"],
+                "healthy": key["key_hash"] in healthy_hashes,
+                "remaining_requests": state["remaining"],
+                "retry_after_seconds": state["retry_after"]
+            })
+        return {
+            "total_keys": len(self.keys),
+            "healthy_keys": len(healthy_hashes),
+            "keys": keys,
+            "timestamp": time.time()
+        }
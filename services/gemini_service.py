@@ -3,25 +3,79 @@ import google.generativeai as genai
 import os
 import json
 import time
+import asyncio
+import math
+from contextlib import contextmanager
+from contextvars import ContextVar
 from typing import List, Dict, Any, Optional
 import logging
 from PIL import Image
 import base64
+import hashlib
 import io
+import mimetypes
 from pathlib import Path
+import redis
+
+from google.api_core import exceptions as google_exceptions
+
+from services.gemini_key_pool import GeminiKeyPool, load_api_keys
+from services.gemini_files import SlideFileCache
+from services.slide_budget import SlideBudgeter
+from services.json_stream import StreamingJSONValidator, MalformedResponseError, validation_errors
+from services.response_schemas import ResponseSchemaCache, field_model, response_schema
 
 logger = logging.getLogger(__name__)
 
+IMAGE_MIME_TYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+# Calls of the current evaluation the admission scheduler has already paced (see admitted_calls)
+_admitted_calls: ContextVar[Optional[List[int]]] = ContextVar("gemini_admitted_calls", default=None)
+
 class GeminiService:
     """Service for interacting with Google AI Studio Gemini API"""
     
-    def __init__(self):
-        self.api_key = os.getenv("GOOGLE_AI_API_KEY")
-        if not self.api_key:
-            raise ValueError("GOOGLE_AI_API_KEY environment variable not set")
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        api_keys = load_api_keys()
+        if not api_keys:
+            raise ValueError("GOOGLE_AI_API_KEYS (or GOOGLE_AI_API_KEY) environment variable not set")
+        
+        self.model_name = 'gemini-2.5-flash-preview-04-17'
+        redis_client = redis_client or redis.Redis(host='localhost', port=6379, db=0)
+        
+        # Each key has its own client and rate limit bucket
+        self.key_pool = GeminiKeyPool(api_keys, redis_client, self.model_name)
+        
+        # Slides are uploaded once per key and referenced by handle afterwards
+        self.slide_files = SlideFileCache(redis_client)
         
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17')
+        # Pre-send stage keeping each request within GEMINI_TOKEN_BUDGET
+        self.budgeter = SlideBudgeter()
+        self.max_key_wait_seconds = int(os.getenv("GEMINI_KEY_MAX_WAIT", 300))
+        
+        # Decks of at least this many slides are evaluated in chunks (map) whose
+        # summaries are combined by a final text-only call (reduce)
+        self.map_reduce_min_slides = int(os.getenv("GEMINI_MAP_REDUCE_MIN_SLIDES", 40))
+        self.chunk_size = int(os.getenv("GEMINI_CHUNK_SIZE", 12))
+        self.map_concurrency = int(os.getenv("GEMINI_MAP_CONCURRENCY", 4))
+        
+        # Responses are validated while they stream; a malformed one is abandoned
+        # and re-asked up to this many times, the last attempt keeping any parseable JSON
+        self.malformed_retries = int(os.getenv("GEMINI_MALFORMED_RETRIES", 1))
+        
+        # Responses are constrained by a JSON schema built from the domain's criteria;
+        # fields that still fail validation are re-asked on their own
+        self.structured_output = os.getenv("GEMINI_STRUCTURED_OUTPUT", "true").lower() == "true"
+        self.reask_attempts = int(os.getenv("GEMINI_REASK_ATTEMPTS", 2))
+        self.response_schemas = ResponseSchemaCache()
+        
+        # Generation settings for evaluations (also part of the evaluation cache key)
+        self.generation_config = {
+            "temperature": 0.3,  # Lower temperature for more consistent scoring
+            "top_p": 0.8,
+            "top_k": 40,
+            "max_output_tokens": 4096,
+        }
         
         # Comprehensive evaluation prompt template
         self.evaluation_prompt_template = """
@@ -71,40 +125,224 @@ Respond in this exact JSON format:
 }}
 """
     
-    def prepare_evaluation_prompt(self, domain_info: Dict[str, Any]) -> str:
-        """Prepare the evaluation prompt with domain-specific information"""
+        # Map step of map-reduce evaluations: one call per chunk of slides
+        self.chunk_prompt_template = """
+You are an expert hackathon judge. You will receive slides {first_slide} to {last_slide} of a {total_slides}-slide presentation (part {part_number} of {part_count}).
+The other parts are reviewed separately; your summary will be combined with theirs to judge the complete presentation, so capture everything a judge would need without seeing these images.
+
+Domain-Specific Context: {domain_name}
+Domain Description: {domain_description}
+
+Evaluation Criteria (score 1-10 for each, based only on these slides; use null when this part does not address a criterion):
+{criteria_descriptions}
+
+Respond in this exact JSON format:
+{{
+  "part_summary": "What these slides present, in order: key claims, numbers, architecture, demo and business details",
+  "criteria_evidence": {{
+    {criteria_evidence_fields}
+  }},
+  "strengths": ["Clear architecture diagram"],
+  "weaknesses": ["No evaluation metrics shown"],
+  "slide_by_slide_notes": [
+    {{"slide": {first_slide}, "note": "Clear statement of the problem"}}
+  ]
+}}
+"""
         
-        # Format criteria descriptions
+        # Reduce step: final judgement from the part summaries, no images
+        self.reduce_prompt_template = """
+You are an expert hackathon judge producing the final evaluation of a {total_slides}-slide presentation.
+The presentation was reviewed in {part_count} consecutive parts; their summaries are below in slide order.
+Judge it as one complete story: how the parts connect narratively, whether all essential aspects are covered, and whether the messaging stays consistent.
+
+Domain-Specific Context: {domain_name}
+Domain Description: {domain_description}
+
+Evaluation Criteria (score 1-10 for each):
+{criteria_descriptions}
+
+Additional Analysis:
+- Presentation Flow Score (1-10): How well slides connect narratively
+- Completeness Score (1-10): Whether all essential aspects are covered
+- Consistency Score (1-10): Message consistency across slides
+
+Part summaries (JSON, in slide order):
+{part_summaries}
+
+Respond in this exact JSON format:
+{{
+  "overall_analysis": {{
+    "presentation_flow_score": 8,
+    "completeness_score": 7,
+    "consistency_score": 9,
+    "total_slides_analyzed": {total_slides}
+  }},
+  "criteria_scores": {{
+    {criteria_score_fields}
+  }},
+  "detailed_feedback": {{
+    "strengths": ["Excellent problem identification", "Clear technical architecture"],
+    "weaknesses": ["Demo section unclear"],
+    "suggestions": ["Add more technical details", "Strengthen demo section"]
+  }},
+  "executive_summary": "Overall judgement of the complete presentation."
+}}
+"""
+    
+        # Follow-up for fields of a response that failed validation (text only)
+        self.reask_prompt_template = """
+You are completing a hackathon presentation evaluation you already wrote. Some of its fields were missing or invalid:
+{errors}
+
+Your evaluation so far (JSON):
+{previous}
+
+Respond with a JSON object containing only these fields, corrected and complete: {fields}
+Keep them consistent with the rest of the evaluation. The slides are not attached again.
+"""
+    
+    def _format_criteria(self, domain_info: Dict[str, Any]) -> Dict[str, str]:
+        """Numbered criteria descriptions and example JSON fields for the prompt templates"""
         criteria_descriptions = []
         criteria_score_fields = []
+        criteria_evidence_fields = []
         
         for key, description in domain_info["judging_criteria"].items():
             criteria_descriptions.append(f"{key.replace('_', ' ').title()}: {description}")
             criteria_score_fields.append(f'"{key}": 8')
+            criteria_evidence_fields.append(f'"{key}": {{"score": 7, "evidence": "What these slides show for this criterion"}}')
         
-        criteria_desc_text = "\n".join([f"{i+1}. {desc}" for i, desc in enumerate(criteria_descriptions)])
-        criteria_score_text = ",\n    ".join(criteria_score_fields)
-        
-        prompt = self.evaluation_prompt_template.format(
-            domain_name=domain_info["name"],
-            domain_description=domain_info["description"],
-            criteria_descriptions=criteria_desc_text,
-            criteria_score_fields=criteria_score_text
+        return {
+            "domain_name": domain_info["name"],
+            "domain_description": domain_info["description"],
+            "criteria_descriptions": "\n".join([f"{i+1}. {desc}" for i, desc in enumerate(criteria_descriptions)]),
+            "criteria_score_fields": ",\n    ".join(criteria_score_fields),
+            "criteria_evidence_fields": ",\n    ".join(criteria_evidence_fields)
+        }
+    
+    def prepare_evaluation_prompt(self, domain_info: Dict[str, Any]) -> str:
+        """Prepare the evaluation prompt with domain-specific information"""
+        criteria = self._format_criteria(domain_info)
+        return self.evaluation_prompt_template.format(
+            domain_name=criteria["domain_name"],
+            domain_description=criteria["domain_description"],
+            criteria_descriptions=criteria["criteria_descriptions"],
+            criteria_score_fields=criteria["criteria_score_fields"]
+        )
+    
+    def prepare_chunk_prompt(
+        self, domain_info: Dict[str, Any], chunk: List[Dict[str, Any]], part_number: int, part_count: int, total_slides: int
+    ) -> str:
+        """Prompt for the map step over one chunk of slides"""
+        criteria = self._format_criteria(domain_info)
+        return self.chunk_prompt_template.format(
+            first_slide=chunk[0]["number"],
+            last_slide=chunk[-1]["number"],
+            total_slides=total_slides,
+            part_number=part_number,
+            part_count=part_count,
+            domain_name=criteria["domain_name"],
+            domain_description=criteria["domain_description"],
+            criteria_descriptions=criteria["criteria_descriptions"],
+            criteria_evidence_fields=criteria["criteria_evidence_fields"]
         )
+    
+    def prepare_reduce_prompt(self, domain_info: Dict[str, Any], part_summaries: List[Dict[str, Any]], total_slides: int) -> str:
+        """Prompt for the reduce step over the part summaries"""
+        criteria = self._format_criteria(domain_info)
+        return self.reduce_prompt_template.format(
+            total_slides=total_slides,
+            part_count=len(part_summaries),
+            part_summaries=json.dumps(part_summaries, indent=2),
+            domain_name=criteria["domain_name"],
+            domain_description=criteria["domain_description"],
+            criteria_descriptions=criteria["criteria_descriptions"],
+            criteria_score_fields=criteria["criteria_score_fields"]
+        )
+    
+    def evaluation_mode(self, slide_count: int) -> str:
+        """Evaluation mode for a deck: serial (all slides in one request) or map_reduce"""
+        return "map_reduce" if slide_count >= self.map_reduce_min_slides else "serial"
+    
+    def planned_requests(self, slide_count: int) -> int:
+        """
+        Upper bound on the Gemini requests an evaluation of this many slides makes
         
-        return prompt
+        Used as the admission weight, so large decks take proportionally more
+        of the shared rate limit.
+        """
+        if self.evaluation_mode(slide_count) == "serial":
+            return 1
+        return math.ceil(slide_count / self.chunk_size) + 1
+    
+    @contextmanager
+    def admitted_calls(self, count: int):
+        """
+        Treat the next `count` Gemini calls made in this context as already admitted
+        
+        The admission scheduler charges the shared rate limit for a whole
+        evaluation (planned_requests). Calls it covered are charged to a key
+        without waiting on the key's limiter a second time; calls beyond that
+        (re-asks, retries) wait as usual. Chunk tasks started inside the block
+        share the same budget.
+        """
+        token = _admitted_calls.set([count])
+        try:
+            yield
+        finally:
+            _admitted_calls.reset(token)
+    
+    def _take_admitted_call(self) -> bool:
+        """Use one call of the current admission budget, if any is left"""
+        budget = _admitted_calls.get()
+        if not budget or budget[0] <= 0:
+            return False
+        budget[0] -= 1
+        return True
+    
+    def evaluation_fingerprint(self, domain_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Describe everything besides the slides that determines an evaluation
+        
+        Args:
+            domain_info: Domain configuration and criteria
+            
+        Returns:
+            Dictionary with the prompt hash, model name, generation config, pre-send
+            and map-reduce settings
+        """
+        prompt = self.prepare_evaluation_prompt(domain_info)
+        return {
+            "prompt_sha256": hashlib.sha256(prompt.encode()).hexdigest(),
+            "model_name": self.model_name,
+            "generation_config": self.generation_config,
+            "presend": self.budgeter.settings(),
+            "structured_output": self.structured_output,
+            "map_reduce": {"min_slides": self.map_reduce_min_slides, "chunk_size": self.chunk_size}
+        }
     
     async def analyze_complete_presentation(
         self, 
         image_paths: List[str], 
-        domain_info: Dict[str, Any]
+        domain_info: Dict[str, Any],
+        slide_hashes: Optional[List[str]] = None,
+        slide_dhashes: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
         Analyze a complete presentation using all slide images
         
+        Decks below GEMINI_MAP_REDUCE_MIN_SLIDES (after collapsing identical
+        slides) go to Gemini in a single request. Larger decks are evaluated
+        with map-reduce: chunks of slides are summarized in parallel, then one
+        text-only call judges the whole deck from the summaries. This keeps
+        every response well inside max_output_tokens.
+        
         Args:
             image_paths: List of paths to slide images
             domain_info: Domain configuration and criteria
+            slide_hashes: SHA-256 of each slide (from the manifest); computed if omitted
+            slide_dhashes: Perceptual hash of each slide (from the manifest); computed if omitted
             
         Returns:
             Comprehensive evaluation response
@@ -112,88 +350,571 @@ Respond in this exact JSON format:
         try:
             logger.info(f"Starting comprehensive presentation analysis for {len(image_paths)} slides")
             
-            # Prepare images for Gemini
-            images = []
-            for image_path in image_paths:
-                if os.path.exists(image_path):
-                    images.append(Image.open(image_path))
-                else:
-                    logger.warning(f"Image not found: {image_path}")
+            # Pair each slide with its content hash, which keys its uploaded file handle
+            images = await asyncio.to_thread(self._describe_slides, image_paths, slide_hashes, slide_dhashes)
             
             if not images:
                 raise ValueError("No valid images found for analysis")
             
-            # Prepare the evaluation prompt
-            prompt = self.prepare_evaluation_prompt(domain_info)
+            # Identical slides are collapsed across the whole deck, before any split
+            images, identical = await asyncio.to_thread(self.budgeter.collapse, images)
+            
+            if self.evaluation_mode(len(images)) == "map_reduce":
+                return await self._analyze_map_reduce(images, identical, domain_info, len(image_paths))
+            return await self._analyze_serial(images, identical, domain_info)
+                
+        except Exception as e:
+            logger.error(f"Error in comprehensive presentation analysis: {str(e)}")
+            raise
+    
+    async def _analyze_serial(
+        self, images: List[Dict[str, Any]], identical: List[Dict[str, int]], domain_info: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Evaluate all slides in a single request"""
+        # Prepare the evaluation prompt
+        prompt = self.prepare_evaluation_prompt(domain_info)
+        
+        logger.info("Prepared evaluation prompt for Gemini:")
+        logger.info(prompt)
+        
+        # Crop, drop near-duplicates or downscale until the request fits the token budget
+        images, budget_report = await asyncio.to_thread(self.budgeter.fit, images, prompt, identical)
+        prompt = self._annotate_omitted_slides(prompt, images, budget_report)
+        
+        # Make API call to Gemini
+        start_time = time.time()
+        
+        schemas = self.response_schemas.get(domain_info["judging_criteria"])
+        generation = await self._generate_json(prompt, images, schemas, "evaluation")
+        
+        processing_time = time.time() - start_time
+        evaluation_result = generation["result"]
+        
+        if evaluation_result is None:
+            logger.error(f"No valid JSON in the Gemini response after {len(generation['calls'])} attempts")
+            logger.error(f"Raw response: {generation['text']}")
+            
+            # Return fallback response
+            fallback = self._create_fallback_response(
+                len(images), processing_time, generation["text"], domain_info["judging_criteria"]
+            )
+            fallback["metadata"]["token_budget"] = budget_report
+            fallback["metadata"]["gemini_calls"] = generation["calls"]
+            return fallback
+        
+        self._expand_identical_slide_notes(evaluation_result, budget_report["identical"])
+        
+        # Add metadata
+        evaluation_result["metadata"] = {
+            "processing_time_seconds": processing_time,
+            "slides_analyzed": len(images),
+            "domain": domain_info["name"],
+            "gemini_model": self.model_name,
+            "evaluation_mode": "serial",
+            "token_budget": budget_report,
+            "gemini_calls": generation["calls"],
+            "validation_errors": generation["validation_errors"],
+            "reasked_fields": generation["reasked_fields"],
+            "timestamp": time.time()
+        }
+        
+        logger.info(f"Successfully analyzed presentation in {processing_time:.2f} seconds")
+        return evaluation_result
+    
+    async def _analyze_map_reduce(
+        self,
+        images: List[Dict[str, Any]],
+        identical: List[Dict[str, int]],
+        domain_info: Dict[str, Any],
+        total_slides: int
+    ) -> Dict[str, Any]:
+        """
+        Evaluate a large deck as chunk summaries (map) combined by one final call (reduce)
+        
+        Chunk requests run concurrently, at most GEMINI_MAP_CONCURRENCY at a
+        time, and each waits for its own key pool slot, so the per-key rate
+        limits still apply to every call.
+        
+        Args:
+            images: Slides left after collapsing identical slides
+            identical: Collapsed slides and the slide each one repeats
+            domain_info: Domain configuration and criteria
+            total_slides: Slide count of the original deck
+            
+        Returns:
+            Evaluation response in the same format as a single-request evaluation
+        """
+        chunks = [images[i:i + self.chunk_size] for i in range(0, len(images), self.chunk_size)]
+        logger.info(f"Map-reduce evaluation of {len(images)} slides in {len(chunks)} chunks")
+        
+        start_time = time.time()
+        slots = asyncio.Semaphore(self.map_concurrency)
+        
+        async def map_chunk(part_number: int, chunk: List[Dict[str, Any]]) -> Dict[str, Any]:
+            async with slots:
+                return await self._summarize_chunk(chunk, identical, domain_info, part_number, len(chunks), total_slides)
+        
+        parts = await asyncio.gather(*[map_chunk(i + 1, chunk) for i, chunk in enumerate(chunks)])
+        map_time = time.time() - start_time
+        
+        slide_notes = []
+        chunk_calls = []
+        for part in parts:
+            slide_notes.extend(part.pop("slide_by_slide_notes", []))
+            chunk_calls.extend(part.pop("gemini_calls"))
+        failed_parts = [part["part"] for part in parts if part.get("parsing_error")]
+        
+        metadata = {
+            "evaluation_mode": "map_reduce",
+            "chunks": len(chunks),
+            "chunk_size": self.chunk_size,
+            "failed_chunks": failed_parts,
+            "map_seconds": map_time,
+            "token_budget": {
+                "identical": identical,
+                "chunks": [part.pop("token_budget") for part in parts]
+            }
+        }
+        
+        if len(failed_parts) == len(parts):
+            logger.error("No chunk of the presentation could be summarized")
+            fallback = self._create_fallback_response(
+                len(images), map_time, json.dumps(parts), domain_info["judging_criteria"]
+            )
+            fallback["metadata"].update(metadata, gemini_calls=chunk_calls)
+            return fallback
+        
+        reduce_prompt = self.prepare_reduce_prompt(domain_info, parts, total_slides)
+        reduce_start = time.time()
+        schemas = self.response_schemas.get(domain_info["judging_criteria"])
+        generation = await self._generate_json(reduce_prompt, [], schemas, "judgement")
+        processing_time = time.time() - start_time
+        metadata["reduce_seconds"] = time.time() - reduce_start
+        metadata["gemini_calls"] = chunk_calls + generation["calls"]
+        metadata["validation_errors"] = generation["validation_errors"]
+        metadata["reasked_fields"] = generation["reasked_fields"]
+        
+        evaluation_result = generation["result"]
+        if evaluation_result is None:
+            logger.error("No valid JSON in the reduce response")
+            logger.error(f"Raw response: {generation['text']}")
+            evaluation_result = self._create_fallback_response(
+                len(images), processing_time, generation["text"], domain_info["judging_criteria"]
+            )
+            evaluation_result["metadata"].update(metadata)
+            return evaluation_result
+        
+        # Slide notes come from the chunks, which saw the slides
+        evaluation_result["slide_by_slide_notes"] = sorted(
+            slide_notes, key=lambda note: note.get("slide", 0) if isinstance(note, dict) else 0
+        )
+        self._expand_identical_slide_notes(evaluation_result, identical)
+        
+        evaluation_result["metadata"] = {
+            "processing_time_seconds": processing_time,
+            "slides_analyzed": len(images),
+            "domain": domain_info["name"],
+            "gemini_model": self.model_name,
+            **metadata,
+            "timestamp": time.time()
+        }
+        
+        logger.info(f"Successfully analyzed presentation in {len(chunks)} chunks in {processing_time:.2f} seconds")
+        return evaluation_result
+    
+    async def _summarize_chunk(
+        self,
+        chunk: List[Dict[str, Any]],
+        identical: List[Dict[str, int]],
+        domain_info: Dict[str, Any],
+        part_number: int,
+        part_count: int,
+        total_slides: int
+    ) -> Dict[str, Any]:
+        """Map step: summarize one chunk of slides, labelled with their original numbers"""
+        prompt = self.prepare_chunk_prompt(domain_info, chunk, part_number, part_count, total_slides)
+        chunk_numbers = {slide["number"] for slide in chunk}
+        chunk_identical = [entry for entry in identical if entry["same_as"] in chunk_numbers]
+        
+        slides, budget_report = await asyncio.to_thread(self.budgeter.fit, chunk, prompt, chunk_identical)
+        prompt = self._annotate_omitted_slides(prompt, slides, budget_report)
+        for slide in slides:
+            slide.setdefault("label", f"Slide {slide['number']}:")
+        
+        schemas = self.response_schemas.get(domain_info["judging_criteria"])
+        generation = await self._generate_json(prompt, slides, schemas, "chunk_summary")
+        part = {
+            "part": part_number,
+            "slides": f"{chunk[0]['number']}-{chunk[-1]['number']}",
+            "gemini_calls": generation["calls"],
+            "token_budget": budget_report
+        }
+        
+        summary = generation["result"]
+        if summary is None:
+            logger.error(f"No valid summary of slides {part['slides']}")
+            return {**part, "parsing_error": True}
+        
+        notes = summary.pop("slide_by_slide_notes", [])
+        return {**part, **summary, "slide_by_slide_notes": notes if isinstance(notes, list) else []}
+    
+    def _describe_slides(
+        self,
+        image_paths: List[str],
+        slide_hashes: Optional[List[str]],
+        slide_dhashes: Optional[List[str]] = None
+    ) -> List[Dict[str, str]]:
+        """Path, MIME type, SHA-256 and recorded dHash of each existing slide, in order"""
+        if slide_hashes is None or len(slide_hashes) != len(image_paths):
+            slide_hashes = [None] * len(image_paths)
+        if slide_dhashes is None or len(slide_dhashes) != len(image_paths):
+            slide_dhashes = [None] * len(image_paths)
+        
+        slides = []
+        for number, (image_path, slide_sha256, slide_dhash) in enumerate(
+            zip(image_paths, slide_hashes, slide_dhashes), 1
+        ):
+            if not os.path.exists(image_path):
+                logger.warning(f"Image not found: {image_path}")
+                continue
+            suffix = Path(image_path).suffix.lower().lstrip(".")
+            mime_type = IMAGE_MIME_TYPES.get(suffix) or mimetypes.guess_type(image_path)[0] or "image/png"
+            if not slide_sha256:
+                with open(image_path, "rb") as f:
+                    slide_sha256 = hashlib.sha256(f.read()).hexdigest()
+            slides.append({
+                "path": image_path,
+                "mime_type": mime_type,
+                "sha256": slide_sha256,
+                "dhash": slide_dhash,
+                "number": number
+            })
+        return slides
+    
+    def _annotate_omitted_slides(self, prompt: str, slides: List[Dict[str, Any]], budget_report: Dict[str, Any]) -> str:
+        """
+        Label slides with their original numbers when some were not sent
+        
+        Args:
+            prompt: Evaluation prompt
+            slides: Slides that will be sent (labels are set in place)
+            budget_report: Pre-send report listing identical and near-duplicate slides
             
-            logger.info("Prepared evaluation prompt for Gemini:")
-            logger.info(prompt)
+        Returns:
+            Prompt with a note explaining the omitted slides
+        """
+        identical = budget_report["identical"]
+        near_duplicates = budget_report["dropped_duplicates"]
+        if not identical and not near_duplicates:
+            return prompt
+        
+        copies = {}
+        for entry in identical:
+            copies.setdefault(entry["same_as"], []).append(entry["slide"])
+        
+        for slide in slides:
+            numbers = copies.get(slide["number"])
+            if numbers:
+                slide["label"] = f"Slide {slide['number']} (also slides {', '.join(str(n) for n in numbers)}):"
+            else:
+                slide["label"] = f"Slide {slide['number']}:"
+        
+        if identical:
+            prompt += (
+                "\nNote: identical slides were sent once; the label before such an image lists every slide "
+                "number it appears as. Judge the deck as if each copy were present.\n"
+            )
+        if near_duplicates:
+            dropped = ", ".join(str(entry["slide"]) for entry in near_duplicates)
+            prompt += f"\nNote: slides {dropped} were omitted as near-duplicates of the preceding slide.\n"
+        prompt += "Each image is preceded by its original slide number; use those numbers in slide_by_slide_notes.\n"
+        return prompt
+    
+    def _expand_identical_slide_notes(self, evaluation_result: Dict[str, Any], identical: List[Dict[str, int]]) -> None:
+        """Give collapsed slides a note of their own, pointing at the slide they repeat"""
+        notes = evaluation_result.get("slide_by_slide_notes")
+        if not identical or not isinstance(notes, list):
+            return
+        
+        noted = {note.get("slide"): note for note in notes if isinstance(note, dict)}
+        for entry in identical:
+            if entry["slide"] in noted:
+                continue
+            original = noted.get(entry["same_as"])
+            text = f"Identical to slide {entry['same_as']}"
+            if original and original.get("note"):
+                text += f": {original['note']}"
+            notes.append({"slide": entry["slide"], "note": text})
+        notes.sort(key=lambda note: note.get("slide", 0) if isinstance(note, dict) else 0)
+    
+    async def _build_content(self, key: Dict[str, Any], prompt: str, slides: List[Dict[str, str]]) -> List[Any]:
+        """Prompt plus one part per slide: a reused or fresh file handle, or inline bytes"""
+        parts = await asyncio.gather(*[
+            asyncio.to_thread(self.slide_files.get_part, key, slide["path"], slide["mime_type"], slide["sha256"])
+            for slide in slides
+        ])
+        content = [prompt]
+        for slide, part in zip(slides, parts):
+            if slide.get("label"):
+                content.append(slide["label"])
+            content.append(part)
+        return content
+    
+    async def _generate_json(
+        self, prompt: str, slides: List[Dict[str, str]], schemas, kind: str
+    ) -> Dict[str, Any]:
+        """
+        Generate a JSON response matching one of a domain's response models
+        
+        The request carries the domain's response schema as a structured-output
+        constraint. A response that still fails validation is not thrown away:
+        only the failing top-level fields are re-asked, in a short text-only
+        request, and merged back in.
+        
+        Args:
+            prompt: Prompt text
+            slides: Slides sent with the prompt (may be empty)
+            schemas: DomainResponseSchemas for the domain's criteria
+            kind: "evaluation", "judgement" or "chunk_summary"
             
-            # Create content list with prompt and images
-            content = [prompt]
-            content.extend(images)
+        Returns:
+            Dictionary with the parsed result (None if no attempt produced
+            parseable JSON), the raw text of the last attempt, per-call timings,
+            the re-asked fields and the remaining validation errors
+        """
+        model = schemas.models[kind]
+        generation = await self._generate_validated(
+            prompt, slides, model, schemas.response_schemas[kind] if self.structured_output else None
+        )
+        generation["reasked_fields"] = []
+        
+        for _ in range(self.reask_attempts):
+            result = generation["result"]
+            if result is None or not generation["validation_errors"]:
+                break
             
-            # Make API call to Gemini
-            start_time = time.time()
+            fields = sorted({
+                error.split(":")[0].split(".")[0] for error in generation["validation_errors"]
+            } & set(model.model_fields))
+            if not fields:
+                break
             
-            response = self.model.generate_content(
-                content,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3,  # Lower temperature for more consistent scoring
-                    top_p=0.8,
-                    top_k=40,
-                    max_output_tokens=4096,
-                )
+            logger.info(f"Re-asking Gemini for fields that failed validation: {', '.join(fields)}")
+            reask_model = field_model(model, fields)
+            reask_prompt = self.reask_prompt_template.format(
+                errors="\n".join(f"- {error}" for error in generation["validation_errors"]),
+                previous=json.dumps(result, indent=2),
+                fields=", ".join(fields)
             )
+            reask = await self._generate_validated(
+                reask_prompt, [], reask_model,
+                response_schema(reask_model, schemas.criteria) if self.structured_output else None,
+                attempts=1
+            )
+            generation["calls"].extend({**call, "reask": fields} for call in reask["calls"])
+            generation["reasked_fields"].extend(fields)
+            if reask["result"] is None:
+                break
+            
+            result.update({field: reask["result"][field] for field in fields if field in reask["result"]})
+            generation["validation_errors"] = validation_errors(model, result)
+        
+        if generation["validation_errors"]:
+            logger.warning(f"Gemini response failed validation: {'; '.join(generation['validation_errors'][:5])}")
+        return generation
+    
+    async def _generate_validated(
+        self,
+        prompt: str,
+        slides: List[Dict[str, str]],
+        model,
+        response_schema: Optional[Dict[str, Any]] = None,
+        attempts: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate and parse a JSON response, re-asking when it comes back malformed
+        
+        Each attempt streams through a StreamingJSONValidator and is abandoned
+        as soon as the text can no longer parse (or ends truncated), so the
+        retry starts without waiting for the rest of it. Schema violations do
+        not abort; they are returned for _generate_json to re-ask.
+        
+        Returns:
+            Dictionary with the parsed result (None if no attempt produced
+            parseable JSON), the raw text of the last attempt, per-call timings
+            and the validation errors
+        """
+        calls = []
+        text = ""
+        attempts = attempts or 1 + self.malformed_retries
+        
+        for attempt in range(1, attempts + 1):
+            validator = StreamingJSONValidator(model)
+            error = None
+            try:
+                generation = await self._generate_with_pool(prompt, slides, validator, response_schema)
+                # Raises if the stream ended before the object was complete
+                result, errors = validator.result()
+            except MalformedResponseError as e:
+                error = e
+                generation = getattr(e, "generation", None) or generation
+            
+            text = generation.pop("text", "")
+            calls.append({**generation, "attempt": attempt, "error": str(error) if error else None})
+            if error:
+                logger.warning(f"Malformed Gemini response (attempt {attempt}/{attempts}): {str(error)}")
+                continue
+            
+            return {"result": result, "text": text, "calls": calls, "validation_errors": errors}
+        
+        return {"result": None, "text": text, "calls": calls, "validation_errors": []}
+    
+    async def _generate_with_pool(
+        self,
+        prompt: str,
+        slides: List[Dict[str, str]],
+        validator: Optional[StreamingJSONValidator] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Send a request on the least loaded healthy key
+        
+        Slides are referenced through the key's uploaded file handles. Quota
+        and auth failures quarantine the key and the request moves to the next
+        one. If the API no longer knows a cached file, the key's handles are
+        dropped and the request is retried once with fresh uploads. Any other
+        error is raised unchanged.
+        
+        Args:
+            prompt: Evaluation prompt
+            slides: Slides from _describe_slides
+            validator: Checks the response while it streams (see _stream_response)
+            response_schema: Structured-output constraint for the response JSON
             
-            processing_time = time.time() - start_time
+        Returns:
+            Dictionary with the response text, the key label, time to first
+            token and total generation time
+        """
+        deadline = time.time() + self.max_key_wait_seconds
+        attempts = 0
+        refreshed_keys = set()
+        admitted = self._take_admitted_call()
+        
+        while True:
+            selection = self.key_pool.acquire(admitted=admitted)
+            key = selection["key"]
             
-            # Parse response
-            response_text = response.text
-            logger.debug(f"Gemini response: {response_text}")
+            if key is None:
+                wait_time = max(selection["retry_after"], 0.05)
+                if time.time() + wait_time > deadline:
+                    raise RuntimeError("No Gemini API key available within the wait limit")
+                logger.info(f"All Gemini keys busy or quarantined, waiting {wait_time:.2f}s")
+                await asyncio.sleep(wait_time)
+                continue
             
-            # Extract JSON from response
+            # Only the first key this call is sent to was admitted; another key is a new request
+            admitted = False
             try:
-                # Find JSON in response (handle markdown code blocks)
-                if "```json" in response_text:
-                    json_start = response_text.find("```json") + 7
-                    json_end = response_text.find("```", json_start)
-                    json_text = response_text[json_start:json_end].strip()
-                elif "{" in response_text:
-                    # Find first { and last }
-                    json_start = response_text.find("{")
-                    json_end = response_text.rfind("}") + 1
-                    json_text = response_text[json_start:json_end]
-                else:
-                    raise ValueError("No JSON found in response")
-                
-                evaluation_result = json.loads(json_text)
-                
-                # Add metadata
-                evaluation_result["metadata"] = {
-                    "processing_time_seconds": processing_time,
-                    "slides_analyzed": len(images),
-                    "domain": domain_info["name"],
-                    "gemini_model": "gemini-2.5-flash-preview-04-17",
-                    "timestamp": time.time()
-                }
-                
-                logger.info(f"Successfully analyzed presentation in {processing_time:.2f} seconds")
-                return evaluation_result
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing JSON response: {str(e)}")
-                logger.error(f"Raw response: {response_text}")
-                
-                # Return fallback response
-                return self._create_fallback_response(len(images), processing_time, response_text)
-                
-        except Exception as e:
-            logger.error(f"Error in comprehensive presentation analysis: {str(e)}")
+                content = await self._build_content(key, prompt, slides)
+                generation = await self._stream_response(key, content, validator, response_schema)
+                logger.info(
+                    f"Gemini request served by key {key['label']}: first token after "
+                    f"{generation['time_to_first_token_seconds']:.2f}s, {generation['generation_seconds']:.2f}s total"
+                )
+                return generation
+            except MalformedResponseError:
+                raise
+            except Exception as e:
+                if self._is_stale_file_error(e) and key["key_hash"] not in refreshed_keys:
+                    logger.warning(f"Cached slide files expired for key {key['label']}, re-uploading")
+                    refreshed_keys.add(key["key_hash"])
+                    await asyncio.to_thread(self.slide_files.invalidate, key, [slide["sha256"] for slide in slides])
+                    continue
+                attempts += 1
+                if not self.key_pool.report_error(key, e) or attempts >= len(self.key_pool.keys):
+                    raise
+                logger.warning(f"Gemini key {key['label']} failed ({type(e).__name__}), trying another key")
+    
+    async def _stream_response(
+        self,
+        key: Dict[str, Any],
+        content: List[Any],
+        validator: Optional[StreamingJSONValidator],
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Stream one generation, feeding the validator as text arrives
+        
+        Reading stops once the validator has a complete object. If it reports
+        a malformed response the stream is closed and MalformedResponseError is
+        raised with the timings and partial text attached (as .generation).
+        """
+        start_time = time.time()
+        first_token_time = None
+        chunks = []
+        
+        generation_config = dict(self.generation_config)
+        if response_schema:
+            generation_config.update(response_mime_type="application/json", response_schema=response_schema)
+        
+        response = await self.key_pool.async_model(key).generate_content_async(
+            content,
+            generation_config=genai.types.GenerationConfig(**generation_config),
+            stream=True
+        )
+        
+        def timings() -> Dict[str, Any]:
+            end_time = time.time()
+            return {
+                "text": "".join(chunks),
+                "key": key["label"],
+                "time_to_first_token_seconds": (first_token_time or end_time) - start_time,
+                "generation_seconds": end_time - start_time
+            }
+        
+        stream = response.__aiter__()
+        try:
+            async for chunk in stream:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. the final one carrying only a finish reason)
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.time()
+                chunks.append(text)
+                if validator and validator.feed(text):
+                    break
+        except MalformedResponseError as e:
+            e.generation = timings()
             raise
+        finally:
+            # Stop reading early: closing the SDK's iterator drops the last
+            # reference to the gRPC call, which cancels it
+            await stream.aclose()
+            iterator = getattr(response, "_iterator", None)
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+        
+        return timings()
+    
+    def _is_stale_file_error(self, error: Exception) -> bool:
+        """Whether a request failed because a referenced file is gone or inaccessible"""
+        if self.slide_files.mode != "files_api":
+            return False
+        if isinstance(error, google_exceptions.NotFound):
+            return True
+        return isinstance(error, (google_exceptions.PermissionDenied, google_exceptions.InvalidArgument)) and "file" in str(error).lower()
     
-    def _create_fallback_response(self, slide_count: int, processing_time: float, raw_response: str) -> Dict[str, Any]:
-        """Create a fallback response when JSON parsing fails"""
+    def _create_fallback_response(
+        self,
+        slide_count: int,
+        processing_time: float,
+        raw_response: str,
+        judging_criteria: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Create a fallback response when JSON parsing fails, scored on the domain's own criteria"""
+        criteria = list(judging_criteria or ["innovation", "technical", "problem_fit", "presentation", "business", "demo"])
         return {
             "overall_analysis": {
                 "presentation_flow_score": 5,
@@ -201,14 +922,7 @@ Respond in this exact JSON format:
                 "consistency_score": 5,
                 "total_slides_analyzed": slide_count
             },
-            "criteria_scores": {
-                "innovation": 5,
-                "technical": 5,
-                "problem_fit": 5,
-                "presentation": 5,
-                "business": 5,
-                "demo": 5
-            },
+            "criteria_scores": {criterion: 5 for criterion in criteria},
             "detailed_feedback": {
                 "strengths": ["Analysis completed"],
                 "weaknesses": ["Unable to parse detailed evaluation"],
@@ -273,7 +987,8 @@ Respond in this exact JSON format:
         try:
             # Test with a simple request
             test_content = "Hello, this is a test."
-            response = self.model.generate_content(test_content)
+            key = self.key_pool.healthy_keys()[0]
+            response = key["model"].generate_content(test_content)
             return bool(response.text)
         except Exception as e:
             logger.error(f"API key validation failed: {str(e)}")
@@ -283,15 +998,16 @@ Respond in this exact JSON format:
         """Get information about the current Gemini model"""
         try:
             return {
-                "model_name": "gemini-2.0-flash-exp",
-                "api_key_configured": bool(self.api_key),
-                "api_key_valid": self.validate_api_key()
+                "model_name": self.model_name,
+                "api_key_configured": bool(self.key_pool.keys),
+                "api_key_valid": self.validate_api_key(),
+                "key_pool": self.key_pool.get_stats()
             }
         except Exception as e:
             logger.error(f"Error getting model info: {str(e)}")
             return {
-                "model_name": "gemini-2.0-flash-exp",
-                "api_key_configured": bool(self.api_key),
+                "model_name": self.model_name,
+                "api_key_configured": bool(self.key_pool.keys),
                 "api_key_valid": False,
                 "error": str(e)
             }
\ No newline at end of file
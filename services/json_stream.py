@@ -0,0 +1,342 @@
+# services/json_stream.py
+import json
+import typing
+from typing import List, Dict, Any, Optional, Tuple, Type
+import logging
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+SCALAR_TYPES = {int: "integer", float: "number", str: "string", bool: "boolean"}
+LITERAL_START = "-0123456789tfn"
+LITERAL_CHARS = "+-.0123456789eEtruefalsn"
+ESCAPE_CHARS = '"\\/bfnrtu'
+HEX_DIGITS = "0123456789abcdefABCDEF"
+
+
+class MalformedResponseError(ValueError):
+    """A streamed response cannot become valid JSON for the expected model"""
+
+
+def _constraints(metadata: List[Any]) -> Dict[str, Any]:
+    """ge/le bounds from pydantic field metadata (annotated_types.Ge / Le)"""
+    bounds = {}
+    for item in metadata:
+        for name in ("ge", "le"):
+            if getattr(item, name, None) is not None:
+                bounds[name] = getattr(item, name)
+        # Field(...) inside Annotated keeps its own metadata list
+        if hasattr(item, "metadata") and isinstance(item.metadata, list):
+            bounds.update(_constraints(item.metadata))
+    return bounds
+
+
+def schema_from_annotation(annotation: Any, metadata: Optional[List[Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Describe what a JSON value must look like, from a type annotation
+
+    Returns:
+        Schema node ({"type": ..., plus fields/values/items/bounds}), or None
+        when any value is accepted
+    """
+    metadata = list(metadata or [])
+    origin = typing.get_origin(annotation)
+
+    if origin is typing.Annotated:
+        annotation, *extra = typing.get_args(annotation)
+        return schema_from_annotation(annotation, metadata + extra)
+    if origin is typing.Union:
+        options = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(options) != 1:
+            return None
+        node = schema_from_annotation(options[0], metadata)
+        if node:
+            node["nullable"] = True
+        return node
+
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return schema_from_model(annotation)
+    if origin in (list, List):
+        (item_type,) = typing.get_args(annotation) or (Any,)
+        return {"type": "array", "items": schema_from_annotation(item_type)}
+    if origin in (dict, Dict):
+        _, value_type = typing.get_args(annotation) or (str, Any)
+        return {"type": "object", "fields": {}, "required": set(), "values": schema_from_annotation(value_type)}
+    if annotation in SCALAR_TYPES:
+        return {"type": SCALAR_TYPES[annotation], **_constraints(metadata)}
+    return None
+
+
+def schema_from_model(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Schema node for a pydantic model: its fields (by JSON key), and which of them are required"""
+    fields = {}
+    required = set()
+    for name, field in model.model_fields.items():
+        key = field.alias or name
+        fields[key] = schema_from_annotation(field.annotation, field.metadata)
+        if field.is_required():
+            required.add(key)
+    return {"type": "object", "fields": fields, "required": required, "values": None}
+
+
+def validation_errors(model: Type[BaseModel], data: Any) -> List[str]:
+    """
+    Validate parsed JSON against a model
+
+    Returns:
+        One "field.path: message" entry per error; empty when valid
+    """
+    try:
+        model.model_validate(data)
+        return []
+    except ValidationError as e:
+        return [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+
+
+class StreamingJSONValidator:
+    """
+    Validate a JSON response against a pydantic model while it streams in
+
+    Text is fed chunk by chunk as Gemini produces it. Everything before the
+    first "{" (e.g. a ```json fence) is skipped. From there the validator
+    tracks the JSON structure character by character and raises
+    MalformedResponseError as soon as the text can no longer parse (a syntax
+    error or an invalid escape). The caller can then abandon the stream and
+    retry instead of waiting for the rest of a response that would be thrown
+    away.
+
+    Schema violations (a value of the wrong type, a score outside its bounds,
+    an object closed without its required fields) do not abort: a response
+    that parses is worth keeping, since the failing fields can be re-asked on
+    their own (see GeminiService._generate_json). They are collected and
+    returned by result(). Keys the model does not know are accepted unchecked.
+    """
+
+    def __init__(self, model: Type[BaseModel], max_preamble: int = 2000):
+        self.model = model
+        self.schema = schema_from_model(model)
+        self.max_preamble = max_preamble
+        self.violations = []
+
+        self.preamble = 0
+        self.characters = 0
+        self.text = []
+        self.done = False
+
+        # One frame per open object/array: schema node, path and parser state
+        self.stack = []
+        self.string = None
+        self.literal = None
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Consume the next piece of streamed text
+
+        Returns:
+            True once the top-level object is complete (the rest of the stream can be ignored)
+
+        Raises:
+            MalformedResponseError: The response can no longer be valid
+        """
+        for character in chunk:
+            if self.done:
+                break
+            self._consume(character)
+        return self.done
+
+    def result(self) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Parse the completed response and run full model validation
+
+        Returns:
+            (parsed JSON, list of validation errors; empty when valid)
+
+        Raises:
+            MalformedResponseError: The stream ended before the object was complete,
+                or the text does not parse
+        """
+        if not self.done:
+            where = "before any JSON" if not self.text else f"inside {self._location()}"
+            raise MalformedResponseError(f"Response ended {where} (truncated output?)")
+
+        try:
+            parsed = json.loads("".join(self.text), strict=False)
+        except ValueError as e:
+            raise MalformedResponseError(f"Invalid JSON: {str(e)}")
+        # Model errors cover the streamed violations and more
+        return parsed, validation_errors(self.model, parsed) or self.violations
+
+    def _fail(self, reason: str, path: Optional[List[Any]] = None):
+        """Syntax error: the text can never parse"""
+        raise MalformedResponseError(f"{reason} at {self._location(path)} (character {self.characters})")
+
+    def _violation(self, reason: str, path: Optional[List[Any]] = None) -> None:
+        """Schema error: recorded, the stream carries on"""
+        self.violations.append(f"{self._location(path)}: {reason}")
+
+    def _location(self, path: Optional[List[Any]] = None) -> str:
+        if path is None:
+            path = self.stack[-1]["path"] if self.stack else []
+        return ".".join(str(part) for part in path) or "top level"
+
+    def _consume(self, character: str) -> None:
+        self.characters += 1
+
+        if not self.stack and not self.text:
+            if character != "{":
+                self.preamble += 1
+                if self.preamble > self.max_preamble:
+                    self._fail("No JSON object found")
+                return
+            self.text.append(character)
+            self._start_value(character, self.schema, [])
+            return
+
+        self.text.append(character)
+
+        if self.string is not None:
+            self._consume_string(character)
+            return
+
+        if self.literal is not None:
+            if character in LITERAL_CHARS:
+                self.literal["chars"].append(character)
+                return
+            self._finish_literal()
+
+        if character.isspace():
+            return
+
+        frame = self.stack[-1]
+        state = frame["state"]
+
+        if frame["kind"] == "object":
+            if state in ("key_or_end", "key") and character == '"':
+                self.string = {"chars": [], "escape": False, "key": True}
+            elif state in ("key_or_end", "comma_or_end") and character == "}":
+                self._close()
+            elif state == "colon" and character == ":":
+                frame["state"] = "value"
+            elif state == "value":
+                key = frame["key"]
+                node = frame["node"]
+                child = None
+                if node:
+                    child = node["fields"].get(key) if key in node["fields"] else node.get("values")
+                self._start_value(character, child, frame["path"] + [key])
+            elif state == "comma_or_end" and character == ",":
+                frame["state"] = "key"
+            else:
+                self._fail(f"Unexpected {character!r} in object")
+        else:
+            if state == "value_or_end" and character == "]":
+                self._close()
+            elif state in ("value_or_end", "value"):
+                node = frame["node"]
+                self._start_value(character, node["items"] if node else None, frame["path"] + [frame["index"]])
+                frame["index"] += 1
+            elif state == "comma_or_end" and character == ",":
+                frame["state"] = "value"
+            elif state == "comma_or_end" and character == "]":
+                self._close()
+            else:
+                self._fail(f"Unexpected {character!r} in list")
+
+    def _start_value(self, character: str, node: Optional[Dict[str, Any]], path: List[Any]) -> None:
+        expected = node["type"] if node else None
+
+        if character == "{":
+            kind, state = "object", "key_or_end"
+        elif character == "[":
+            kind, state = "array", "value_or_end"
+        elif character == '"':
+            if expected not in (None, "string"):
+                self._violation(f"Expected {expected}, got text", path)
+            self.string = {"chars": [], "escape": False, "key": False, "node": node, "path": path}
+            return
+        elif character in LITERAL_START:
+            self.literal = {"chars": [character], "node": node, "path": path}
+            return
+        else:
+            self._fail(f"Unexpected {character!r} where a value belongs")
+
+        if expected not in (None, kind):
+            self._violation(f"Expected {expected}, got {kind}", path)
+            node = None
+        self.stack.append({
+            "kind": kind, "state": state, "node": node, "path": path,
+            "key": None, "keys": set(), "index": 0
+        })
+
+    def _consume_string(self, character: str) -> None:
+        string = self.string
+        if string["escape"]:
+            string["escape"] = False
+            if character not in ESCAPE_CHARS:
+                self._fail(f"Invalid escape \\{character}")
+            string["unicode"] = 4 if character == "u" else 0
+        elif string.get("unicode"):
+            if character not in HEX_DIGITS:
+                self._fail(f"Invalid \\u escape digit {character!r}")
+            string["unicode"] -= 1
+        elif character == "\\":
+            string["escape"] = True
+        elif character == '"':
+            self.string = None
+            if string["key"]:
+                frame = self.stack[-1]
+                frame["key"] = "".join(string["chars"])
+                frame["keys"].add(frame["key"])
+                frame["state"] = "colon"
+            else:
+                self._value_done()
+            return
+        # Only keys are kept; values are read back from the text at the end
+        if string["key"]:
+            string["chars"].append(character)
+
+    def _finish_literal(self) -> None:
+        literal = self.literal
+        self.literal = None
+        raw = "".join(literal["chars"])
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            self._fail(f"Invalid literal {raw!r}", literal["path"])
+
+        node = literal["node"]
+        path = literal["path"]
+        if node:
+            if value is None:
+                if not node.get("nullable"):
+                    self._violation(f"Expected {node['type']}, got null", path)
+            elif node["type"] == "boolean":
+                if not isinstance(value, bool):
+                    self._violation(f"Expected boolean, got {raw!r}", path)
+            elif node["type"] in ("integer", "number"):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    self._violation(f"Expected {node['type']}, got {raw!r}", path)
+                elif node["type"] == "integer" and not float(value).is_integer():
+                    self._violation(f"Expected integer, got {raw!r}", path)
+                elif ("ge" in node and value < node["ge"]) or ("le" in node and value > node["le"]):
+                    self._violation(f"{raw} outside {node.get('ge')}..{node.get('le')}", path)
+            else:
+                self._violation(f"Expected {node['type']}, got {raw!r}", path)
+        self._value_done()
+
+    def _close(self) -> None:
+        frame = self.stack[-1]
+        node = frame["node"]
+        if frame["kind"] == "object" and node:
+            missing = node["required"] - frame["keys"]
+            if missing:
+                self._violation(f"Missing {', '.join(sorted(missing))}")
+        self.stack.pop()
+        self._value_done()
+
+    def _value_done(self) -> None:
+        if not self.stack:
+            self.done = True
+            return
+        self.stack[-1]["state"] = "comma_or_end"
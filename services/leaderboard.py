@@ -0,0 +1,228 @@
+# services/leaderboard.py
+import os
+import time
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+def percentile_for_rank(rank: int, total: int) -> float:
+    """Percentile rank within the domain (higher is better), as stored on SubmissionScore"""
+    return round(((total - rank + 1) / total) * 100, 2) if total else 0.0
+
+
+def ranked_entries(members: List[Tuple[Any, float]], total: int, higher: int = 0) -> List[Dict[str, Any]]:
+    """
+    Competition ranks for (submission_id, score) pairs in descending score order
+
+    Args:
+        members: Pairs sorted best first
+        total: Ranked submissions in the domain (for percentiles)
+        higher: Submissions scoring strictly above the first pair
+
+    Returns:
+        One entry per pair with submission_id, score, rank and percentile;
+        tied scores share a rank
+    """
+    entries = []
+    rank = higher + 1
+    previous = None
+    for position, (member, score) in enumerate(members):
+        if previous is not None and score < previous:
+            rank = higher + position + 1
+        previous = score
+        entries.append({
+            "submission_id": int(member),
+            "score": score,
+            "rank": rank,
+            "percentile": percentile_for_rank(rank, total)
+        })
+    return entries
+
+
+class DomainLeaderboard:
+    """
+    Incremental per-domain leaderboard in Redis sorted sets
+
+    Each completed submission is a member of leaderboard:{domain_id} scored by
+    its weighted total, so recording a score is a single O(log n) ZADD instead
+    of a re-rank of the whole domain. Rank and percentile are derived on read:
+    rank = 1 + number of strictly higher scores (tied submissions share a
+    rank), also O(log n). The database copy of the positions is written back
+    in bulk by calculate_rankings_task, debounced per domain so a burst of
+    scores leads to one write-back.
+    """
+
+    def __init__(self, redis_client: redis.Redis, debounce_seconds: Optional[float] = None):
+        self.redis = redis_client
+        self.key_prefix = "leaderboard"
+        self.stats_key = f"{self.key_prefix}:stats"
+
+        # Ranking write-backs requested within this window run once
+        self.debounce_seconds = debounce_seconds if debounce_seconds is not None else float(
+            os.getenv("RANKING_DEBOUNCE_SECONDS", 10)
+        )
+        # A lost write-back (worker died) stops coalescing once the pending key expires
+        self.pending_ttl_seconds = int(max(self.debounce_seconds * 10, 300))
+
+    def _key(self, domain_id: int) -> str:
+        return f"{self.key_prefix}:{domain_id}"
+
+    def _pending_key(self, domain_id: int) -> str:
+        return f"{self.key_prefix}:{domain_id}:pending"
+
+    def _coalesced_key(self, domain_id: int) -> str:
+        return f"{self.key_prefix}:{domain_id}:coalesced"
+
+    def request_write_back(self, domain_id: int) -> bool:
+        """
+        Ask for the domain's rankings to be written back to the database
+
+        The first request in a window sets the pending key and should schedule
+        the write-back (delayed by debounce_seconds); later requests only count
+        themselves as coalesced into it. The write-back clears the key before
+        reading the database, so a score committed before a coalesced request
+        is always included in a run that has not started reading yet.
+
+        Returns:
+            True if the caller should schedule the write-back (also when Redis
+            is unavailable)
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(self._pending_key(domain_id), time.time(), nx=True, ex=self.pending_ttl_seconds)
+            pipe.hincrby(self.stats_key, "requested", 1)
+            scheduled = bool(pipe.execute()[0])
+
+            pipe = self.redis.pipeline(transaction=False)
+            if scheduled:
+                pipe.hincrby(self.stats_key, "scheduled", 1)
+            else:
+                pipe.incr(self._coalesced_key(domain_id))
+                pipe.hincrby(self.stats_key, "coalesced", 1)
+            pipe.execute()
+            return scheduled
+        except Exception as e:
+            logger.error(f"Error debouncing ranking for domain {domain_id}: {str(e)}")
+            return True
+
+    def claim_write_back(self, domain_id: int) -> int:
+        """
+        Start a write-back: clear the pending key so later scores schedule a new run
+
+        Must be called before the scores are read.
+
+        Returns:
+            Number of requests coalesced into this run
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(self._pending_key(domain_id))
+            pipe.getset(self._coalesced_key(domain_id), 0)
+            coalesced = pipe.execute()[1]
+            return int(coalesced or 0)
+        except Exception as e:
+            logger.error(f"Error debouncing ranking for domain {domain_id}: {str(e)}")
+            return 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get ranking write-back counters
+
+        Returns:
+            Dictionary with requested/scheduled/coalesced counts and the coalescing rate
+        """
+        counters = {"requested": 0, "scheduled": 0, "coalesced": 0}
+        try:
+            shared = self.redis.hgetall(self.stats_key)
+            counters = {name: int(shared.get(name.encode(), 0)) for name in counters}
+        except Exception as e:
+            logger.error(f"Error reading leaderboard stats: {str(e)}")
+
+        return {
+            **counters,
+            "coalesced_rate": counters["coalesced"] / counters["requested"] if counters["requested"] else 0.0,
+            "debounce_seconds": self.debounce_seconds,
+            "timestamp": time.time()
+        }
+
+    def record(self, domain_id: int, submission_id: int, weighted_total: float) -> bool:
+        """
+        Add or move a submission on its domain's leaderboard
+
+        Returns:
+            True if Redis was updated (False when unavailable; the next
+            ranking run rebuilds the leaderboard from the database)
+        """
+        try:
+            self.redis.zadd(self._key(domain_id), {str(submission_id): weighted_total})
+            return True
+        except Exception as e:
+            logger.error(f"Error updating leaderboard for domain {domain_id}: {str(e)}")
+            return False
+
+    def rebuild(self, domain_id: int, scores: Iterable[Tuple[int, float]]) -> None:
+        """Replace a domain's leaderboard with (submission_id, weighted_total) pairs from the database"""
+        key = self._key(domain_id)
+        members = {str(submission_id): weighted_total for submission_id, weighted_total in scores}
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key)
+        if members:
+            pipe.zadd(key, members)
+        pipe.execute()
+        logger.info(f"Rebuilt leaderboard for domain {domain_id} with {len(members)} submissions")
+
+    def size(self, domain_id: int) -> int:
+        """Number of ranked submissions in the domain"""
+        return self.redis.zcard(self._key(domain_id))
+
+    def rank(self, domain_id: int, submission_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Rank and percentile of one submission
+
+        Returns:
+            Dictionary with score, rank, percentile and total, or None if the
+            submission is not ranked
+        """
+        key = self._key(domain_id)
+        score = self.redis.zscore(key, str(submission_id))
+        if score is None:
+            return None
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zcount(key, f"({score}", "+inf")
+        pipe.zcard(key)
+        higher, total = pipe.execute()
+        return {
+            "submission_id": submission_id,
+            "score": score,
+            "rank": higher + 1,
+            "percentile": percentile_for_rank(higher + 1, total),
+            "total": total
+        }
+
+    def page(self, domain_id: int, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """
+        One page of the leaderboard, best first
+
+        Returns:
+            Dictionary with the total and the entries (submission_id, score, rank, percentile)
+        """
+        key = self._key(domain_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrevrange(key, offset, offset + limit - 1, withscores=True)
+        pipe.zcard(key)
+        members, total = pipe.execute()
+        if not members:
+            return {"total": total, "entries": []}
+
+        # Ranks continue from the number of strictly higher scores before the page
+        higher = self.redis.zcount(key, f"({members[0][1]}", "+inf")
+        return {"total": total, "entries": ranked_entries(members, total, higher)}
+
+    def standings(self, domain_id: int) -> List[Dict[str, Any]]:
+        """Every ranked submission of the domain, best first, for write-back"""
+        members = self.redis.zrevrange(self._key(domain_id), 0, -1, withscores=True)
+        return ranked_entries(members, len(members), 0)
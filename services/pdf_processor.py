@@ -4,78 +4,612 @@ from pdf2image import convert_from_path
 from PIL import Image
 import os
 import io
+import re
+import json
+import hashlib
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Iterator
 import logging
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from services.perceptual_hash import difference_hash, format_hash
 
 logger = logging.getLogger(__name__)
 
+MANIFEST_FILENAME = "manifest.json"
+
+
+def _save_png(img: Image.Image, path: io.BytesIO, options: Dict[str, Any]) -> None:
+    """PNG with a zlib level instead of optimize=True (which retries every filter at level 9)"""
+    if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        img = img.convert("RGB")
+    img.save(path, "PNG", compress_level=options.get("compress_level", 6))
+
+
+def _save_jpeg(img: Image.Image, path: io.BytesIO, options: Dict[str, Any]) -> None:
+    """Baseline JPEG; alpha and CMYK are flattened to RGB"""
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")
+    img.save(path, "JPEG", quality=options.get("quality", 85))
+
+
+def _save_webp(img: Image.Image, path: io.BytesIO, options: Dict[str, Any]) -> None:
+    """Lossy WebP by default, lossless when options["lossless"] is set"""
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+    img.save(
+        path, "WEBP",
+        quality=options.get("quality", 80),
+        method=options.get("method", 4),
+        lossless=options.get("lossless", False)
+    )
+
+
+# Output encoders keyed by format name: (file extension, save function).
+# Save functions write into a file-like object; new formats can be plugged
+# in by registering another entry.
+SLIDE_ENCODERS = {
+    "png": ("png", _save_png),
+    "jpeg": ("jpg", _save_jpeg),
+    "webp": ("webp", _save_webp),
+}
+
+
+# Per-process state for pool workers, set up once by _init_render_worker
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_render_worker(config: dict, pdf_path: str, output_dir: str, encoding: Dict[str, Any]) -> None:
+    """
+    Process pool initializer: open the PDF once per worker
+
+    Each worker opens its own pymupdf document, since documents cannot be
+    shared across processes.
+    """
+    _worker_state["processor"] = PDFProcessor(**config)
+    _worker_state["doc"] = pymupdf.open(pdf_path)
+    _worker_state["output_path"] = Path(output_dir)
+    _worker_state["encoding"] = encoding
+
+
+def _render_worker_page(page_num: int, include_bytes: bool) -> Dict[str, Any]:
+    """Process pool entry point: render one page with the worker's document"""
+    processor = _worker_state["processor"]
+    doc = _worker_state["doc"]
+    return processor._render_page(
+        doc[page_num], page_num, _worker_state["output_path"], _worker_state["encoding"], include_bytes
+    )
+
+
 class PDFProcessor:
     """Service for processing PDF files and converting them to images"""
     
-    def __init__(self, dpi: int = 300, image_format: str = "PNG"):
+    RENDER_MODES = ("direct", "supersample")
+    
+    def __init__(
+        self,
+        dpi: int = 300,
+        image_format: str = "PNG",
+        max_workers: Optional[int] = None,
+        parallel_min_pages: int = 8,
+        render_mode: str = "direct",
+        encoding: Optional[Dict[str, Any]] = None,
+        parallel_render: Optional[bool] = None
+    ):
+        if render_mode not in self.RENDER_MODES:
+            raise ValueError(f"Unknown render mode: {render_mode}")
+        
         self.dpi = dpi
         self.image_format = image_format
+        
+        # Default slide encoding; domains can override it per conversion
+        self.encoding = self.resolve_encoding({"format": image_format.lower(), **(encoding or {})})
         self.max_width = 1920  # Maximum width for images
         self.max_height = 1080  # Maximum height for images
+        
+        # "direct" rasterizes each page straight at its final bounded size,
+        # "supersample" renders at full DPI and LANCZOS-downscales afterwards
+        # (the original path, kept for quality comparison)
+        self.render_mode = render_mode
+        
+        # Parallel rendering: worker processes for page rasterization, and the
+        # smallest deck for which spinning up a process pool pays off. Off unless
+        # PDF_PARALLEL_RENDER is set, since the host process must be allowed to
+        # fork children (not a Celery prefork child; use --pool=solo or threads)
+        self.max_workers = max_workers or int(os.getenv("PDF_RENDER_WORKERS", os.cpu_count() or 1))
+        self.parallel_min_pages = parallel_min_pages
+        if parallel_render is None:
+            parallel_render = os.getenv("PDF_PARALLEL_RENDER", "false").lower() in ("1", "true", "yes")
+        self.parallel_render = parallel_render
     
-    def convert_pdf_to_images(self, pdf_path: str, output_dir: str) -> List[str]:
+    def _worker_config(self) -> dict:
+        """Constructor arguments used to rebuild this processor inside a worker process"""
+        return {
+            "dpi": self.dpi,
+            "image_format": self.image_format,
+            "max_workers": 1,
+            "parallel_min_pages": self.parallel_min_pages,
+            "parallel_render": False,
+            "render_mode": self.render_mode,
+            "encoding": self.encoding
+        }
+    
+    def resolve_encoding(self, encoding: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        Convert PDF to high-quality images using PyMuPDF for better performance
+        Merge an encoding profile (e.g. Domain.slide_encoding) over the defaults
+        
+        Args:
+            encoding: Partial profile such as {"format": "webp", "quality": 80}
+            
+        Returns:
+            Complete encoding profile
+            
+        Raises:
+            ValueError: If the format has no registered encoder
+        """
+        resolved = dict(getattr(self, "encoding", None) or {"format": "png"})
+        resolved.update(encoding or {})
+        resolved["format"] = str(resolved["format"]).lower()
+        if resolved["format"] == "jpg":
+            resolved["format"] = "jpeg"
+        
+        if resolved["format"] not in SLIDE_ENCODERS:
+            raise ValueError(
+                f"Unsupported slide format: {resolved['format']} "
+                f"(expected one of {', '.join(SLIDE_ENCODERS)})"
+            )
+        return resolved
+    
+    def render_settings(self, encoding: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Settings that determine the rendered output, used to key cached renderings
+        
+        Args:
+            encoding: Encoding profile overriding the processor default
+            
+        Returns:
+            Dictionary of output-affecting settings
+        """
+        return {
+            "dpi": self.dpi,
+            "max_width": self.max_width,
+            "max_height": self.max_height,
+            "render_mode": self.render_mode,
+            "encoding": self.resolve_encoding(encoding)
+        }
+    
+    def _save_slide(
+        self,
+        img: Image.Image,
+        page_num: int,
+        output_path: Path,
+        encoding: Dict[str, Any],
+        include_bytes: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Encode a slide image and describe it for the manifest
+        
+        The slide is encoded in memory once, then hashed and written to disk.
+        The perceptual hash (dHash) is taken from the decoded image while it is
+        still in memory, so identical slides can be found without reopening files.
+        
+        Args:
+            img: Slide image
+            page_num: Zero-based page index
+            output_path: Directory to save the image in
+            encoding: Resolved encoding profile
+            include_bytes: Attach the encoded image under "data"
+            
+        Returns:
+            Manifest entry for the written slide
+        """
+        extension, save = SLIDE_ENCODERS[encoding["format"]]
+        buffer = io.BytesIO()
+        save(img, buffer, encoding)
+        data = buffer.getvalue()
+        
+        # Write to a new file and swap it in: slides may be hard links into the
+        # slide cache, which must never be modified in place
+        image_path = output_path / f"slide_{page_num + 1}.{extension}"
+        tmp_path = output_path / f".{image_path.name}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, image_path)
+        
+        logger.debug(f"Converted page {page_num + 1} to {image_path}")
+        slide = {
+            "index": page_num,
+            "slide": page_num + 1,
+            "filename": image_path.name,
+            "path": str(image_path),
+            "width": img.width,
+            "height": img.height,
+            "bytes": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "dhash": format_hash(difference_hash(img))
+        }
+        if include_bytes:
+            slide["data"] = data
+        return slide
+    
+    def write_manifest(
+        self,
+        output_path: Path,
+        slides: List[Dict[str, Any]],
+        encoding: Dict[str, Any],
+        complete: bool = True
+    ) -> Path:
+        """
+        Write the slide manifest that downstream stages use to find slides
+        
+        Args:
+            output_path: Slides directory
+            slides: Manifest entries in page order
+            encoding: Encoding profile the slides were written with
+            complete: False while the deck is still rendering
+            
+        Returns:
+            Path of the manifest file
+        """
+        manifest = {
+            "version": 1,
+            "complete": complete,
+            "slide_count": len(slides),
+            "render_mode": self.render_mode,
+            "encoding": encoding,
+            "slides": [
+                {key: value for key, value in slide.items() if key not in ("index", "path", "data")}
+                for slide in slides
+            ]
+        }
+        
+        # Write to a temporary file first so readers never see a partial manifest
+        manifest_path = output_path / MANIFEST_FILENAME
+        tmp_path = output_path / f".{MANIFEST_FILENAME}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+        return manifest_path
+    
+    @staticmethod
+    def load_slide_paths(slides_dir: str) -> List[str]:
+        """
+        Get slide image paths in page order for a slides directory
+        
+        Reads the manifest written during conversion; directories produced
+        before manifests existed fall back to a slide_N.* glob sorted by N.
+        
+        Args:
+            slides_dir: Directory containing the slides
+            
+        Returns:
+            List of slide image paths in page order
+        """
+        slides_path = Path(slides_dir)
+        manifest_path = slides_path / MANIFEST_FILENAME
+        
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            return [str(slides_path / slide["filename"]) for slide in manifest["slides"]]
+        
+        def slide_number(path: Path) -> int:
+            match = re.match(r"slide_(\d+)$", path.stem)
+            return int(match.group(1)) if match else 0
+        
+        legacy_slides = [path for path in slides_path.glob("slide_*.*") if slide_number(path) > 0]
+        return [str(path) for path in sorted(legacy_slides, key=slide_number)]
+    
+    def _should_render_in_parallel(self, page_count: int, parallel: Optional[bool]) -> bool:
+        """Decide whether a deck is rendered with a process pool or serially"""
+        if parallel is False or self.max_workers <= 1:
+            return False
+        if parallel is None:
+            return self.parallel_render and page_count >= self.parallel_min_pages
+        return True
+    
+    @staticmethod
+    def load_slide_hashes(slides_dir: str) -> List[str]:
+        """
+        Get the SHA-256 of every slide in page order
+        
+        Uses the hashes recorded in the manifest, hashing the files directly
+        for slides (or directories) that predate them.
+        
+        Args:
+            slides_dir: Directory containing the slides
+            
+        Returns:
+            List of hex digests in page order
+        """
+        manifest_path = Path(slides_dir) / MANIFEST_FILENAME
+        recorded = {}
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                recorded = {
+                    slide["filename"]: slide.get("sha256")
+                    for slide in json.load(f)["slides"]
+                }
+        
+        hashes = []
+        for path in PDFProcessor.load_slide_paths(slides_dir):
+            digest = recorded.get(Path(path).name)
+            if not digest:
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            hashes.append(digest)
+        return hashes
+    
+    @staticmethod
+    def load_slide_dhashes(slides_dir: str) -> List[str]:
+        """
+        Get the perceptual hash (dHash) of every slide in page order
+        
+        Uses the hashes recorded in the manifest at rasterization time,
+        hashing the images directly for slides that predate them.
+        
+        Args:
+            slides_dir: Directory containing the slides
+            
+        Returns:
+            List of 16-digit hex dHashes in page order
+        """
+        manifest_path = Path(slides_dir) / MANIFEST_FILENAME
+        recorded = {}
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                recorded = {
+                    slide["filename"]: slide.get("dhash")
+                    for slide in json.load(f)["slides"]
+                }
+        
+        hashes = []
+        for path in PDFProcessor.load_slide_paths(slides_dir):
+            dhash = recorded.get(Path(path).name)
+            if not dhash:
+                with Image.open(path) as img:
+                    dhash = format_hash(difference_hash(img))
+            hashes.append(dhash)
+        return hashes
+    
+    def _page_zoom(self, page_rect: "pymupdf.Rect") -> float:
+        """
+        Zoom factor (pixels per PDF point) used to rasterize a page
+        
+        In direct mode the zoom is chosen from the page size so the pixmap
+        already fits within max_width x max_height, capped at the configured DPI
+        so small pages are never upscaled beyond what supersampling would give.
+        
+        Args:
+            page_rect: Page rectangle in PDF points
+            
+        Returns:
+            Zoom factor for both axes
+        """
+        dpi_zoom = self.dpi / 72
+        if self.render_mode == "supersample" or page_rect.width <= 0 or page_rect.height <= 0:
+            return dpi_zoom
+        
+        fit_zoom = min(self.max_width / page_rect.width, self.max_height / page_rect.height)
+        return min(dpi_zoom, fit_zoom)
+    
+    def _page_matrix(self, page: "pymupdf.Page") -> "pymupdf.Matrix":
+        """Transformation matrix for rendering a page at the configured resolution"""
+        zoom = self._page_zoom(page.rect)
+        return pymupdf.Matrix(zoom, zoom)
+    
+    def _pixmap_to_image(self, pix: "pymupdf.Pixmap") -> Image.Image:
+        """
+        Build a PIL Image directly on top of a pixmap's sample buffer
+        
+        The image shares memory with the pixmap, so the pixmap must stay alive
+        for as long as the image is used.
+        
+        Args:
+            pix: Rendered PyMuPDF pixmap
+            
+        Returns:
+            PIL Image backed by the pixmap samples
+        """
+        if pix.alpha:
+            mode = "LA" if pix.n == 2 else "RGBA"
+        elif pix.n == 1:
+            mode = "L"
+        elif pix.n == 4:
+            mode = "CMYK"
+        else:
+            mode = "RGB"
+        
+        # samples_mv is a memoryview over the pixmap buffer (no copy)
+        samples = getattr(pix, "samples_mv", None) or pix.samples
+        return Image.frombuffer(mode, (pix.width, pix.height), samples, "raw", mode, pix.stride, 1)
+    
+    def _render_page(
+        self,
+        page: "pymupdf.Page",
+        page_num: int,
+        output_path: Path,
+        encoding: Dict[str, Any],
+        include_bytes: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Render a single page to an image file
+        
+        Args:
+            page: PyMuPDF page to render
+            page_num: Zero-based page index
+            output_path: Directory to save the image in
+            encoding: Resolved encoding profile
+            include_bytes: Attach the encoded image under "data"
+            
+        Returns:
+            Manifest entry for the written image
+        """
+        # Render page to image
+        pix = page.get_pixmap(matrix=self._page_matrix(page))
+        
+        # Wrap the pixmap samples as a PIL Image without an encode/decode roundtrip
+        img = self._pixmap_to_image(pix)
+        
+        # Resize if too large (a no-op for direct rendering)
+        img = self._resize_image(img)
+        
+        return self._save_slide(img, page_num, output_path, encoding, include_bytes)
+    
+    def iter_slides(
+        self,
+        pdf_path: str,
+        output_dir: str,
+        parallel: Optional[bool] = None,
+        encoding: Optional[Dict[str, Any]] = None,
+        include_bytes: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Convert a PDF to images, yielding each slide as soon as it is written
+        
+        Slides are yielded in page order. The manifest is rewritten as each
+        slide lands, marked complete only after the last one, so a consumer
+        that stops early leaves an incomplete manifest behind.
         
         Args:
             pdf_path: Path to the PDF file
             output_dir: Directory to save images
+            parallel: Force (True) or disable (False) process pool rendering;
+                None renders decks of parallel_min_pages or more in parallel when
+                parallel_render (PDF_PARALLEL_RENDER) is enabled
+            encoding: Encoding profile overriding the processor default
+                (typically the submission domain's slide_encoding)
+            include_bytes: Attach the encoded image bytes under "data"
             
-        Returns:
-            List of image file paths
+        Yields:
+            Slide dictionaries with index, slide number, path, dimensions,
+            byte size, sha256 and (optionally) data
         """
         try:
             output_path = Path(output_dir)
             output_path.mkdir(parents=True, exist_ok=True)
-            
-            image_paths = []
+            encoding = self.resolve_encoding(encoding)
             
             # Open PDF document
             doc = pymupdf.open(pdf_path)
+            page_count = len(doc)
             
-            logger.info(f"Converting PDF with {len(doc)} pages to images")
+            logger.info(f"Converting PDF with {page_count} pages to images")
             
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                
-                # Create transformation matrix for high DPI
-                mat = pymupdf.Matrix(self.dpi/72, self.dpi/72)
-                
-                # Render page to image
-                pix = page.get_pixmap(matrix=mat)
-                
-                # Convert to PIL Image for processing
-                img_data = pix.tobytes("png")
-                img = Image.open(io.BytesIO(img_data))
-                
-                # Resize if too large
-                img = self._resize_image(img)
-                
-                # Save image
-                image_filename = f"slide_{page_num + 1}.png"
-                image_path = output_path / image_filename
-                img.save(image_path, "PNG", optimize=True)
-                
-                image_paths.append(str(image_path))
-                logger.debug(f"Converted page {page_num + 1} to {image_path}")
+            if self._should_render_in_parallel(page_count, parallel):
+                doc.close()
+                rendered = self._iter_parallel(pdf_path, output_path, page_count, encoding, include_bytes)
+            else:
+                rendered = self._iter_serial(doc, output_path, encoding, include_bytes)
             
-            doc.close()
+            slides = []
+            for slide in rendered:
+                slides.append({key: value for key, value in slide.items() if key != "data"})
+                self.write_manifest(output_path, slides, encoding, complete=False)
+                yield slide
             
-            logger.info(f"Successfully converted {len(image_paths)} pages to images")
-            return image_paths
+            self.write_manifest(output_path, slides, encoding)
+            
+            logger.info(f"Successfully converted {len(slides)} pages to {encoding['format']} images")
             
         except Exception as e:
             logger.error(f"Error converting PDF to images: {str(e)}")
             raise
     
-    def convert_pdf_to_images_pdf2image(self, pdf_path: str, output_dir: str) -> List[str]:
+    def convert_pdf_to_images(
+        self,
+        pdf_path: str,
+        output_dir: str,
+        parallel: Optional[bool] = None,
+        encoding: Optional[Dict[str, Any]] = None
+    ) -> List[str]:
+        """
+        Convert PDF to high-quality images using PyMuPDF for better performance
+        
+        Args:
+            pdf_path: Path to the PDF file
+            output_dir: Directory to save images
+            parallel: Force (True) or disable (False) process pool rendering;
+                None renders decks of parallel_min_pages or more in parallel when
+                parallel_render (PDF_PARALLEL_RENDER) is enabled
+            encoding: Encoding profile overriding the processor default
+                (typically the submission domain's slide_encoding)
+            
+        Returns:
+            List of image file paths in page order
+        """
+        return [
+            slide["path"]
+            for slide in self.iter_slides(pdf_path, output_dir, parallel, encoding, include_bytes=False)
+        ]
+    
+    def _iter_serial(
+        self,
+        doc: "pymupdf.Document",
+        output_path: Path,
+        encoding: Dict[str, Any],
+        include_bytes: bool
+    ) -> Iterator[Dict[str, Any]]:
+        """Render pages one after another in this process"""
+        try:
+            for page_num in range(len(doc)):
+                yield self._render_page(doc[page_num], page_num, output_path, encoding, include_bytes)
+        finally:
+            doc.close()
+    
+    def _iter_parallel(
+        self,
+        pdf_path: str,
+        output_path: Path,
+        page_count: int,
+        encoding: Dict[str, Any],
+        include_bytes: bool
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Render pages across a process pool
+        
+        Pages are handed out to the workers in contiguous chunks; results are
+        yielded in page order as soon as each one is available.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            output_path: Directory to save images
+            page_count: Number of pages in the document
+            encoding: Resolved encoding profile
+            include_bytes: Attach the encoded image bytes under "data"
+            
+        Yields:
+            Slide dictionaries in page order
+        """
+        workers = min(self.max_workers, page_count)
+        # A few chunks per worker balances load while keeping early pages early
+        chunksize = max(1, page_count // (workers * 4))
+        
+        logger.info(f"Rendering {page_count} pages with {workers} worker processes")
+        
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_render_worker,
+            initargs=(self._worker_config(), pdf_path, str(output_path), encoding)
+        ) as executor:
+            try:
+                yield from executor.map(
+                    _render_worker_page,
+                    range(page_count),
+                    [include_bytes] * page_count,
+                    chunksize=chunksize
+                )
+            finally:
+                # Drop pages nobody will consume if the caller stopped early
+                executor.shutdown(wait=True, cancel_futures=True)
+    
+    def convert_pdf_to_images_pdf2image(
+        self,
+        pdf_path: str,
+        output_dir: str,
+        encoding: Optional[Dict[str, Any]] = None
+    ) -> List[str]:
         """
         Alternative method using pdf2image (requires poppler-utils)
         Use this if PyMuPDF doesn't work well for certain PDFs
@@ -83,6 +617,7 @@ class PDFProcessor:
         Args:
             pdf_path: Path to the PDF file
             output_dir: Directory to save images
+            encoding: Encoding profile overriding the processor default
             
         Returns:
             List of image file paths
@@ -90,31 +625,29 @@ class PDFProcessor:
         try:
             output_path = Path(output_dir)
             output_path.mkdir(parents=True, exist_ok=True)
+            encoding = self.resolve_encoding(encoding)
             
-            # Convert PDF to images
+            # Convert PDF to images (uncompressed PPM intermediates, encoded once below)
             images = convert_from_path(
                 pdf_path,
                 dpi=self.dpi,
-                fmt=self.image_format.lower(),
+                fmt="ppm",
                 thread_count=4  # Use multiple threads for faster conversion
             )
             
-            image_paths = []
+            slides = []
             
             for i, image in enumerate(images):
                 # Resize if too large
                 image = self._resize_image(image)
                 
                 # Save image
-                image_filename = f"slide_{i + 1}.png"
-                image_path = output_path / image_filename
-                image.save(image_path, "PNG", optimize=True)
-                
-                image_paths.append(str(image_path))
-                logger.debug(f"Converted page {i + 1} to {image_path}")
+                slides.append(self._save_slide(image, i, output_path, encoding))
+            
+            self.write_manifest(output_path, slides, encoding)
             
-            logger.info(f"Successfully converted {len(image_paths)} pages to images")
-            return image_paths
+            logger.info(f"Successfully converted {len(slides)} pages to images")
+            return [slide["path"] for slide in slides]
             
         except Exception as e:
             logger.error(f"Error converting PDF to images: {str(e)}")
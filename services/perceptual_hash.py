@@ -0,0 +1,54 @@
+# services/perceptual_hash.py
+from typing import Optional
+
+from PIL import Image
+
+# dHash: 64 bits, stored as 16 hex digits in the slide manifest
+DHASH_SIZE = 8
+
+
+def difference_hash(img: Image.Image, hash_size: int = DHASH_SIZE) -> int:
+    """
+    dHash: sign of the horizontal gradient on a tiny grayscale thumbnail
+
+    The image is box-filtered straight down to (hash_size + 1) x hash_size
+    (with an integer pre-reduction) before the grayscale conversion, so a
+    full-size slide is only read once.
+
+    Args:
+        img: Slide image
+        hash_size: Rows (and gradient columns) of the hash; 8 gives 64 bits
+
+    Returns:
+        Hash as an integer of hash_size * hash_size bits
+    """
+    if img.mode not in ("L", "RGB", "RGBA"):
+        # Palette and other modes cannot be box-filtered
+        img = img.convert("RGB")
+    small = img.resize((hash_size + 1, hash_size), Image.Resampling.BOX, reducing_gap=2.0).convert("L")
+    pixels = small.tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (1 if pixels[offset + col] > pixels[offset + col + 1] else 0)
+    return value
+
+
+def format_hash(value: int, hash_size: int = DHASH_SIZE) -> str:
+    """Fixed-width hex form of a hash, as written to the manifest"""
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def parse_hash(value: Optional[str]) -> Optional[int]:
+    """Integer form of a manifest hash, or None if missing or malformed"""
+    try:
+        return int(value, 16) if value else None
+    except ValueError:
+        return None
+
+
+def hamming_distance(first: int, second: int) -> int:
+    """Number of differing bits between two hashes"""
+    return bin(first ^ second).count("1")
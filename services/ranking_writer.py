@@ -0,0 +1,205 @@
+# services/ranking_writer.py
+from typing import List, Dict, Any
+from datetime import datetime
+import logging
+
+from sqlalchemy import update, func, or_, case, bindparam
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import Submission, SubmissionScore
+
+logger = logging.getLogger(__name__)
+
+
+def supports_window_updates(db: Session) -> bool:
+    """
+    Whether the database can rank with RANK() OVER (...) inside an UPDATE
+
+    MySQL needs 8.0 (MariaDB 10.2) for window functions; SQLite needs 3.33
+    for UPDATE ... FROM. Anything else is written with bulk_update_mappings.
+    """
+    dialect = db.get_bind().dialect
+    version = dialect.server_version_info or ()
+    if dialect.name in ("mysql", "mariadb"):
+        return version >= ((10, 2) if getattr(dialect, "is_mariadb", False) else (8, 0))
+    if dialect.name == "sqlite":
+        return version >= (3, 33)
+    return dialect.name == "postgresql"
+
+
+def load_ranking_rows(db: Session, domain_id: int) -> List[Any]:
+    """Scores and stored rankings of every completed submission in the domain, in one query"""
+    return db.query(
+        SubmissionScore.id,
+        SubmissionScore.submission_id,
+        SubmissionScore.weighted_total,
+        SubmissionScore.ranking_position,
+        SubmissionScore.percentile_rank,
+        Submission.ranking_position.label("submission_ranking_position"),
+        Submission.weighted_score
+    ).join(Submission, Submission.id == SubmissionScore.submission_id).filter(
+        Submission.domain_id == domain_id,
+        Submission.status == "completed",
+        SubmissionScore.weighted_total.isnot(None)
+    ).all()
+
+
+def write_rankings_window(db: Session, domain_id: int) -> int:
+    """
+    Rank a domain and persist it in two set-based UPDATE statements
+
+    Positions come from RANK() over the completed submissions' weighted
+    totals (ties share a rank, as on the leaderboard). Only rows whose
+    ranking changed are written. The caller commits.
+
+    Returns:
+        Number of SubmissionScore rows updated
+    """
+    ranked_submissions = db.query(
+        SubmissionScore.id.label("score_id"),
+        func.rank().over(order_by=SubmissionScore.weighted_total.desc()).label("new_position"),
+        func.count().over().label("ranked_total")
+    ).join(Submission, Submission.id == SubmissionScore.submission_id).filter(
+        Submission.domain_id == domain_id,
+        Submission.status == "completed",
+        SubmissionScore.weighted_total.isnot(None)
+    ).subquery()
+
+    # Same formula as percentile_for_rank
+    percentile = func.round(
+        (ranked_submissions.c.ranked_total - ranked_submissions.c.new_position + 1) * 1.0
+        / ranked_submissions.c.ranked_total * 100,
+        2
+    )
+    score_rows = db.execute(
+        update(SubmissionScore)
+        .where(
+            SubmissionScore.id == ranked_submissions.c.score_id,
+            or_(
+                SubmissionScore.ranking_position.is_distinct_from(ranked_submissions.c.new_position),
+                SubmissionScore.percentile_rank.is_distinct_from(percentile)
+            )
+        )
+        .values(ranking_position=ranked_submissions.c.new_position, percentile_rank=percentile)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    db.execute(
+        update(Submission)
+        .where(
+            Submission.id == SubmissionScore.submission_id,
+            Submission.domain_id == domain_id,
+            Submission.status == "completed",
+            SubmissionScore.weighted_total.isnot(None),
+            or_(
+                Submission.ranking_position.is_distinct_from(SubmissionScore.ranking_position),
+                Submission.weighted_score.is_distinct_from(SubmissionScore.weighted_total)
+            )
+        )
+        .values(ranking_position=SubmissionScore.ranking_position, weighted_score=SubmissionScore.weighted_total)
+        .execution_options(synchronize_session=False)
+    )
+    return score_rows
+
+
+def upsert_scores(db: Session, score_rows: List[Dict[str, Any]]) -> None:
+    """
+    Insert or update SubmissionScore rows keyed by submission_id, in one statement
+    
+    A score written concurrently by calculate_score_task is overwritten rather
+    than failing the whole batch on the unique key. Every mapping must have the
+    same keys, including submission_id.
+    """
+    if not score_rows:
+        return
+    
+    dialect = db.get_bind().dialect.name
+    columns = [key for key in score_rows[0] if key != "submission_id"]
+    if dialect in ("mysql", "mariadb"):
+        statement = mysql.insert(SubmissionScore)
+        statement = statement.on_duplicate_key_update({column: statement.inserted[column] for column in columns})
+    elif dialect in ("postgresql", "sqlite"):
+        statement = (postgresql if dialect == "postgresql" else sqlite).insert(SubmissionScore)
+        statement = statement.on_conflict_do_update(
+            index_elements=[SubmissionScore.submission_id],
+            set_={column: statement.excluded[column] for column in columns}
+        )
+    else:
+        raise NotImplementedError(f"No upsert for {dialect}")
+    db.execute(statement, score_rows)
+
+
+def complete_scored_submissions(db: Session, submission_rows: List[Dict[str, Any]], completed_at: datetime) -> int:
+    """
+    Copy scores onto their submissions and mark them completed
+    
+    Only submissions still evaluated or completed are touched, so one that
+    was sent back for re-evaluation in the meantime keeps its status.
+    evaluation_completed_at is set on the ones completed now.
+    
+    Args:
+        submission_rows: {"submission_id", "total_score", "weighted_score", "ranking_position"} per submission
+        completed_at: Completion time for newly completed submissions
+    
+    Returns:
+        Number of submissions updated
+    """
+    if not submission_rows:
+        return 0
+    
+    table = Submission.__table__
+    statement = (
+        table.update()
+        .where(
+            table.c.id == bindparam("b_submission_id"),
+            # IN (...) cannot be expanded per row of an executemany
+            or_(table.c.status == "evaluated", table.c.status == "completed")
+        )
+        # MySQL applies SET left to right, so the completion time is decided before status changes
+        .ordered_values(
+            (table.c.evaluation_completed_at, case(
+                (table.c.status == "completed", table.c.evaluation_completed_at), else_=completed_at
+            )),
+            (table.c.total_score, bindparam("b_total_score")),
+            (table.c.weighted_score, bindparam("b_weighted_score")),
+            (table.c.ranking_position, bindparam("b_ranking_position")),
+            (table.c.status, "completed")
+        )
+    )
+    return db.execute(statement, [{f"b_{key}": value for key, value in row.items()} for row in submission_rows]).rowcount
+
+
+def write_rankings_bulk(db: Session, rows: List[Any], standings: List[Dict[str, Any]]) -> int:
+    """
+    Persist precomputed standings with bulk_update_mappings
+
+    Args:
+        rows: load_ranking_rows() for the domain
+        standings: Ranked entries (submission_id, rank, percentile), e.g. from the leaderboard
+
+    Returns:
+        Number of SubmissionScore rows updated
+    """
+    rows_by_submission = {row.submission_id: row for row in rows}
+    score_updates = []
+    submission_updates = []
+
+    for entry in standings:
+        row = rows_by_submission[entry["submission_id"]]
+        rank = entry["rank"]
+        percentile = entry["percentile"]
+
+        if row.ranking_position != rank or row.percentile_rank != percentile:
+            score_updates.append({"id": row.id, "ranking_position": rank, "percentile_rank": percentile})
+
+        if row.submission_ranking_position != rank or row.weighted_score != row.weighted_total:
+            submission_updates.append({
+                "id": row.submission_id,
+                "ranking_position": rank,
+                "weighted_score": row.weighted_total  # Ensure consistency
+            })
+
+    db.bulk_update_mappings(SubmissionScore, score_updates)
+    db.bulk_update_mappings(Submission, submission_updates)
+    return len(score_updates)
@@ -1,24 +1,90 @@
 # services/rate_limiter.py
 import redis
+import os
+import math
 import time
 import asyncio
-from typing import Optional
+from typing import Optional, Dict, Any
 import logging
 import hashlib
 
 logger = logging.getLogger(__name__)
 
+# Generic Cell Rate Algorithm (GCRA), evaluated atomically inside Redis.
+# State is a single "theoretical arrival time" (TAT) per key. A request of
+# weight w is admitted once now >= TAT + (w - 1) * interval - tolerance, and
+# admitting it pushes TAT forward by w * interval. Check and consume happen in
+# one round trip, so concurrent callers can never be admitted off the same read.
+# The tolerance is at least (w - 1) * interval, so a request heavier than the
+# burst is admitted once the bucket has drained (and later requests wait for
+# the whole w * interval) instead of never.
+#
+# KEYS[1]: limiter key
+# ARGV[1]: emission interval in seconds (window / max_requests)
+# ARGV[2]: burst tolerance in seconds ((burst - 1) * interval)
+# ARGV[3]: request weight
+# ARGV[4]: "1" to consume on success, "0" to only peek, "2" to consume even if
+#          over the limit (calls already admitted by the admission scheduler)
+# Returns: {allowed (0/1), retry_after seconds, backlog seconds}
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local weight = tonumber(ARGV[3])
+local tolerance = math.max(tonumber(ARGV[2]), (weight - 1) * interval)
+local consume = ARGV[4] ~= '0'
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+
+local allow_at = tat + (weight - 1) * interval - tolerance
+local allowed = now >= allow_at or ARGV[4] == '2'
+
+if allowed and consume then
+    local new_tat = tat + weight * interval
+    local ttl_ms = math.ceil((new_tat - now) * 1000) + 1000
+    redis.call('SET', KEYS[1], string.format('%.6f', new_tat), 'PX', ttl_ms)
+    tat = new_tat
+end
+
+local retry_after = 0
+if not allowed then
+    retry_after = allow_at - now
+end
+
+return {allowed and 1 or 0, string.format('%.6f', retry_after), string.format('%.6f', tat - now)}
+"""
+
+
 class GeminiRateLimiter:
     """
     Redis-based rate limiter for Gemini API calls
-    Implements sliding window rate limiting
+    Implements GCRA (a token bucket variant) with atomic check-and-consume via Lua
     """
     
-    def __init__(self, redis_client: redis.Redis, max_requests: int = 10, window_minutes: int = 1):
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        max_requests: int = 10,
+        window_minutes: int = 1,
+        burst: Optional[int] = None
+    ):
         self.redis = redis_client
         self.max_requests = max_requests
         self.window_seconds = window_minutes * 60
-        self.key_prefix = "gemini_rate_limit"
+        self.key_prefix = "gemini_gcra"
+        
+        # Requests are spaced evenly at the allowed rate. A burst of 1 admits
+        # at most max_requests in any window, so we never exceed the quota
+        # and pay for 429 retries; larger bursts trade that guarantee for latency.
+        self.burst = burst or int(os.getenv("GEMINI_RATE_LIMIT_BURST", 1))
+        self.emission_interval = self.window_seconds / self.max_requests
+        self.tolerance = (self.burst - 1) * self.emission_interval
+        
+        self._script = self.redis.register_script(GCRA_SCRIPT)
         
     def _get_key(self, identifier: str) -> str:
         """Generate Redis key for rate limiting"""
@@ -26,80 +92,117 @@ class GeminiRateLimiter:
         identifier_hash = hashlib.md5(identifier.encode()).hexdigest()
         return f"{self.key_prefix}:{identifier_hash}"
     
-    async def can_make_request(self, identifier: str = "gemini_api") -> bool:
+    def _evaluate(self, identifier: str, weight: int, consume: bool, force: bool = False) -> Dict[str, Any]:
+        """Run the GCRA script for one identifier"""
+        allowed, retry_after, backlog = self._script(
+            keys=[self._get_key(identifier)],
+            args=[self.emission_interval, self.tolerance, weight, "2" if force else "1" if consume else "0"]
+        )
+        backlog = max(0.0, float(backlog))
+        return {
+            "allowed": bool(int(allowed)),
+            "retry_after": max(0.0, float(retry_after)),
+            "backlog_seconds": backlog,
+            # Weight-1 requests that could still be admitted right now
+            "remaining": max(0, math.floor((self.tolerance - backlog) / self.emission_interval) + 1),
+            "weight": weight
+        }
+    
+    def try_acquire(self, identifier: str = "gemini_api", weight: int = 1) -> Dict[str, Any]:
         """
-        Check if a request can be made within rate limits
+        Atomically check and consume rate limit capacity (synchronous)
         
         Args:
             identifier: Unique identifier for rate limiting (e.g., API key hash)
+            weight: Number of request units this call consumes
             
         Returns:
-            True if request is allowed, False otherwise
+            Dictionary with allowed, exact retry_after seconds, backlog and remaining
         """
         try:
-            key = self._get_key(identifier)
-            current_time = time.time()
-            window_start = current_time - self.window_seconds
-            
-            # Use Redis pipeline for atomic operations
-            pipe = self.redis.pipeline()
-            
-            # Remove old requests outside the window
-            pipe.zremrangebyscore(key, 0, window_start)
-            
-            # Count current requests in window
-            pipe.zcard(key)
-            
-            # Execute pipeline
-            results = pipe.execute()
-            request_count = results[1]
-            
-            if request_count >= self.max_requests:
-                logger.warning(f"Rate limit exceeded for {identifier}: {request_count}/{self.max_requests}")
-                return False
-            
-            # Add current request timestamp
-            self.redis.zadd(key, {str(current_time): current_time})
-            
-            # Set expiration for cleanup
-            self.redis.expire(key, self.window_seconds)
-            
-            logger.debug(f"Request allowed for {identifier}: {request_count + 1}/{self.max_requests}")
-            return True
+            result = self._evaluate(identifier, weight, consume=True)
+            if result["allowed"]:
+                logger.debug(f"Request allowed for {identifier} (weight {weight})")
+            else:
+                logger.warning(
+                    f"Rate limit exceeded for {identifier}: retry in {result['retry_after']:.2f}s"
+                )
+            return result
             
         except Exception as e:
             logger.error(f"Error checking rate limit: {str(e)}")
             # Fail open - allow request if Redis is down
-            return True
+            return {"allowed": True, "retry_after": 0.0, "backlog_seconds": 0.0,
+                    "remaining": self.burst, "weight": weight, "error": str(e)}
     
-    async def get_wait_time(self, identifier: str = "gemini_api") -> int:
+    def charge(self, identifier: str = "gemini_api", weight: int = 1) -> Dict[str, Any]:
         """
-        Get the time to wait before the next request is allowed
+        Record a request that was already admitted elsewhere, without waiting
+        
+        Capacity is consumed even if it is over the limit, so later requests
+        see the backlog.
         
         Args:
             identifier: Unique identifier for rate limiting
+            weight: Number of request units this call consumes
             
         Returns:
-            Wait time in seconds, 0 if no wait required
+            Same shape as try_acquire
         """
         try:
-            key = self._get_key(identifier)
-            current_time = time.time()
-            
-            # Get the oldest request in the current window
-            oldest_requests = self.redis.zrange(key, 0, 0, withscores=True)
-            
-            if not oldest_requests:
-                return 0
+            return self._evaluate(identifier, weight, consume=True, force=True)
+        except Exception as e:
+            logger.error(f"Error checking rate limit: {str(e)}")
+            return {"allowed": True, "retry_after": 0.0, "backlog_seconds": 0.0,
+                    "remaining": self.burst, "weight": weight, "error": str(e)}
+    
+    def peek(self, identifier: str = "gemini_api", weight: int = 1) -> Dict[str, Any]:
+        """
+        Report whether a request would be admitted, without consuming capacity
+        
+        Args:
+            identifier: Unique identifier for rate limiting
+            weight: Number of request units to check for
             
-            oldest_time = oldest_requests[0][1]
-            wait_time = int(oldest_time + self.window_seconds - current_time)
+        Returns:
+            Same shape as try_acquire
+        """
+        try:
+            return self._evaluate(identifier, weight, consume=False)
+        except Exception as e:
+            logger.error(f"Error checking rate limit: {str(e)}")
+            return {"allowed": True, "retry_after": 0.0, "backlog_seconds": 0.0,
+                    "remaining": self.burst, "weight": weight, "error": str(e)}
+    
+    async def acquire(self, identifier: str = "gemini_api", weight: int = 1) -> Dict[str, Any]:
+        """Async wrapper around try_acquire"""
+        return self.try_acquire(identifier, weight)
+    
+    async def can_make_request(self, identifier: str = "gemini_api", weight: int = 1) -> bool:
+        """
+        Check if a request can be made within rate limits, consuming capacity if so
+        
+        Args:
+            identifier: Unique identifier for rate limiting (e.g., API key hash)
+            weight: Number of request units this call consumes
             
-            return max(0, wait_time)
+        Returns:
+            True if request is allowed, False otherwise
+        """
+        return self.try_acquire(identifier, weight)["allowed"]
+    
+    async def get_wait_time(self, identifier: str = "gemini_api", weight: int = 1) -> int:
+        """
+        Get the time to wait before the next request is allowed
+        
+        Args:
+            identifier: Unique identifier for rate limiting
+            weight: Number of request units to wait for
             
-        except Exception as e:
-            logger.error(f"Error calculating wait time: {str(e)}")
-            return 0
+        Returns:
+            Wait time in whole seconds (rounded up), 0 if no wait required
+        """
+        return math.ceil(self.peek(identifier, weight)["retry_after"])
     
     async def get_current_usage(self, identifier: str = "gemini_api") -> dict:
         """
@@ -111,41 +214,24 @@ class GeminiRateLimiter:
         Returns:
             Dictionary with usage statistics
         """
-        try:
-            key = self._get_key(identifier)
-            current_time = time.time()
-            window_start = current_time - self.window_seconds
-            
-            # Clean up old entries
-            self.redis.zremrangebyscore(key, 0, window_start)
-            
-            # Get current count
-            current_count = self.redis.zcard(key)
-            
-            # Get request timestamps for analysis
-            requests = self.redis.zrange(key, 0, -1, withscores=True)
-            request_times = [score for _, score in requests]
-            
-            return {
-                "current_requests": current_count,
-                "max_requests": self.max_requests,
-                "window_seconds": self.window_seconds,
-                "remaining_requests": max(0, self.max_requests - current_count),
-                "window_start": window_start,
-                "window_end": current_time,
-                "request_timestamps": request_times,
-                "requests_allowed": current_count < self.max_requests
-            }
-            
-        except Exception as e:
-            logger.error(f"Error getting usage stats: {str(e)}")
-            return {
-                "current_requests": 0,
-                "max_requests": self.max_requests,
-                "window_seconds": self.window_seconds,
-                "remaining_requests": self.max_requests,
-                "error": str(e)
-            }
+        state = self.peek(identifier)
+        # Capacity already committed, expressed in requests
+        committed = math.ceil(state["backlog_seconds"] / self.emission_interval)
+        
+        usage = {
+            "current_requests": committed,
+            "max_requests": self.max_requests,
+            "window_seconds": self.window_seconds,
+            "burst": self.burst,
+            "emission_interval_seconds": self.emission_interval,
+            "remaining_requests": state["remaining"],
+            "backlog_seconds": state["backlog_seconds"],
+            "retry_after_seconds": state["retry_after"],
+            "requests_allowed": state["allowed"]
+        }
+        if "error" in state:
+            usage["error"] = state["error"]
+        return usage
     
     async def reset_limits(self, identifier: str = "gemini_api") -> bool:
         """
@@ -167,27 +253,37 @@ class GeminiRateLimiter:
             logger.error(f"Error resetting rate limits: {str(e)}")
             return False
     
-    async def wait_for_availability(self, identifier: str = "gemini_api", max_wait: int = 300) -> bool:
+    async def wait_for_availability(
+        self,
+        identifier: str = "gemini_api",
+        max_wait: int = 300,
+        weight: int = 1
+    ) -> bool:
         """
         Wait until a request can be made or max_wait time is reached
         
+        Sleeps for the exact retry-after reported by the limiter between attempts.
+        
         Args:
             identifier: Unique identifier for rate limiting
             max_wait: Maximum time to wait in seconds
+            weight: Number of request units to acquire
             
         Returns:
-            True if request is now allowed, False if max_wait exceeded
+            True if the request was admitted (capacity consumed), False if max_wait exceeded
         """
-        start_time = time.time()
+        deadline = time.time() + max_wait
         
-        while time.time() - start_time < max_wait:
-            if await self.can_make_request(identifier):
+        while True:
+            result = self.try_acquire(identifier, weight)
+            if result["allowed"]:
                 return True
             
-            wait_time = await self.get_wait_time(identifier)
-            sleep_time = min(wait_time + 1, 10)  # Wait at least 1 second, max 10
+            sleep_time = result["retry_after"]
+            if time.time() + sleep_time > deadline:
+                break
             
-            logger.debug(f"Waiting {sleep_time} seconds for rate limit availability")
+            logger.debug(f"Waiting {sleep_time:.2f} seconds for rate limit availability")
             await asyncio.sleep(sleep_time)
         
         logger.warning(f"Max wait time {max_wait} exceeded for {identifier}")
@@ -0,0 +1,173 @@
+# services/response_schemas.py
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Type, Annotated
+import logging
+
+from pydantic import BaseModel, ConfigDict, Field, create_model
+
+from schemas import GeminiEvaluationResponse, GeminiJudgement, GeminiChunkSummary, CriterionEvidence
+from services.json_stream import schema_from_model
+
+logger = logging.getLogger(__name__)
+
+# Scores are whole numbers in the prompt examples; the schema keeps Gemini to them
+DomainCriterionScore = Annotated[int, Field(ge=1, le=10)]
+
+
+def criteria_version(judging_criteria: Dict[str, str]) -> str:
+    """Content hash of a domain's criteria; schemas are rebuilt when it changes"""
+    return hashlib.sha256(json.dumps(judging_criteria, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def gemini_schema(node: Optional[Dict[str, Any]], description: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Translate a json_stream schema node into a Gemini response_schema
+
+    Gemini schemas have no numeric bounds or free-form maps, so bounds are
+    stated in the description and maps become plain objects.
+    """
+    if node is None:
+        schema = {"type": "string"}
+    elif node["type"] == "object":
+        schema = {"type": "object"}
+        if node["fields"]:
+            schema["properties"] = {
+                name: gemini_schema(child, (node.get("descriptions") or {}).get(name))
+                for name, child in node["fields"].items()
+            }
+            schema["required"] = sorted(node["required"])
+    elif node["type"] == "array":
+        schema = {"type": "array", "items": gemini_schema(node["items"])}
+    else:
+        schema = {"type": node["type"]}
+        if "ge" in node or "le" in node:
+            bounds = f"from {node.get('ge', '')} to {node.get('le', '')}"
+            description = f"{description} ({bounds})" if description else bounds.capitalize()
+
+    if description:
+        schema["description"] = description
+    if node and node.get("nullable"):
+        schema["nullable"] = True
+    return schema
+
+
+def response_schema(model: Type[BaseModel], criteria_descriptions: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Gemini response_schema for a pydantic model, describing criteria fields with their domain text"""
+    node = schema_from_model(model)
+
+    def describe(node: Optional[Dict[str, Any]]) -> None:
+        if not node:
+            return
+        if node["type"] == "object":
+            if criteria_descriptions and set(node["fields"]) == set(criteria_descriptions):
+                node["descriptions"] = criteria_descriptions
+            for child in node["fields"].values():
+                describe(child)
+        elif node["type"] == "array":
+            describe(node["items"])
+
+    describe(node)
+    return gemini_schema(node)
+
+
+def criteria_model(name: str, annotation: Any, judging_criteria: Dict[str, str]) -> Type[BaseModel]:
+    """
+    Model with one required field per criterion key
+
+    Criterion keys are free text, so they can clash with pydantic internals
+    (model_config), shadow BaseModel attributes (json, schema) or be dropped
+    as private (_notes). Fields get positional names and the key as alias;
+    validation and the response schema use the alias.
+    """
+    return create_model(
+        name,
+        __config__=ConfigDict(populate_by_name=True),
+        **{
+            f"criterion_{index}": (annotation, Field(..., alias=key))
+            for index, key in enumerate(judging_criteria)
+        }
+    )
+
+
+def field_model(model: Type[BaseModel], fields: List[str]) -> Type[BaseModel]:
+    """Model with only the given top-level fields of `model`, all required (for re-asking)"""
+    return create_model(
+        f"{model.__name__}Fields",
+        **{name: (model.model_fields[name].annotation, ...) for name in fields}
+    )
+
+
+class DomainResponseSchemas:
+    """
+    Response models and Gemini response schemas for one domain's criteria
+
+    criteria_scores (and the per-criterion evidence of map-reduce chunk
+    summaries) get one required property per criterion in
+    Domain.judging_criteria, so a response that skips or invents a
+    criterion fails validation instead of being scored with the wrong keys.
+    """
+
+    def __init__(self, judging_criteria: Dict[str, str]):
+        self.version = criteria_version(judging_criteria)
+        self.criteria = dict(judging_criteria)
+
+        criteria_scores = criteria_model("DomainCriteriaScores", DomainCriterionScore, judging_criteria)
+        criteria_evidence = criteria_model("DomainCriteriaEvidence", CriterionEvidence, judging_criteria)
+
+        self.models = {
+            "evaluation": create_model(
+                "DomainEvaluationResponse", __base__=GeminiEvaluationResponse, criteria_scores=(criteria_scores, ...)
+            ),
+            "judgement": create_model(
+                "DomainJudgement", __base__=GeminiJudgement, criteria_scores=(criteria_scores, ...)
+            ),
+            "chunk_summary": create_model(
+                "DomainChunkSummary", __base__=GeminiChunkSummary, criteria_evidence=(criteria_evidence, ...)
+            )
+        }
+        self.response_schemas = {
+            kind: response_schema(model, self.criteria) for kind, model in self.models.items()
+        }
+
+
+class ResponseSchemaCache:
+    """
+    Per-domain response schemas, built once per criteria version
+
+    Keyed by the content hash of the criteria, so editing a domain's criteria
+    yields new schemas while unchanged domains keep reusing theirs.
+    """
+
+    def __init__(self, max_domains: int = 128):
+        self.max_domains = max_domains
+        self._schemas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, judging_criteria: Dict[str, str]) -> DomainResponseSchemas:
+        """
+        Get the schemas for a domain's criteria, building them on first use
+
+        Args:
+            judging_criteria: Domain.judging_criteria (criterion key -> description)
+
+        Returns:
+            DomainResponseSchemas for this criteria version
+        """
+        version = criteria_version(judging_criteria)
+        with self._lock:
+            schemas = self._schemas.get(version)
+            if schemas is not None:
+                self._schemas.move_to_end(version)
+                return schemas
+
+        schemas = DomainResponseSchemas(judging_criteria)
+        logger.info(f"Built response schemas for criteria version {version} ({len(judging_criteria)} criteria)")
+
+        with self._lock:
+            self._schemas[version] = schemas
+            while len(self._schemas) > self.max_domains:
+                self._schemas.popitem(last=False)
+        return schemas
@@ -0,0 +1,129 @@
+# services/scoring_engine.py
+from typing import List, Dict, Any, Optional, Sequence
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Presentation quality adjustments: bonus for strong flow/completeness, penalty for inconsistency
+FLOW_BONUS = 0.5
+COMPLETENESS_BONUS = 0.3
+BONUS_THRESHOLD = 8
+MAX_BONUS = 1.0
+MAJOR_INCONSISTENCY = 5
+MINOR_INCONSISTENCY = 7
+MAJOR_PENALTY = 1.0
+MINOR_PENALTY = 0.5
+MAX_CRITERION_SCORE = 10.0
+
+
+def _quality_vector(values: Sequence[Optional[float]]) -> np.ndarray:
+    """Quality scores as floats, missing ones as NaN (which fails every threshold)"""
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def competition_ranks(scores: np.ndarray) -> np.ndarray:
+    """
+    Rank = 1 + number of strictly higher scores, so ties share a rank
+
+    Matches the leaderboard and the RANK() window used for write-back.
+    """
+    ascending = np.sort(scores)
+    return len(scores) - np.searchsorted(ascending, scores, side="right") + 1
+
+
+def score_batch(
+    criteria_breakdowns: List[Dict[str, float]],
+    weight_distribution: Dict[str, float],
+    presentation_flow_scores: Sequence[Optional[float]],
+    completeness_scores: Sequence[Optional[float]],
+    consistency_scores: Sequence[Optional[float]]
+) -> Dict[str, Any]:
+    """
+    Score every evaluated submission of a domain in one vectorized pass
+
+    Criteria scores become a submissions x criteria matrix and the domain's
+    weights a vector. Criteria a submission was not scored on contribute
+    nothing, and criteria without a weight count towards the raw total only,
+    as in SubmissionScore.calculate_weighted_total.
+
+    Args:
+        criteria_breakdowns: Criterion key -> score, one dict per submission
+        weight_distribution: Domain.weight_distribution
+        presentation_flow_scores: SubmissionEvaluation.presentation_flow_score per submission
+        completeness_scores: SubmissionEvaluation.completeness_score per submission
+        consistency_scores: SubmissionEvaluation.consistency_score per submission
+
+    Returns:
+        Dictionary of per-submission arrays (raw_total, weighted_total before
+        adjustments, bonus, penalty, final_score, normalized_score, rank,
+        percentile) plus "weighted_breakdowns", one dict per submission
+    """
+    count = len(criteria_breakdowns)
+
+    # Weighted criteria first, then anything else the evaluations scored
+    criteria = list(weight_distribution)
+    known = set(criteria)
+    for breakdown in criteria_breakdowns:
+        for key in breakdown:
+            if key not in known:
+                known.add(key)
+                criteria.append(key)
+    column = {key: index for index, key in enumerate(criteria)}
+
+    scores = np.array(
+        [[breakdown.get(key, 0.0) for key in criteria] for breakdown in criteria_breakdowns],
+        dtype=np.float64
+    ).reshape(count, len(criteria))
+
+    weights = np.array([weight_distribution.get(key, 0.0) for key in criteria], dtype=np.float64)
+    weighted = scores * weights
+
+    raw_total = scores.sum(axis=1)
+    weighted_total = weighted.sum(axis=1)
+
+    flow = _quality_vector(presentation_flow_scores)
+    completeness = _quality_vector(completeness_scores)
+    consistency = _quality_vector(consistency_scores)
+
+    with np.errstate(invalid="ignore"):
+        bonus = np.minimum(
+            np.where(flow >= BONUS_THRESHOLD, FLOW_BONUS, 0.0)
+            + np.where(completeness >= BONUS_THRESHOLD, COMPLETENESS_BONUS, 0.0),
+            MAX_BONUS
+        )
+        # A missing (or zero) consistency score is not penalized
+        penalty = np.where(
+            consistency < MAJOR_INCONSISTENCY, MAJOR_PENALTY,
+            np.where(consistency < MINOR_INCONSISTENCY, MINOR_PENALTY, 0.0)
+        )
+    penalty[np.isnan(consistency) | (consistency == 0)] = 0.0
+
+    final_score = weighted_total + bonus - penalty
+
+    max_possible = MAX_CRITERION_SCORE * sum(weight_distribution.values())
+    normalized_score = final_score / max_possible * 100 if max_possible > 0 else np.zeros(count)
+
+    rank = competition_ranks(final_score)
+    percentile = np.round((count - rank + 1) / count * 100, 2) if count else np.zeros(0)
+
+    # Per-criterion weighted scores, for the criteria each submission was scored on
+    weighted_rows = weighted.tolist()
+    weighted_breakdowns = [
+        {key: values[column[key]] for key in breakdown}
+        for breakdown, values in zip(criteria_breakdowns, weighted_rows)
+    ]
+
+    return {
+        "criteria": criteria,
+        "raw_total": raw_total,
+        "weighted_total": weighted_total,
+        "weighted_breakdowns": weighted_breakdowns,
+        "bonus": bonus,
+        "penalty": penalty,
+        "final_score": final_score,
+        "normalized_score": normalized_score,
+        "rank": rank,
+        "percentile": percentile
+    }
@@ -0,0 +1,321 @@
+# services/slide_budget.py
+import os
+import math
+import hashlib
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+
+from PIL import Image, ImageChops
+
+from services.perceptual_hash import difference_hash, parse_hash, hamming_distance
+
+logger = logging.getLogger(__name__)
+
+# Gemini bills an image of at most 384x384 as one 258-token tile; larger
+# images are split into 768x768 tiles of 258 tokens each
+TOKENS_PER_TILE = 258
+IMAGE_TILE_SIZE = 768
+SMALL_IMAGE_SIZE = 384
+
+# Long-edge sizes tried, largest first, when slides must be downscaled
+DOWNSCALE_STEPS = (1536, 1152, 768, 384)
+
+PRESEND_DIRNAME = ".presend"
+
+# Near-duplicate confirmation: mean grayscale difference on a small thumbnail
+DUPLICATE_THUMBNAIL_SIZE = (160, 90)
+DUPLICATE_MAX_DIFFERENCE = 1.0
+
+# Identical-slide confirmation: no pixel of a larger thumbnail may differ by
+# more than this, so a changed word or number keeps the slide
+IDENTICAL_THUMBNAIL_SIZE = (320, 180)
+IDENTICAL_MAX_PIXEL_DIFFERENCE = 16
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Input tokens Gemini charges for an image of the given size"""
+    if width <= SMALL_IMAGE_SIZE and height <= SMALL_IMAGE_SIZE:
+        return TOKENS_PER_TILE
+    return math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE) * TOKENS_PER_TILE
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Rough token count for prompt text (about four characters per token)"""
+    return math.ceil(len(text) / 4)
+
+
+def thumbnail_difference(first: Image.Image, second: Image.Image) -> float:
+    """Mean absolute grayscale difference (0-255) between two same-size thumbnails"""
+    histogram = ImageChops.difference(first, second).histogram()
+    return sum(value * count for value, count in enumerate(histogram)) / max(1, sum(histogram))
+
+
+def max_pixel_difference(first: Image.Image, second: Image.Image) -> int:
+    """Largest grayscale difference (0-255) between two same-size thumbnails"""
+    return ImageChops.difference(first, second).getextrema()[1]
+
+
+def slide_dhash(slide: Dict[str, Any], img: Optional[Image.Image] = None) -> int:
+    """dHash recorded for a slide at rasterization, computed from the image if missing"""
+    recorded = parse_hash(slide.get("dhash"))
+    if recorded is not None:
+        return recorded
+    if img is not None:
+        return difference_hash(img)
+    with Image.open(slide["path"]) as img:
+        return difference_hash(img)
+
+
+def _scaled_size(width: int, height: int, long_edge: Optional[int]) -> Tuple[int, int]:
+    if not long_edge or max(width, height) <= long_edge:
+        return width, height
+    scale = long_edge / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+class SlideBudgeter:
+    """
+    Fit a deck into a per-request token budget before it is sent to Gemini
+
+    Visually identical slides (repeated templates, transition frames, copies)
+    are always collapsed into the first occurrence. Decks then within budget are
+    sent as they are. Otherwise, in order and only as far as needed:
+        1. crop uniform margins (whitespace) around slide content
+        2. drop slides that are near-duplicates of the previous kept slide
+        3. downscale every slide to the largest long edge that fits
+
+    Transformed slides are written next to the originals (in .presend/) under
+    names derived from the source hash, so retries reuse the same files and
+    their uploaded handles.
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        duplicate_distance: Optional[int] = None,
+        crop_tolerance: int = 12,
+        collapse_identical: Optional[bool] = None
+    ):
+        self.token_budget = token_budget or int(os.getenv("GEMINI_TOKEN_BUDGET", 64000))
+        # Maximum dHash Hamming distance (of 64 bits) for two slides to count as near-duplicates
+        self.duplicate_distance = duplicate_distance if duplicate_distance is not None else int(
+            os.getenv("GEMINI_DUPLICATE_DISTANCE", 4)
+        )
+        self.crop_tolerance = crop_tolerance
+        self.collapse_identical = collapse_identical if collapse_identical is not None else (
+            os.getenv("GEMINI_COLLAPSE_IDENTICAL", "true").lower() == "true"
+        )
+
+    def settings(self) -> Dict[str, Any]:
+        """Settings that change what is sent (part of the evaluation cache key)"""
+        return {
+            "token_budget": self.token_budget,
+            "duplicate_distance": self.duplicate_distance,
+            "collapse_identical": self.collapse_identical
+        }
+
+    def collapse(self, slides: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, int]]]:
+        """
+        Keep the first occurrence of every visually identical slide, anywhere in the deck
+
+        Slides with the same file hash are identical outright. Otherwise an equal
+        dHash marks a candidate, confirmed on a thumbnail so that slides sharing a
+        template but differing in a word are kept. Only candidates are opened.
+
+        Returns:
+            (kept slides, [{"slide": number, "same_as": number}] for collapsed slides);
+            slides are returned unchanged when collapsing is disabled
+        """
+        if not self.collapse_identical:
+            return slides, []
+
+        kept = []
+        collapsed = []
+        by_sha256 = {}
+        by_dhash = {}
+        thumbnails = {}
+
+        def thumbnail(slide: Dict[str, Any]) -> Image.Image:
+            if slide["number"] not in thumbnails:
+                with Image.open(slide["path"]) as img:
+                    thumbnails[slide["number"]] = img.convert("L").resize(
+                        IDENTICAL_THUMBNAIL_SIZE, Image.Resampling.BILINEAR
+                    )
+            return thumbnails[slide["number"]]
+
+        for slide in slides:
+            original = by_sha256.get(slide["sha256"])
+            if original is None:
+                for candidate in by_dhash.get(slide_dhash(slide), []):
+                    if max_pixel_difference(thumbnail(slide), thumbnail(candidate)) <= IDENTICAL_MAX_PIXEL_DIFFERENCE:
+                        original = candidate
+                        break
+
+            if original is not None:
+                collapsed.append({"slide": slide["number"], "same_as": original["number"]})
+                continue
+
+            kept.append(slide)
+            by_sha256[slide["sha256"]] = slide
+            by_dhash.setdefault(slide_dhash(slide), []).append(slide)
+
+        return kept, collapsed
+
+    def _content_box(self, img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+        """Bounding box of everything that differs from the corner (background) colour"""
+        rgb = img.convert("RGB")
+        background = Image.new("RGB", rgb.size, rgb.getpixel((0, 0)))
+        mask = ImageChops.difference(rgb, background).convert("L").point(
+            lambda value: 255 if value > self.crop_tolerance else 0
+        )
+        box = mask.getbbox()
+        if not box:
+            return None
+
+        # Keep a small margin and only crop when it saves a meaningful area
+        margin = max(4, round(0.01 * max(rgb.size)))
+        box = (
+            max(0, box[0] - margin), max(0, box[1] - margin),
+            min(rgb.width, box[2] + margin), min(rgb.height, box[3] + margin)
+        )
+        cropped_area = (box[2] - box[0]) * (box[3] - box[1])
+        if cropped_area > 0.9 * rgb.width * rgb.height:
+            return None
+        return box
+
+    def _total_tokens(self, prompt_tokens: int, slides: List[Dict[str, Any]], long_edge: Optional[int] = None) -> int:
+        total = prompt_tokens
+        for slide in slides:
+            total += estimate_image_tokens(*_scaled_size(slide["width"], slide["height"], long_edge))
+        return total
+
+    def _materialize(self, slide: Dict[str, Any], long_edge: Optional[int]) -> Dict[str, Any]:
+        """Write the cropped/downscaled version of a slide and describe it"""
+        source = Path(slide["path"])
+        crop_box = slide.get("crop_box")
+        tag = []
+        if crop_box:
+            tag.append("c" + "-".join(str(v) for v in crop_box))
+        if long_edge and max(slide["width"], slide["height"]) > long_edge:
+            tag.append(f"s{long_edge}")
+        if not tag:
+            return slide
+
+        output_path = source.parent / PRESEND_DIRNAME / f"{slide['sha256'][:16]}_{'_'.join(tag)}{source.suffix}"
+        with Image.open(source) as img:
+            image_format = img.format
+            if not output_path.exists():
+                if crop_box:
+                    img = img.crop(crop_box)
+                target_size = _scaled_size(img.width, img.height, long_edge)
+                if target_size != img.size:
+                    img = img.resize(target_size, Image.Resampling.LANCZOS)
+                output_path.parent.mkdir(exist_ok=True)
+                tmp_path = output_path.with_name(f".{output_path.name}.tmp{os.getpid()}")
+                img.save(tmp_path, format=image_format)
+                os.replace(tmp_path, output_path)
+
+        with Image.open(output_path) as derived:
+            width, height = derived.size
+        with open(output_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return {**slide, "path": str(output_path), "sha256": digest, "width": width, "height": height}
+
+    def fit(
+        self,
+        slides: List[Dict[str, Any]],
+        prompt: str,
+        identical: Optional[List[Dict[str, int]]] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Reduce a deck until its estimated token cost fits the budget
+
+        Args:
+            slides: Slides with path, mime_type, sha256, number (1-based page)
+                and optionally the dhash recorded at rasterization
+            prompt: Prompt text sent with the slides
+            identical: Result of an earlier collapse() of these slides; they are
+                then not collapsed again
+
+        Returns:
+            (slides to send, report for the evaluation metadata)
+        """
+        prompt_tokens = estimate_text_tokens(prompt)
+        slides = [dict(slide) for slide in slides]
+        for slide in slides:
+            with Image.open(slide["path"]) as img:
+                slide["width"], slide["height"] = img.size
+
+        estimated_before = self._total_tokens(prompt_tokens, slides)
+        report = {
+            "budget": self.token_budget,
+            "estimated_tokens_before": estimated_before,
+            "slides_received": len(slides),
+            "identical": list(identical or []),
+            "cropped": [],
+            "dropped_duplicates": [],
+            "downscaled_to": None
+        }
+
+        if identical is None:
+            # Identical slides carry nothing new, so they are never sent twice
+            slides, report["identical"] = self.collapse(slides)
+
+        if self._total_tokens(prompt_tokens, slides) > self.token_budget:
+            # 1. Crop whitespace margins
+            for slide in slides:
+                with Image.open(slide["path"]) as img:
+                    box = self._content_box(img)
+                if box:
+                    slide["crop_box"] = box
+                    slide["width"], slide["height"] = box[2] - box[0], box[3] - box[1]
+                    report["cropped"].append(slide["number"])
+
+        if self._total_tokens(prompt_tokens, slides) > self.token_budget:
+            # 2. Drop near-duplicates of the previous kept slide. The dHash is a
+            # cheap filter; a thumbnail comparison confirms, so slides sharing a
+            # template but carrying different text are kept
+            kept = []
+            previous = None
+            for slide in slides:
+                with Image.open(slide["path"]) as img:
+                    slide_hash = slide_dhash(slide, img)
+                    thumbnail = img.convert("L").resize(DUPLICATE_THUMBNAIL_SIZE, Image.Resampling.BILINEAR)
+                if (
+                    previous
+                    and hamming_distance(slide_hash, previous[0]) <= self.duplicate_distance
+                    and thumbnail_difference(thumbnail, previous[1]) <= DUPLICATE_MAX_DIFFERENCE
+                ):
+                    report["dropped_duplicates"].append({"slide": slide["number"], "duplicate_of": kept[-1]["number"]})
+                    continue
+                kept.append(slide)
+                previous = (slide_hash, thumbnail)
+            slides = kept
+
+        long_edge = None
+        if self._total_tokens(prompt_tokens, slides) > self.token_budget:
+            # 3. Downscale to the largest size that fits (or the smallest step)
+            long_edge = DOWNSCALE_STEPS[-1]
+            for step in DOWNSCALE_STEPS:
+                if self._total_tokens(prompt_tokens, slides, step) <= self.token_budget:
+                    long_edge = step
+                    break
+            report["downscaled_to"] = long_edge
+
+        slides = [self._materialize(slide, long_edge) for slide in slides]
+
+        estimated_after = self._total_tokens(prompt_tokens, slides)
+        report.update({
+            "estimated_tokens_after": estimated_after,
+            "within_budget": estimated_after <= self.token_budget,
+            "slides_sent": len(slides)
+        })
+        if estimated_after != estimated_before:
+            logger.info(
+                f"Token budget: {estimated_before} -> {estimated_after} estimated tokens "
+                f"({len(report['identical'])} identical, {len(report['cropped'])} cropped, "
+                f"{len(report['dropped_duplicates'])} dropped, "
+                f"downscaled to {long_edge or 'original size'})"
+            )
+        return slides, report
@@ -0,0 +1,356 @@
+# services/slide_cache.py
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Dict, Any
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+LAST_USED_FILENAME = ".last_used"
+
+# Add or refresh an entry in the Redis index and return the store's total bytes.
+# KEYS: last-used zset, sizes hash, total bytes counter
+# ARGV: cache key, entry bytes, last used timestamp
+INDEX_SCRIPT = """
+local previous = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+return redis.call('INCRBY', KEYS[3], tonumber(ARGV[2]) - previous)
+"""
+
+# Drop an entry from the Redis index. Returns the remaining total bytes, or -1
+# if the entry was not indexed (another worker already evicted it).
+# KEYS: last-used zset, sizes hash, total bytes counter
+# ARGV: cache key
+FORGET_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+local size = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+redis.call('HDEL', KEYS[2], ARGV[1])
+return redis.call('DECRBY', KEYS[3], size)
+"""
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SlideCache:
+    """
+    Content-addressed store of rendered slides
+
+    Entries are keyed by the PDF's SHA-256 plus the render settings, so a
+    re-uploaded deck rendered with the same settings is linked from the store
+    instead of being rasterized again. Entries are evicted least recently
+    used first once the store grows past max_bytes.
+
+    With Redis, entry sizes, last use times and the total size are kept in an
+    index updated on every store, hit and eviction, so neither eviction nor
+    stats walk the store. Without Redis the store is scanned instead.
+
+    Layout: <root>/<key[:2]>/<key>/{manifest.json, slide_N.<ext>, .last_used}
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        redis_client: Optional[redis.Redis] = None,
+        max_bytes: Optional[int] = None
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.redis = redis_client
+        self.max_bytes = max_bytes or int(os.getenv("SLIDE_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+        self.stats_key = "slide_cache:stats"
+        self.index_key = "slide_cache:last_used"
+        self.sizes_key = "slide_cache:sizes"
+        self.bytes_key = "slide_cache:total_bytes"
+        self.indexed_key = "slide_cache:indexed"
+
+        if self.redis is not None:
+            self._index_script = self.redis.register_script(INDEX_SCRIPT)
+            self._forget_script = self.redis.register_script(FORGET_SCRIPT)
+
+        # Fallback counters when no Redis client is configured (per process only)
+        self._local_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def cache_key(self, pdf_sha256: str, render_settings: Dict[str, Any]) -> str:
+        """
+        Build the content address for a PDF rendered with the given settings
+
+        Args:
+            pdf_sha256: SHA-256 of the original PDF
+            render_settings: Settings that affect the rendered output
+
+        Returns:
+            Hex cache key
+        """
+        payload = json.dumps({"pdf": pdf_sha256, "settings": render_settings}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _increment(self, counter: str, amount: int = 1) -> None:
+        """Bump a hit/miss counter, shared across processes when Redis is available"""
+        if self.redis is not None:
+            try:
+                self.redis.hincrby(self.stats_key, counter, amount)
+                return
+            except Exception as e:
+                logger.error(f"Error updating slide cache stats: {str(e)}")
+        self._local_stats[counter] += amount
+
+    def _index_keys(self) -> List[str]:
+        return [self.index_key, self.sizes_key, self.bytes_key]
+
+    def _index(self, key: str, size: int, last_used: float) -> int:
+        """Record an entry in the Redis index; returns the store's total bytes"""
+        return int(self._index_script(keys=self._index_keys(), args=[key, size, last_used]))
+
+    def _forget(self, key: str) -> int:
+        """Remove an entry from the Redis index; returns the remaining total bytes, -1 if it was not indexed"""
+        return int(self._forget_script(keys=self._index_keys(), args=[key]))
+
+    def _ensure_index(self) -> None:
+        """Index entries already on disk, once (the first caller after the index was created or lost)"""
+        if not self.redis.set(self.indexed_key, 1, nx=True):
+            return
+        entries = self._entries()
+        for entry in entries:
+            self._index(entry["path"].name, entry["bytes"], entry["last_used"])
+        logger.info(f"Indexed {len(entries)} existing slide cache entries")
+
+    def _link_or_copy(self, source: Path, destination: Path) -> None:
+        """Hard link a file, copying when linking is not possible (e.g. across devices)"""
+        if destination.exists():
+            destination.unlink()
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
+
+    def _entry_files(self, entry_path: Path) -> List[Path]:
+        """Slide files listed in an entry's manifest, followed by the manifest itself"""
+        manifest_path = entry_path / MANIFEST_FILENAME
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        return [entry_path / slide["filename"] for slide in manifest["slides"]] + [manifest_path]
+
+    def fetch(self, key: str, output_dir: str) -> Optional[List[str]]:
+        """
+        Link a cached rendering into a slides directory
+
+        Args:
+            key: Cache key from cache_key()
+            output_dir: Slides directory to populate
+
+        Returns:
+            Slide image paths in page order on a hit, None on a miss
+        """
+        entry_path = self._entry_path(key)
+        output_path = Path(output_dir)
+
+        try:
+            files = self._entry_files(entry_path)
+            output_path.mkdir(parents=True, exist_ok=True)
+            for source in files:
+                self._link_or_copy(source, output_path / source.name)
+
+            # Mark as recently used for LRU eviction
+            (entry_path / LAST_USED_FILENAME).touch()
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            # Missing, partially evicted or corrupt entries count as misses
+            self._increment("misses")
+            if self.redis is not None:
+                try:
+                    self._forget(key)
+                except Exception as e:
+                    logger.error(f"Error updating slide cache index: {str(e)}")
+            return None
+
+        if self.redis is not None:
+            try:
+                self.redis.zadd(self.index_key, {key: time.time()}, xx=True)
+            except Exception as e:
+                logger.error(f"Error updating slide cache index: {str(e)}")
+
+        self._increment("hits")
+        logger.info(f"Slide cache hit for {key[:12]}: linked {len(files) - 1} slides into {output_dir}")
+        return [str(output_path / source.name) for source in files[:-1]]
+
+    def store(self, key: str, slides_dir: str) -> bool:
+        """
+        Add a freshly rendered slides directory to the store
+
+        The entry is assembled in a temporary directory and renamed into place,
+        so concurrent readers never see a partial entry.
+
+        Args:
+            key: Cache key from cache_key()
+            slides_dir: Slides directory containing a manifest
+
+        Returns:
+            True if the entry was stored, False if it already existed or failed
+        """
+        entry_path = self._entry_path(key)
+        if entry_path.exists():
+            return False
+
+        tmp_root = self.root / ".tmp"
+        tmp_root.mkdir(exist_ok=True)
+        tmp_path = Path(tempfile.mkdtemp(dir=tmp_root))
+
+        try:
+            size = 0
+            for source in self._entry_files(Path(slides_dir)):
+                self._link_or_copy(source, tmp_path / source.name)
+                size += source.stat().st_size
+            (tmp_path / LAST_USED_FILENAME).touch()
+
+            entry_path.parent.mkdir(exist_ok=True)
+            os.rename(tmp_path, entry_path)
+        except OSError as e:
+            # Another worker stored the same key first, or the source vanished
+            logger.debug(f"Slide cache store skipped for {key[:12]}: {str(e)}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return False
+        except Exception as e:
+            logger.error(f"Error storing slides in cache: {str(e)}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return False
+
+        self._increment("stores")
+
+        total_bytes = None
+        if self.redis is not None:
+            try:
+                self._ensure_index()
+                total_bytes = self._index(key, size, time.time())
+            except Exception as e:
+                logger.error(f"Error updating slide cache index: {str(e)}")
+
+        # Nothing to evict while the indexed total fits
+        if total_bytes is None or total_bytes > self.max_bytes:
+            self.evict()
+        return True
+
+    def _entries(self) -> List[Dict[str, Any]]:
+        """Scan the store for entries with their size and last use time"""
+        entries = []
+        for shard in self.root.iterdir():
+            if not shard.is_dir() or shard.name.startswith("."):
+                continue
+            for entry_path in shard.iterdir():
+                try:
+                    size = sum(f.stat().st_size for f in entry_path.iterdir() if f.is_file())
+                    last_used = (entry_path / LAST_USED_FILENAME).stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                entries.append({"path": entry_path, "bytes": size, "last_used": last_used})
+        return entries
+
+    def evict(self) -> int:
+        """
+        Remove least recently used entries until the store fits max_bytes
+
+        Returns:
+            Number of entries evicted
+        """
+        if self.redis is not None:
+            try:
+                return self._evict_indexed()
+            except Exception as e:
+                logger.error(f"Error evicting from slide cache index: {str(e)}")
+        return self._evict_scan()
+
+    def _evict_indexed(self) -> int:
+        """Evict oldest first from the Redis index, without scanning the store"""
+        self._ensure_index()
+        total_bytes = int(self.redis.get(self.bytes_key) or 0)
+        evicted = 0
+
+        while total_bytes > self.max_bytes:
+            oldest = self.redis.zrange(self.index_key, 0, 0)
+            if not oldest:
+                break
+            key = oldest[0].decode()
+            remaining = self._forget(key)
+            if remaining < 0:
+                # Another worker is evicting the same entry
+                total_bytes = int(self.redis.get(self.bytes_key) or 0)
+                continue
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            total_bytes = remaining
+            evicted += 1
+
+        if evicted:
+            self._increment("evictions", evicted)
+            logger.info(f"Evicted {evicted} slide cache entries, {total_bytes} bytes remain")
+        return evicted
+
+    def _evict_scan(self) -> int:
+        """Evict oldest first by scanning the store (no Redis)"""
+        entries = self._entries()
+        total_bytes = sum(entry["bytes"] for entry in entries)
+        evicted = 0
+
+        for entry in sorted(entries, key=lambda e: e["last_used"]):
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry["path"], ignore_errors=True)
+            total_bytes -= entry["bytes"]
+            evicted += 1
+
+        if evicted:
+            self._increment("evictions", evicted)
+            logger.info(f"Evicted {evicted} slide cache entries, {total_bytes} bytes remain")
+        return evicted
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters and current store size
+
+        Returns:
+            Dictionary with cache statistics
+        """
+        counters = dict(self._local_stats)
+        entry_count = total_bytes = None
+        if self.redis is not None:
+            try:
+                shared = self.redis.hgetall(self.stats_key)
+                counters = {name: int(shared.get(name.encode(), 0)) for name in counters}
+                self._ensure_index()
+                entry_count = self.redis.zcard(self.index_key)
+                total_bytes = int(self.redis.get(self.bytes_key) or 0)
+            except Exception as e:
+                logger.error(f"Error reading slide cache stats: {str(e)}")
+
+        if entry_count is None:
+            entries = self._entries()
+            entry_count = len(entries)
+            total_bytes = sum(entry["bytes"] for entry in entries)
+
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+            "entries": entry_count,
+            "total_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "timestamp": time.time()
+        }